@@ -0,0 +1,225 @@
+# Benchmark cases
+#
+# Every case prepares its input from a synthetic frame and returns the function that is timed.
+# Cases mirror the hot paths of Data_Cleaning.ipynb, sentiment_backend.ipynb and the dashboard.
+import os
+
+from benchmarks.synthetic import COUNTRIES, STOP_WORDS
+
+
+# Raised by a setup when a case cannot run here (missing model or package)
+class BenchmarkSkipped(Exception):
+    pass
+
+
+# Data_Cleaning.ipynb
+
+def setup_clean_tweet_column(df, options):
+    from cleaning import clean_tweet_column
+    return lambda: clean_tweet_column(df, 'tweet')
+
+
+def setup_remove_stopwords(df, options):
+    from cleaning import remove_stopwords
+    texts = df['tweet_cleaned'].fillna('').astype(str).tolist()
+    return lambda: [remove_stopwords(text, STOP_WORDS) for text in texts]
+
+
+def setup_remove_stopwords_column(df, options):
+    from cleaning import remove_stopwords_column
+    return lambda: remove_stopwords_column(df['tweet_cleaned'], STOP_WORDS)
+
+
+def setup_match_country_from_location(df, options):
+    from cleaning import transliterate_string
+    from country_matcher import CountryMatcher
+
+    # Locations are matched after transliteration and lowercasing, as in clean_chunk()
+    locations = df['user_location'].apply(transliterate_string).str.lower().str.strip()
+    return lambda: CountryMatcher(COUNTRIES).match_series(locations)
+
+
+def setup_detect_language(df, options):
+    from language_id import detect_languages, load_model
+
+    if options['language_model'] is None:
+        raise BenchmarkSkipped('no --language-model given')
+    try:
+        model = load_model(options['language_model'])
+    except ImportError:
+        raise BenchmarkSkipped('fasttext is not installed')
+    return lambda: detect_languages(df['tweet_cleaned'], model, workers=options['workers'] or 1)
+
+
+# sentiment_backend.ipynb
+
+def setup_find_near_duplicates(df, options):
+    from near_duplicates import find_near_duplicates
+    return lambda: find_near_duplicates(df['tweet_cleaned'], workers=options['workers'], groups=df['candidate'])
+
+
+def setup_get_polarity(df, options):
+    from polarity import score_polarity
+    return lambda: score_polarity(df['tweet_cleaned'], workers=options['workers'])
+
+
+def setup_generate_wordcloud(df, options):
+    from wordcloud import WordCloud
+    from wordcloud_cache import RENDER_PARAMS
+    from word_frequencies import WordFrequencies
+
+    # Count the words of every group, then render the cloud of one slice
+    def run():
+        frequencies = WordFrequencies.from_words(df).query(candidate='trump', sentiment='positive')
+        WordCloud(**RENDER_PARAMS).generate_from_frequencies(dict(zip(frequencies['Word'], frequencies['Frequency'])))
+    return run
+
+
+def setup_count_emojis(df, options):
+    from emoji_counts import count_emojis
+    return lambda: count_emojis(df, workers=options['workers'])
+
+
+def setup_engagement_stats(df, options):
+    from engagement_stats import EngagementStats
+    return lambda: EngagementStats.from_frame(df, workers=options['workers'])
+
+
+# visualization.py
+
+def setup_load_data(df, options):
+    from snapshot import read_snapshot, write_snapshot
+
+    path = os.path.join(options['work_dir'], 'twitter_sentiment.parquet')
+    write_snapshot(df, path)
+    columns = ['created_at', 'day', 'candidate', 'state', 'country', 'sentiment', 'likes', 'retweet_count', 'polarity']
+    return lambda: read_snapshot(path, columns=columns)
+
+
+def setup_load_date_range(df, options):
+    from snapshot import read_partitions, write_partitions
+
+    path = os.path.join(options['work_dir'], 'twitter_sentiment_partitions')
+    write_partitions(df, path)
+    return lambda: read_partitions(path, start='2020-10-20', end='2020-10-26', candidates=['biden', 'trump'],
+                                   columns=['created_at', 'candidate', 'polarity'])
+
+
+def setup_open_shared_store(df, options):
+    from data_server import SharedArrowStore, select_tweets, to_frame
+
+    # Build the tweet table once, then time what a new dashboard process does: map it and query a date range
+    store = SharedArrowStore(os.path.join(options['work_dir'], 'shared_store'))
+    store.clear()
+    store.table('tweets', [], lambda: df)
+
+    def run():
+        table = SharedArrowStore(store.store_dir).table('tweets', [], None)
+        to_frame(table)
+        select_tweets(table, start='2020-10-20', end='2020-10-26', candidates=['biden', 'trump'], columns=['created_at', 'candidate'])
+    return run
+
+
+def setup_build_search_index(df, options):
+    from search_index import write_search_index
+
+    path = os.path.join(options['work_dir'], 'search_index')
+    return lambda: write_search_index(df, path)
+
+
+def setup_search(df, options):
+    from search_index import SearchIndex, write_search_index
+
+    path = os.path.join(options['work_dir'], 'search_index')
+    write_search_index(df, path)
+    index = SearchIndex(path)
+
+    # What the search panel computes for a single-word, an AND and an OR query
+    def run():
+        for query in ['love', 'rally usa', 'florida OR #maga']:
+            rows = index.search(query, candidates=['biden', 'trump'], start='2020-10-20', end='2020-11-03')
+            index.candidate_counts(rows)
+            index.daily_polarity(rows)
+            index.sample(rows)
+    return run
+
+
+def setup_build_metrics_cube(df, options):
+    from metrics_cube import build_metrics_cube
+    return lambda: build_metrics_cube(df)
+
+
+def setup_tab_aggregations(df, options):
+    from metrics_api import daily_series, polarity_difference
+    from metrics_cube import (
+        build_metrics_cube, daily_polarity_means, daily_tweet_counts, engagement_totals, sentiment_counts, state_tweet_counts
+    )
+
+    cube = build_metrics_cube(df)
+
+    # Roll-ups of every dashboard tab
+    def run():
+        daily_tweet_counts(cube)
+        engagement_totals(cube)
+        state_tweet_counts(cube)
+        for candidate in ['biden', 'trump']:
+            sentiment_counts(cube, candidate)
+            daily_polarity_means(cube, candidate)
+        polarity_difference(daily_series(cube, candidates=['biden', 'trump']), 'biden', 'trump')
+    return run
+
+
+def setup_build_timeseries(df, options):
+    from timeseries import build_timeseries
+    return lambda: build_timeseries(df)
+
+
+def setup_timeseries_query(df, options):
+    from timeseries import build_timeseries, choose_resolution, query_series
+
+    series = build_timeseries(df)
+
+    # What the volume and polarity charts compute for the whole period and for one day
+    def run():
+        for start, end in [(series['time'].min(), series['time'].max()), ('2020-11-03', '2020-11-04')]:
+            resolution = choose_resolution(start, end)
+            for candidate in ['biden', 'trump']:
+                query_series(series, candidate, 'tweets', resolution, start, end)
+                query_series(series, candidate, 'polarity', resolution, start, end)
+    return run
+
+
+# Benchmark cases: synthetic frame ('raw' Kaggle schema or 'sentiment' frame), columns read and setup
+BENCHMARKS = {
+    'clean_tweet_column': {'frame': 'raw', 'columns': ['tweet'], 'setup': setup_clean_tweet_column},
+    'remove_stopwords': {'frame': 'sentiment', 'columns': ['tweet_cleaned'], 'setup': setup_remove_stopwords},
+    'remove_stopwords_column': {'frame': 'sentiment', 'columns': ['tweet_cleaned'], 'setup': setup_remove_stopwords_column},
+    'match_country_from_location': {'frame': 'raw', 'columns': ['user_location'], 'setup': setup_match_country_from_location},
+    'detect_language': {'frame': 'sentiment', 'columns': ['tweet_cleaned'], 'setup': setup_detect_language},
+    'find_near_duplicates': {'frame': 'sentiment', 'columns': ['candidate', 'tweet_cleaned'], 'setup': setup_find_near_duplicates},
+    'get_polarity': {'frame': 'sentiment', 'columns': ['tweet_cleaned'], 'setup': setup_get_polarity},
+    'generate_wordcloud': {'frame': 'sentiment', 'columns': ['created_at', 'candidate', 'sentiment', 'tweet_cleaned'],
+                           'setup': setup_generate_wordcloud},
+    'count_emojis': {'frame': 'sentiment', 'columns': ['created_at', 'candidate', 'tweet'], 'setup': setup_count_emojis},
+    'engagement_stats': {'frame': 'sentiment', 'columns': ['created_at', 'candidate', 'likes', 'retweet_count'],
+                         'setup': setup_engagement_stats},
+    'load_data': {'frame': 'sentiment', 'columns': None, 'setup': setup_load_data},
+    'load_date_range': {'frame': 'sentiment', 'columns': None, 'setup': setup_load_date_range},
+    'open_shared_store': {'frame': 'sentiment', 'columns': ['created_at', 'day', 'candidate', 'state', 'country', 'sentiment',
+                                                            'likes', 'retweet_count', 'polarity'],
+                          'setup': setup_open_shared_store},
+    'build_search_index': {'frame': 'sentiment', 'columns': ['created_at', 'candidate', 'sentiment', 'polarity', 'tweet',
+                                                             'tweet_cleaned', 'hashtag'],
+                           'setup': setup_build_search_index},
+    'search': {'frame': 'sentiment', 'columns': ['created_at', 'candidate', 'sentiment', 'polarity', 'tweet', 'tweet_cleaned',
+                                                 'hashtag'],
+               'setup': setup_search},
+    'build_metrics_cube': {'frame': 'sentiment', 'columns': ['created_at', 'candidate', 'state', 'country', 'sentiment',
+                                                             'likes', 'retweet_count', 'polarity'],
+                           'setup': setup_build_metrics_cube},
+    'tab_aggregations': {'frame': 'sentiment', 'columns': ['created_at', 'candidate', 'state', 'country', 'sentiment',
+                                                           'likes', 'retweet_count', 'polarity'],
+                         'setup': setup_tab_aggregations},
+    'build_timeseries': {'frame': 'sentiment', 'columns': ['created_at', 'candidate', 'polarity'], 'setup': setup_build_timeseries},
+    'timeseries_query': {'frame': 'sentiment', 'columns': ['created_at', 'candidate', 'polarity'], 'setup': setup_timeseries_query},
+}
@@ -0,0 +1,201 @@
+# Benchmark runner
+#
+# Runs every case of benchmarks/cases.py on synthetic frames of the requested sizes and prints
+# the results as JSON (rows/sec and peak RSS per case and size). Each case runs in its own
+# process so its peak RSS is not inflated by the cases before it. Synthetic frames are
+# generated once per (kind, rows, seed) by the parent process, before any case runs, and
+# reused from the data directory, so the case processes only read them.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.run --rows 10k 1M 10M [--case get_polarity] [--output results.json] [--history history.jsonl]
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.cases import BENCHMARKS, BenchmarkSkipped
+from benchmarks.synthetic import raw_tweets, sentiment_tweets
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+DEFAULT_ROWS = ['10k']
+
+FRAMES = {'raw': raw_tweets, 'sentiment': sentiment_tweets}
+
+SUFFIXES = {'k': 1_000, 'm': 1_000_000}
+
+
+# Parse a row count such as '10000', '10k' or '1M'
+def parse_rows(value):
+    suffix = value[-1].lower()
+    if suffix in SUFFIXES:
+        return int(float(value[:-1]) * SUFFIXES[suffix])
+    return int(value)
+
+
+# Path of a synthetic frame
+def synthetic_frame_path(kind, rows, seed, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f'{kind}_{rows}_{seed}.parquet')
+
+
+# Generate and write a synthetic frame unless it was written before
+def ensure_synthetic_frame(kind, rows, seed, data_dir=DATA_DIR):
+    path = synthetic_frame_path(kind, rows, seed, data_dir)
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        FRAMES[kind](rows, seed).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    return path
+
+
+# Current resident set size in bytes
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return peak_rss()
+
+
+# Peak resident set size in bytes of this process and of its finished child processes (ru_maxrss is in KiB on Linux)
+def peak_rss():
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+
+
+# Run one case in this process
+def run_case(name, rows, seed, repeat, options):
+    case = BENCHMARKS[name]
+    df = pd.read_parquet(synthetic_frame_path(case['frame'], rows, seed, options['data_dir']), columns=case['columns'])
+
+    work_dir = tempfile.mkdtemp(prefix='benchmark_')
+    try:
+        try:
+            run = case['setup'](df, {**options, 'work_dir': work_dir})
+        except BenchmarkSkipped as skipped:
+            return {'case': name, 'rows': rows, 'skipped': str(skipped)}
+
+        baseline_rss = current_rss()
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            seconds.append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    best = min(seconds)
+    return {
+        'case': name,
+        'rows': rows,
+        'seconds': [round(value, 6) for value in seconds],
+        'rows_per_sec': round(rows / best, 1) if best > 0 else None,
+        'baseline_rss_bytes': baseline_rss,
+        'peak_rss_bytes': max(peak_rss(), current_rss()),
+    }
+
+
+# Run one case in a fresh process and return its result
+def run_case_process(name, rows, seed, repeat, options):
+    command = [sys.executable, '-m', 'benchmarks.run', '--worker', name, '--rows', str(rows), '--seed', str(seed),
+               '--repeat', str(repeat), '--data-dir', options['data_dir']]
+    if options['workers'] is not None:
+        command += ['--workers', str(options['workers'])]
+    if options['language_model'] is not None:
+        command += ['--language-model', options['language_model']]
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run(command, cwd=root, stdout=subprocess.PIPE, text=True)
+    if completed.returncode != 0:
+        return {'case': name, 'rows': rows, 'error': f'exit status {completed.returncode}'}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+# Commit of the working tree, if it is a git checkout
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Run the cases on every size and collect the results with the environment they ran in
+def run_benchmarks(cases, sizes, seed=0, repeat=1, options=None, log=print):
+    options = {'data_dir': DATA_DIR, 'workers': None, 'language_model': None, **(options or {})}
+
+    # Generate the frames here, so no case process spends memory on generating its input
+    for rows in sizes:
+        for kind in sorted({BENCHMARKS[name]['frame'] for name in cases}):
+            log(f'{kind} frame ({rows} rows)...')
+            ensure_synthetic_frame(kind, rows, seed, options['data_dir'])
+
+    results = []
+    for rows in sizes:
+        for name in cases:
+            log(f'{name} ({rows} rows)...')
+            result = run_case_process(name, rows, seed, repeat, options)
+            log(f"  {result.get('rows_per_sec') or result.get('skipped') or result.get('error')}")
+            results.append(result)
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'repeat': repeat,
+        'workers': options['workers'],
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths on synthetic tweet corpora.')
+    parser.add_argument('--rows', nargs='+', default=DEFAULT_ROWS, help="frame sizes, such as 10k 1M 10M")
+    parser.add_argument('--case', action='append', choices=list(BENCHMARKS), help='run only this case')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic frames')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case (the best one gives rows/sec)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes of the parallel cases')
+    parser.add_argument('--language-model', default=None, help='fastText model for the detect_language case')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='directory of the generated synthetic frames')
+    parser.add_argument('--output', default=None, help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--history', default=None, help='append the JSON results as one line to this file')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    options = {'data_dir': args.data_dir, 'workers': args.workers, 'language_model': args.language_model}
+
+    # Worker process: run a single case and print its result
+    if args.worker is not None:
+        print(json.dumps(run_case(args.worker, parse_rows(args.rows[0]), args.seed, args.repeat, options)))
+        return
+
+    report = run_benchmarks(args.case or list(BENCHMARKS), [parse_rows(rows) for rows in args.rows], args.seed,
+                            args.repeat, options, log=lambda message: print(message, file=sys.stderr))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+    if args.history is not None:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(report) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# Seeded synthetic tweet corpus
+#
+# Generates frames with the schema of the Kaggle "US Election 2020 Tweets" CSVs (and of the
+# sentiment frame written by the backend) at any size. Tweets are assembled from random word,
+# hashtag, mention, URL and emoji fragments, and locations mix clean city/country names with
+# the messy free text found in user_location. The same seed always gives the same frame.
+import numpy as np
+import pandas as pd
+
+# Columns of hashtag_donaldtrump.csv and hashtag_joebiden.csv
+RAW_COLUMNS = ['created_at', 'tweet_id', 'tweet', 'likes', 'retweet_count', 'source', 'user_id', 'user_name',
+               'user_screen_name', 'user_description', 'user_join_date', 'user_followers_count', 'user_location',
+               'lat', 'long', 'city', 'country', 'continent', 'state', 'state_code', 'collected_at']
+
+START_DATE = pd.Timestamp('2020-10-15')
+END_DATE = pd.Timestamp('2020-11-08 23:59:59')
+
+# Number of distinct fragments tweets are assembled from
+FRAGMENT_POOL_SIZE = 20_000
+
+# Share of rows duplicating an earlier tweet (same tweet_id, tweet and created_at)
+DUPLICATE_RATE = 0.01
+
+WORDS = [
+    'vote', 'election', 'president', 'america', 'people', 'debate', 'ballot', 'poll', 'state', 'country',
+    'campaign', 'rally', 'media', 'news', 'today', 'tonight', 'win', 'lose', 'count', 'mail',
+    'great', 'good', 'best', 'happy', 'love', 'amazing', 'proud', 'strong', 'safe', 'honest',
+    'bad', 'worst', 'sad', 'terrible', 'corrupt', 'fake', 'angry', 'weak', 'crazy', 'dangerous',
+    'the', 'and', 'is', 'a', 'to', 'of', 'in', 'for', 'this', 'that', 'we', 'you', 'they', 'not',
+    'Trump', 'Biden', 'Harris', 'Pence', 'GOP', 'Democrats', 'Republicans', 'USA', 'Florida', 'Pennsylvania',
+    'élection', 'día', 'président', 'votação', 'Wahl', 'naïve', 'café', 'señor',
+    'LOL', 'OMG', 'WOW', '!!!', '???', '...', "can't", "don't", "it's", '2020',
+]
+HASHTAGS = ['#Trump', '#Biden', '#Election2020', '#MAGA', '#BidenHarris2020', '#Vote', '#Trump2020', '#JoeBiden',
+            '#DonaldTrump', '#KamalaHarris', '#VoteBlue', '#USElection', '#COVID19', '#Debates2020', '#Elecciones2020']
+MENTIONS = ['@realDonaldTrump', '@JoeBiden', '@KamalaHarris', '@Mike_Pence', '@CNN', '@FoxNews', '@user']
+EMOJIS = ['😂', '🤣', '😡', '👍', '👍🏽', '🙏🏿', '❤️', '❤', '🇺🇸', '🇲🇽', '🔥', '💙', '🤡', '👏🏻', '🗳️',
+          '👨‍👩‍👧', '🤦‍♂️', '1️⃣', '#️⃣', '🐍', '💯', '😷', '🌊']
+
+SOURCES = ['Twitter for iPhone', 'Twitter for Android', 'Twitter Web App', 'Twitter for iPad', 'TweetDeck', 'Hootsuite Inc.']
+
+# (user_location, city, country, continent, state, state_code); geocoded rows have a country
+LOCATIONS = [
+    ('Portland, OR', 'Portland', 'United States of America', 'North America', 'Oregon', 'OR'),
+    ('New York, USA', 'New York', 'United States of America', 'North America', 'New York', 'NY'),
+    ('Los Angeles, CA', 'Los Angeles', 'United States of America', 'North America', 'California', 'CA'),
+    ('Houston TX', 'Houston', 'United States of America', 'North America', 'Texas', 'TX'),
+    ('Miami, Florida 🌴', 'Miami', 'United States of America', 'North America', 'Florida', 'FL'),
+    ('Toronto, Canada', 'Toronto', 'Canada', 'North America', 'Ontario', None),
+    ('London, England', 'London', 'United Kingdom', 'Europe', 'England', None),
+    ('Amsterdam', 'Amsterdam', 'The Netherlands', 'Europe', 'North Holland', None),
+    ('São Paulo, Brasil', 'São Paulo', 'Brazil', 'South America', 'São Paulo', None),
+    ('Mumbai, India', 'Mumbai', 'India', 'Asia', 'Maharashtra', None),
+    ('USA', None, None, None, None, None),
+    ('United States of America', None, None, None, None, None),
+    ('somewhere in the U.S.A.', None, None, None, None, None),
+    ('  lagos nigeria ', None, None, None, None, None),
+    ('NYC 🗽', None, None, None, None, None),
+    ('Berlin, Deutschland', None, None, None, None, None),
+    ('Paris, FRANCE', None, None, None, None, None),
+    ('México', None, None, None, None, None),
+    ('Earth 🌍', None, None, None, None, None),
+    ('she/her | #Resist', None, None, None, None, None),
+    ('', None, None, None, None, None),
+    (None, None, None, None, None, None),
+]
+
+# Known countries and stop words used by the benchmarks (instead of Countries_list.xlsx and NLTK)
+COUNTRIES = ['United States', 'Canada', 'United Kingdom', 'Netherlands', 'Brazil', 'India', 'Nigeria', 'Germany',
+             'France', 'Mexico', 'Australia', 'Spain', 'Italy', 'Japan', 'South Africa']
+STOP_WORDS = {'the', 'and', 'is', 'a', 'to', 'of', 'in', 'for', 'this', 'that', 'we', 'you', 'they', 'not', 'it',
+              'on', 'with', 'as', 'are', 'be', 'at', 'by', 'was', 'an', 'or', 'i', 'me', 'my', 'our', 'so'}
+
+
+# Pool of text fragments of 1 to max_words words, hashtags and mentions
+def _fragments(rng, size, max_words):
+    tokens = np.array(WORDS + HASHTAGS + MENTIONS, dtype=object)
+    weights = np.array([6.0] * len(WORDS) + [2.0] * len(HASHTAGS) + [1.0] * len(MENTIONS))
+    weights /= weights.sum()
+
+    lengths = rng.integers(1, max_words + 1, size)
+    picks = rng.choice(tokens, lengths.sum(), p=weights)
+    ends = np.cumsum(lengths)
+    return [' '.join(picks[end - length:end]) for end, length in zip(ends.tolist(), lengths.tolist())]
+
+
+# Pool of tweet endings: nothing, URLs, emojis, hashtags and line breaks
+def _endings(rng, size):
+    endings = []
+    for kind in rng.integers(0, 6, size).tolist():
+        if kind == 0:
+            endings.append('')
+        elif kind == 1:
+            endings.append(f' https://t.co/{rng.integers(16**9, 16**10):x}')
+        elif kind == 2:
+            endings.append(f'\nwww.example{rng.integers(0, 100)}.com/{rng.integers(0, 10**6)}')
+        elif kind == 3:
+            endings.append(' ' + ''.join(rng.choice(EMOJIS, rng.integers(1, 5))))
+        elif kind == 4:
+            endings.append(' ' + ' '.join(rng.choice(HASHTAGS, rng.integers(1, 4))))
+        else:
+            endings.append(' ' + rng.choice(EMOJIS) + '\n' + rng.choice(HASHTAGS))
+    return endings
+
+
+# Random timestamps between start and end, as 'YYYY-MM-DD HH:MM:SS' strings
+def _timestamps(rng, size, start, end):
+    seconds = rng.integers(0, int((end - start).total_seconds()), size)
+    return (start + pd.to_timedelta(seconds, unit='s')).astype(str)
+
+
+# Raw tweets with the Kaggle schema
+def raw_tweets(rows, seed=0):
+    rng = np.random.default_rng(seed)
+
+    # Assemble the tweets from two fragments and an ending, each drawn from a pool
+    heads = np.array(_fragments(rng, FRAGMENT_POOL_SIZE, 8), dtype=object)
+    tails = np.array(_fragments(rng, FRAGMENT_POOL_SIZE, 12), dtype=object)
+    endings = np.array(_endings(rng, FRAGMENT_POOL_SIZE // 10), dtype=object)
+    tweets = (pd.Series(heads[rng.integers(0, len(heads), rows)]) + ' '
+              + pd.Series(tails[rng.integers(0, len(tails), rows)])
+              + pd.Series(endings[rng.integers(0, len(endings), rows)]))
+
+    locations = pd.DataFrame(LOCATIONS, columns=['user_location', 'city', 'country', 'continent', 'state', 'state_code'])
+    locations = locations.iloc[rng.integers(0, len(locations), rows)].reset_index(drop=True)
+
+    # Vary the case of the free-text locations
+    upper = rng.random(rows) < 0.1
+    locations.loc[upper, 'user_location'] = locations.loc[upper, 'user_location'].str.upper()
+
+    geocoded = locations['country'].notna().to_numpy()
+    df = pd.DataFrame({
+        'created_at': _timestamps(rng, rows, START_DATE, END_DATE),
+        'tweet_id': rng.integers(10**18, 2 * 10**18, rows).astype(float),
+        'tweet': tweets,
+        'likes': np.floor(rng.pareto(1.2, rows)).astype(float),
+        'retweet_count': np.floor(rng.pareto(1.5, rows)).astype(float),
+        'source': pd.Series(rng.choice(SOURCES, rows)).where(rng.random(rows) > 0.01),
+        'user_id': rng.integers(10**6, 10**18, rows).astype(float),
+        'user_name': 'user',
+        'user_screen_name': 'user',
+        'user_description': pd.Series(np.array(_fragments(rng, 1000, 10), dtype=object)[rng.integers(0, 1000, rows)]),
+        'user_join_date': _timestamps(rng, rows, pd.Timestamp('2007-01-01'), START_DATE),
+        'user_followers_count': np.floor(rng.pareto(0.8, rows)).clip(max=1e8).astype(float),
+        'user_location': locations['user_location'],
+        'lat': np.where(geocoded, rng.uniform(-60, 70, rows), np.nan),
+        'long': np.where(geocoded, rng.uniform(-180, 180, rows), np.nan),
+        'city': locations['city'],
+        'country': locations['country'],
+        'continent': locations['continent'],
+        'state': locations['state'],
+        'state_code': locations['state_code'],
+        'collected_at': _timestamps(rng, rows, END_DATE, END_DATE + pd.Timedelta(days=3)),
+    })
+
+    # Duplicate a few tweets, as in the Kaggle files
+    duplicates = np.flatnonzero(rng.random(rows) < DUPLICATE_RATE)
+    originals = rng.integers(0, rows, len(duplicates))
+    for column in ['tweet_id', 'tweet', 'created_at']:
+        df.loc[duplicates, column] = df[column].to_numpy()[originals]
+
+    return df[RAW_COLUMNS]
+
+
+# Tweets with the columns of the sentiment frame (twitter_sentiment.csv), with the compact schema
+def sentiment_tweets(rows, seed=0):
+    from cleaning import clean_tweet_column
+    from polarity import label_sentiment
+    from schema import apply_schema
+
+    rng = np.random.default_rng(seed + 1)
+    raw = raw_tweets(rows, seed)
+
+    # Polarity values cluster on a few lexicon-like values, with many neutral tweets
+    polarity = np.round(rng.uniform(-1, 1, rows), 2)
+    polarity[rng.random(rows) < 0.35] = 0.0
+
+    df = pd.DataFrame({
+        'created_at': raw['created_at'],
+        'tweet_id': raw['tweet_id'].astype('int64'),
+        'tweet': raw['tweet'],
+        'likes': raw['likes'].astype('int64'),
+        'retweet_count': raw['retweet_count'].astype('int64'),
+        'source': raw['source'].fillna(SOURCES[0]),
+        'user_id': raw['user_id'].astype('int64'),
+        'user_join_date': raw['user_join_date'],
+        'user_followers_count': raw['user_followers_count'].astype('int64'),
+        'user_location': raw['user_location'].str.lower().fillna('unknown'),
+        'city': raw['city'].str.lower().fillna('unknown'),
+        'state': raw['state'].fillna('unknown'),
+        'candidate': rng.choice(['trump', 'biden'], rows),
+        'tweet_cleaned': clean_tweet_column(raw, 'tweet'),
+        'country': raw['country'].str.lower().replace({'united states of america': 'united states'}).fillna('unknown'),
+        'hashtag': raw['tweet'].str.findall(r'(#\w+)').str.join(', '),
+        'polarity': polarity,
+        'sentiment': label_sentiment(polarity),
+    })
+    return apply_schema(df)
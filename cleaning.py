@@ -0,0 +1,343 @@
+# Cleaning functions and the streaming cleaning pipeline
+#
+# The functions are the cleaning steps of Data_Cleaning.ipynb. stream_clean() applies them to
+# fixed-size row chunks of the raw candidate CSVs and appends each chunk to the output CSV, so
+# the raw files are never held in memory at once.
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+
+from country_matcher import CountryMatcher
+from instrumentation import timed
+from tokens import TokenTable
+
+# Raw candidate CSVs, in the order they were concatenated by the notebook
+RAW_FILES = {
+    'trump': 'hashtag_donaldtrump.csv',
+    'biden': 'hashtag_joebiden.csv',
+}
+
+# Relevant columns ("user_name", "user_screen_name", "user_description" are dropped)
+RELEVANT_COLUMNS = ['created_at', 'tweet_id', 'tweet', 'likes', 'retweet_count', 'source',
+                    'user_id', 'user_join_date', 'user_followers_count', 'user_location', 'city', 'country', 'state']
+
+# Columns identifying a duplicated tweet
+DUPLICATE_KEY_COLUMNS = ['tweet_id', 'tweet', 'created_at']
+
+DATETIME_COLUMNS = ['created_at', 'user_join_date']
+INT_COLUMNS = ['likes', 'retweet_count', 'user_followers_count', 'tweet_id', 'user_id']
+TEXT_COLUMNS = ['source', 'user_location', 'city', 'state', 'country']
+LOCATION_COLUMNS = ['user_location', 'city', 'state', 'country', 'country_filled']
+
+# Columns of a cleaned chunk, before language filtering and stop word removal
+CLEANED_CHUNK_COLUMNS = RELEVANT_COLUMNS + ['candidate', 'tweet_cleaned', 'country_filled']
+
+# Columns of the cleaned output
+OUTPUT_COLUMNS = ['created_at', 'tweet_id', 'tweet', 'likes', 'retweet_count', 'source', 'user_id', 'user_join_date',
+                  'user_followers_count', 'user_location', 'city', 'state', 'candidate', 'tweet_cleaned', 'country']
+
+# Mapping to standardize country names
+COUNTRY_MAPPING = {
+    'united states of america': 'united states',
+    'the netherlands': 'netherlands'
+    }
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Tweet cleaning in one regex pass: URLs and unwanted symbols (keeping letters, numbers, hashtags and spaces)
+TWEET_PATTERN = r'http[s]?://\S+|www\.\S+|[^a-zA-Z0-9# ]'
+
+# Unwanted symbols of the text columns (keeping letters and spaces)
+TEXT_PATTERN = r'[^a-zA-Z ]'
+
+
+# Function to convert selected columns to int
+def convert_columns_to_int(df, columns):
+    for column in columns:
+        df[column] = pd.to_numeric(df[column], errors='coerce').astype('int64')
+    return df
+
+
+# Clean a series of tweets: lowercase, strip, newlines to spaces, then URLs and symbols removed together
+def _clean_tweets(tweets):
+    tweets = tweets.str.lower().str.strip().str.replace('\n', ' ', regex=False)
+    return tweets.str.replace(TWEET_PATTERN, '', regex=True)
+
+
+# Function to clean the tweet column, optionally in row chunks across a process pool
+@timed()
+def clean_tweet_column(df, tweet_column, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    tweets = df[tweet_column]
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, -(-len(tweets) // chunk_size)))
+
+    # Single worker: clean in this process
+    if workers == 1:
+        return _clean_tweets(tweets)
+
+    chunks = (tweets.iloc[start:start + chunk_size] for start in range(0, len(tweets), chunk_size))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return pd.concat(list(executor.map(_clean_tweets, chunks)))
+
+
+# Apply a column function to the distinct values of a column only and map the results back to every row
+def map_distinct(values, func):
+    # Missing values are kept among the distinct values so func sees them like a full-column pass would
+    codes, uniques = values.factorize(use_na_sentinel=False)
+    mapped = func(pd.Series(uniques, dtype=values.dtype))
+    return mapped.take(codes).set_axis(values.index).rename(values.name)
+
+
+# Function to transliterate strings (substitute 'different' characters to normal ones)
+def transliterate_string(input_string):
+    if isinstance(input_string, str):
+        # Use unidecode to replace accented characters
+        return unidecode(input_string)
+    return input_string  # Return as-is if not a string
+
+
+# Transliterate a whole column, running unidecode once per distinct value
+def transliterate_column(values):
+    return map_distinct(values, lambda uniques: uniques.apply(transliterate_string))
+
+
+# Lowercase, strip and remove unwanted symbols (keeping letters and spaces)
+def _clean_text(values):
+    return values.str.lower().str.strip().str.replace(TEXT_PATTERN, '', regex=True)
+
+
+# Ensure all text columns are lowercase for consistent NLP analysis.
+def clean_and_convert_text_columns(df, text_columns):
+    # Clean every distinct value of each column once
+    for column in text_columns:
+        df[column] = map_distinct(df[column], _clean_text)
+
+    return df
+
+
+# Full normalization of the user locations: transliterate, clean and standardize the United States
+def _normalize_user_locations(locations):
+    locations = _clean_text(locations.apply(transliterate_string).astype(locations.dtype))
+    locations = locations.str.replace('usa', 'united states', regex=False)
+    return locations.str.replace('united states of america', 'united states', regex=False)
+
+
+# Full normalization of the country names: clean and standardize
+def _normalize_countries(countries):
+    return _clean_text(countries).replace(COUNTRY_MAPPING)
+
+
+# Function to remove stop words from a text
+def remove_stopwords(text, stop_words):
+    # Split the text into words by spaces, filter out stop words, and rejoin
+    filtered_words = [word for word in text.split() if word not in stop_words]
+    return ' '.join(filtered_words)
+
+
+# Remove stop words from a whole text column, filtering interned token ids in one vectorized pass
+@timed()
+def remove_stopwords_column(texts, stop_words):
+    return TokenTable.from_texts(texts).remove(stop_words).to_strings()
+
+
+# Read a raw candidate CSV in chunks
+def _read_raw_chunks(path, chunk_size, usecols=None):
+    # Key columns are read as strings so their digests are stable across chunks, and text columns so a
+    # chunk where one is entirely missing still has string values
+    return pd.read_csv(path, lineterminator='\n', chunksize=chunk_size, usecols=usecols,
+                       dtype={column: str for column in DUPLICATE_KEY_COLUMNS + TEXT_COLUMNS})
+
+
+# 64-bit digests of the duplicate key columns
+def _duplicate_digests(chunk):
+    return pd.util.hash_pandas_object(chunk[DUPLICATE_KEY_COLUMNS], index=False).to_numpy()
+
+
+# First pass: find duplicated rows across every file and the most frequent source of the kept rows
+def _scan_raw_files(raw_files, chunk_size):
+    digests = []
+    source_codes = []
+    source_values = {}
+
+    for path in raw_files.values():
+        for chunk in _read_raw_chunks(path, chunk_size, usecols=DUPLICATE_KEY_COLUMNS + ['source']):
+            digests.append(_duplicate_digests(chunk))
+
+            # Encode the cleaned source of every row with a shared dictionary
+            source = clean_and_convert_text_columns(chunk[['source']].copy(), ['source'])['source']
+            codes = np.array([source_values.setdefault(value, len(source_values)) if isinstance(value, str) else -1
+                              for value in source], dtype=np.int32)
+            source_codes.append(codes)
+
+    digests = np.concatenate(digests) if digests else np.empty(0, dtype=np.uint64)
+    source_codes = np.concatenate(source_codes) if source_codes else np.empty(0, dtype=np.int32)
+
+    # Rows whose digest appears more than once are dropped (keep=False)
+    _, inverse, counts = np.unique(digests, return_inverse=True, return_counts=True)
+    keep = counts[inverse] == 1
+
+    # Mode of the cleaned source over the kept rows, ties broken like Series.mode()
+    kept_codes = source_codes[keep & (source_codes >= 0)]
+    source_mode = None
+    if len(kept_codes):
+        frequencies = np.bincount(kept_codes, minlength=len(source_values))
+        names = np.array(list(source_values), dtype=object)
+        source_mode = min(names[frequencies == frequencies.max()])
+
+    return keep, source_mode
+
+
+# Clean one chunk of kept rows
+@timed()
+def clean_chunk(chunk, candidate, source_mode, country_matcher):
+    # Create a column 'candidate' to differentiate tweets of each candidate
+    chunk = chunk[RELEVANT_COLUMNS].copy()
+    chunk['candidate'] = candidate
+
+    # Ensure data consistency
+    chunk[DATETIME_COLUMNS] = chunk[DATETIME_COLUMNS].apply(pd.to_datetime, errors='coerce')
+    chunk = convert_columns_to_int(chunk, INT_COLUMNS)
+
+    # Clean the tweets
+    chunk['tweet_cleaned'] = clean_tweet_column(chunk, 'tweet')
+
+    # Clean and standardize the text columns, one pass over the distinct values of each column
+    chunk['user_location'] = map_distinct(chunk['user_location'], _normalize_user_locations)
+    chunk['country'] = map_distinct(chunk['country'], _normalize_countries)
+    chunk = clean_and_convert_text_columns(chunk, [column for column in TEXT_COLUMNS
+                                                   if column not in ('user_location', 'country')])
+
+    # Handle missing values
+    chunk['source'] = chunk['source'].fillna(source_mode)
+
+    missing_country = chunk['country'].isna()
+    chunk['country_filled'] = chunk['country']
+    chunk.loc[missing_country, 'country_filled'] = country_matcher.match_series(chunk.loc[missing_country, 'user_location'])
+    chunk['country_filled'] = map_distinct(chunk['country_filled'], lambda values: values.str.lower().str.strip())
+
+    chunk[LOCATION_COLUMNS] = chunk[LOCATION_COLUMNS].fillna('unknown')
+
+    return chunk
+
+
+# Filter English tweets, remove stop words and finalize the columns of one chunk (language_workers=None uses every CPU)
+@timed()
+def finalize_chunk(chunk, stop_words, language_model=None, language_workers=1):
+    # Filter only tweets in english language
+    if language_model is not None:
+        from language_id import detect_languages
+        languages = detect_languages(chunk['tweet_cleaned'], language_model, workers=language_workers or os.cpu_count() or 1)
+        chunk = chunk[languages == 'en']
+
+    chunk = chunk.copy()
+    chunk['tweet_cleaned'] = remove_stopwords_column(chunk['tweet_cleaned'], stop_words)
+
+    # Replace the original country column by the filled one
+    chunk = chunk.drop(columns='country').rename(columns={'country_filled': 'country'})
+
+    return chunk
+
+
+# Country matcher of a worker process, built once by _init_clean_worker
+_worker_country_matcher = None
+
+
+def _init_clean_worker(known_countries):
+    global _worker_country_matcher
+    _worker_country_matcher = CountryMatcher(known_countries)
+
+
+# Clean one chunk in a worker process
+def _clean_chunk_task(chunk, candidate, source_mode):
+    return clean_chunk(chunk, candidate, source_mode, _worker_country_matcher)
+
+
+# Kept rows of the raw candidate CSVs, chunk by chunk, with their candidate
+def _iter_kept_chunks(raw_files, keep, chunk_size):
+    position = 0
+    for candidate, path in raw_files.items():
+        for chunk in _read_raw_chunks(path, chunk_size):
+            chunk_keep = keep[position:position + len(chunk)]
+            position += len(chunk)
+
+            chunk = chunk[chunk_keep]
+            if chunk.empty:
+                continue
+
+            yield chunk, candidate
+
+
+# Clean the kept rows of the raw candidate CSVs chunk by chunk (before language filtering and stop word removal)
+#
+# With several workers the chunks are cleaned across a process pool. At most two chunks per
+# worker are in flight, and the chunks are yielded in file order.
+def iter_clean_chunks(known_countries, raw_files=RAW_FILES, chunk_size=DEFAULT_CHUNK_SIZE, workers=None):
+    keep, source_mode = _scan_raw_files(raw_files, chunk_size)
+    chunks = _iter_kept_chunks(raw_files, keep, chunk_size)
+    workers = workers or os.cpu_count() or 1
+
+    # Single worker: clean in this process
+    if workers == 1:
+        country_matcher = CountryMatcher(known_countries)
+        for chunk, candidate in chunks:
+            yield clean_chunk(chunk, candidate, source_mode, country_matcher)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_clean_worker,
+                             initargs=(list(known_countries),)) as executor:
+        pending = deque()
+        for chunk, candidate in chunks:
+            pending.append(executor.submit(_clean_chunk_task, chunk, candidate, source_mode))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+# Write chunks to a CSV one after the other, returning the number of rows written
+def write_csv_chunks(chunks, output_path, columns):
+    # Write to a temporary file so a failed run never leaves a truncated output behind
+    tmp_path = f'{output_path}.tmp'
+    header = True
+    rows_written = 0
+
+    for chunk in chunks:
+        chunk.to_csv(tmp_path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+        rows_written += len(chunk)
+
+    if header:
+        # No rows were kept: still write the header
+        pd.DataFrame(columns=columns).to_csv(tmp_path, index=False)
+
+    os.replace(tmp_path, output_path)
+    return rows_written
+
+
+# Read a CSV written chunk by chunk from iter_clean_chunks, with the cleaned tweets as iter_clean_chunks yields them
+def _read_cleaned_chunks(path, chunk_size):
+    for chunk in pd.read_csv(path, lineterminator='\n', chunksize=chunk_size, dtype={'tweet': str, 'tweet_cleaned': str}):
+        # An empty cleaned tweet is read back as missing: it is '' unless the tweet itself is missing
+        chunk['tweet_cleaned'] = chunk['tweet_cleaned'].fillna('').where(chunk['tweet'].notna())
+        yield chunk
+
+
+# Filter English tweets and remove stop words from a CSV written chunk by chunk from iter_clean_chunks
+def finalize_csv(input_path, output_path, stop_words, language_model=None, chunk_size=DEFAULT_CHUNK_SIZE, language_workers=1):
+    chunks = _read_cleaned_chunks(input_path, chunk_size)
+    return write_csv_chunks((finalize_chunk(chunk, stop_words, language_model, language_workers) for chunk in chunks),
+                            output_path, OUTPUT_COLUMNS)
+
+
+# Streaming cleaning pipeline: raw candidate CSVs in, cleaned CSV appended chunk by chunk
+@timed()
+def stream_clean(output_path, known_countries, stop_words, raw_files=RAW_FILES, language_model=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, workers=None, language_workers=1):
+    chunks = iter_clean_chunks(known_countries, raw_files, chunk_size, workers)
+    return write_csv_chunks((finalize_chunk(chunk, stop_words, language_model, language_workers) for chunk in chunks),
+                            output_path, OUTPUT_COLUMNS)
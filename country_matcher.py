@@ -0,0 +1,81 @@
+# Multi-pattern country matcher for user_location
+#
+# An Aho-Corasick automaton over the lowercased country names finds every country contained
+# in a location in a single pass over the string. As in the original loop, the first country
+# in list order wins. Each distinct location is resolved once and broadcast back to the rows.
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+
+class CountryMatcher:
+    def __init__(self, known_countries):
+        # Country names that are not strings can never match
+        self.countries = [country for country in known_countries if isinstance(country, str)]
+
+        # Automaton states: goto transitions, failure links and the best (lowest) country index matched
+        self.goto = [{}]
+        self.fail = [0]
+        self.best = [len(self.countries)]
+
+        for index, country in enumerate(self.countries):
+            self._add_pattern(country.lower(), index)
+        self._build_failure_links()
+
+    # Add one pattern to the trie
+    def _add_pattern(self, pattern, index):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.best.append(len(self.countries))
+                self.goto[state][char] = next_state
+            state = next_state
+        self.best[state] = min(self.best[state], index)
+
+    # Compute failure links breadth-first and propagate the best match along them
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(char, 0)
+                self.best[next_state] = min(self.best[next_state], self.best[self.fail[next_state]])
+                queue.append(next_state)
+
+    # Match the first country in list order contained in a location
+    def match(self, location):
+        if pd.isna(location):
+            return None
+
+        goto, fail, best = self.goto, self.fail, self.best
+        state = 0
+        found = best[0]  # An empty country name matches every location
+        for char in location.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if best[state] < found:
+                found = best[state]
+                if found == 0:
+                    break
+
+        return self.countries[found] if found < len(self.countries) else None
+
+    # Match every location, resolving each distinct value only once
+    @timed()
+    def match_series(self, locations):
+        locations = pd.Series(locations)
+        codes, unique_locations = pd.factorize(locations)
+
+        matches = np.array([self.match(location) for location in unique_locations] + [None], dtype=object)
+        return pd.Series(matches[codes], index=locations.index)
@@ -0,0 +1,199 @@
+# Shared-memory Arrow store of the dashboard data
+#
+# Every Streamlit server process used to parse its own copy of the dataset and the aggregates, and
+# every st.cache_data hit copied them again. The store converts each of them once per host to an
+# uncompressed Arrow IPC file in shared memory (/dev/shm), and every process memory-maps the same
+# file. Tables are read without copying, numeric and categorical columns are converted to pandas
+# without copying, and filters run on the mapped buffers, so only query results are materialized
+# per session.
+#
+# A table is rebuilt when the files it was built from change (size and modification time). The
+# first process to need a stale table builds it under a file lock while the others wait for it.
+#
+# Set the TWITTER_STORE_DIR environment variable to choose the store directory.
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from instrumentation import timed
+from schema import MISSING_DAY, date_to_day, day_to_date
+
+# Schema metadata key of the fingerprint of the files a table was built from
+FINGERPRINT_KEY = b'twitter_store_fingerprint'
+
+LOCK_FILE = '.lock'
+
+
+# Store directory of a data directory: one per data directory, in shared memory when available
+def default_store_dir(data_dir='.'):
+    if os.environ.get('TWITTER_STORE_DIR'):
+        return os.environ['TWITTER_STORE_DIR']
+    root = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    key = hashlib.sha256(os.path.abspath(data_dir).encode()).hexdigest()[:12]
+    return os.path.join(root, f'twitter_dashboard_{key}')
+
+
+# Fingerprint of the files a table is built from (missing files included)
+def source_fingerprint(paths):
+    sources = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            sources.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+        except FileNotFoundError:
+            sources.append([os.path.abspath(path), None, None])
+    return json.dumps(sources)
+
+
+# Write a table as an uncompressed Arrow IPC file, replacing the previous one atomically
+def write_arrow(table, path):
+    tmp_path = f'{path}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+# Memory-map an Arrow IPC file (the table's buffers point into the mapping)
+def read_arrow(path):
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+class SharedArrowStore:
+    def __init__(self, store_dir=None):
+        self.store_dir = store_dir or default_store_dir()
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    # Exclusive lock of the store across processes
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.store_dir, LOCK_FILE), 'w') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def path(self, name):
+        return os.path.join(self.store_dir, f'{name}.arrow')
+
+    # Mapped table if it was built from the same files, None otherwise
+    def _open(self, name, fingerprint):
+        path = self.path(name)
+        if not os.path.exists(path):
+            return None
+        table = read_arrow(path)
+        metadata = table.schema.metadata or {}
+        return table if metadata.get(FINGERPRINT_KEY) == fingerprint.encode() else None
+
+    # Table name, built by build() (returning a DataFrame or a Table) unless it is up to date with the source files
+    @timed()
+    def table(self, name, sources, build):
+        fingerprint = source_fingerprint(sources)
+        table = self._open(name, fingerprint)
+        if table is not None:
+            return table
+
+        with self._lock():
+            # Another process may have built it while this one waited for the lock
+            table = self._open(name, fingerprint)
+            if table is None:
+                table = build()
+                if isinstance(table, pd.DataFrame):
+                    table = pa.Table.from_pandas(table, preserve_index=False)
+                metadata = {**(table.schema.metadata or {}), FINGERPRINT_KEY: fingerprint.encode()}
+                write_arrow(table.replace_schema_metadata(metadata).combine_chunks(), self.path(name))
+                table = self._open(name, fingerprint)
+        return table
+
+    # Remove every table of the store
+    def clear(self):
+        with self._lock():
+            for file_name in os.listdir(self.store_dir):
+                if file_name.endswith('.arrow'):
+                    os.remove(os.path.join(self.store_dir, file_name))
+
+
+# Dictionary column as a categorical whose codes are a view of the dictionary indices
+def _categorical(column):
+    chunk = column.chunk(0)
+    return pd.Categorical.from_codes(chunk.indices.to_numpy(zero_copy_only=True), categories=chunk.dictionary.to_pandas(),
+                                     ordered=column.type.ordered, validate=False)
+
+
+# Convert a mapped table to pandas; numeric and dictionary columns without missing values stay views of the mapping
+def to_frame(table, columns=None):
+    if columns is not None:
+        table = table.select(list(columns))
+
+    shared = {name for name, column in zip(table.column_names, table.columns)
+              if pa.types.is_dictionary(column.type) and column.num_chunks == 1 and column.null_count == 0}
+    frame = table.drop_columns(list(shared)).to_pandas(split_blocks=True)
+    return pd.DataFrame({name: _categorical(table[name]) if name in shared else frame[name] for name in table.column_names},
+                        copy=False)
+
+
+# Mask of the rows of a column whose value is one of values; dictionary columns are matched on their indices
+# instead of decoding every row
+def _is_in(column, values):
+    if not pa.types.is_dictionary(column.type):
+        return pc.is_in(column, value_set=pa.array(list(values), type=column.type))
+
+    masks = []
+    for chunk in column.chunks:
+        matching = pc.is_in(chunk.dictionary, value_set=pa.array(list(values), type=chunk.dictionary.type))
+        codes = pa.array(np.flatnonzero(matching.to_numpy(zero_copy_only=False)), type=chunk.indices.type)
+        masks.append(pc.is_in(chunk.indices, value_set=codes))
+    return pa.chunked_array(masks, type=pa.bool_())
+
+
+# Rows of a tweet table within a date range (inclusive, on the 'day' key) and a list of candidates
+@timed()
+def select_tweets(table, start=None, end=None, candidates=None, columns=None):
+    mask = None
+
+    # Combine the conditions into one boolean mask evaluated on the mapped buffers
+    def add(condition):
+        nonlocal mask
+        mask = condition if mask is None else pc.and_(mask, condition)
+
+    if start is not None:
+        add(pc.greater_equal(table['day'], date_to_day(start)))
+    if end is not None:
+        add(pc.less_equal(table['day'], date_to_day(end)))
+    if candidates is not None:
+        add(_is_in(table['candidate'], candidates))
+
+    # Only the requested columns are filtered (copied)
+    if columns is not None:
+        table = table.select(list(columns))
+    return to_frame(table if mask is None else table.filter(mask))
+
+
+# Range of the day keys of a tweet table, as dates (None for an empty table)
+def date_bounds(table):
+    days = table['day'].to_numpy()
+    days = days[days != MISSING_DAY]
+    if not len(days):
+        return None
+    return day_to_date(days.min()).date(), day_to_date(days.max()).date()
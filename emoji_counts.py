@@ -0,0 +1,203 @@
+# Emoji counting engine
+#
+# A compiled regex finds the runs of emoji characters in each tweet, and a trie over every
+# sequence in emoji.EMOJI_DATA splits each distinct run into whole emoji sequences (flags, ZWJ
+# sequences, skin tones, keycaps), longest first. Tweets of every candidate are counted in
+# chunks across a process pool into per-(date, candidate) counts, so the top emojis of any
+# candidate and date range are a small groupby away.
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import emoji
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+EMOJI_COUNTS_FILE = 'emoji_counts.parquet'
+
+COUNT_KEYS = ['date', 'candidate', 'emoji']
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+# Largest gap between emoji code points bridged by the run pattern
+RUN_GAP = 256
+
+# Trie, run pattern and canonical forms, built once per process
+_trie = None
+_run_pattern = None
+_canonical = None
+
+
+# Trie of every emoji sequence; the '' key marks the end of a sequence
+def emoji_trie():
+    global _trie
+    if _trie is None:
+        _trie = {}
+        for sequence in emoji.EMOJI_DATA:
+            node = _trie
+            for char in sequence:
+                node = node.setdefault(char, {})
+            node[''] = {}
+    return _trie
+
+
+# Compiled regex matching runs of characters that can be part of an emoji sequence
+def run_pattern():
+    global _run_pattern
+    if _run_pattern is None:
+        code_points = sorted({ord(char) for sequence in emoji.EMOJI_DATA for char in sequence if not char.isascii()})
+
+        # Merge the code points into a few ranges, bridging small gaps so the character class stays
+        # short (split_run skips the extra characters)
+        ranges = [[code_points[0], code_points[0]]]
+        for code_point in code_points[1:]:
+            if code_point - ranges[-1][1] <= RUN_GAP:
+                ranges[-1][1] = code_point
+            else:
+                ranges.append([code_point, code_point])
+        char_class = ''.join(f'{re.escape(chr(first))}-{re.escape(chr(last))}' for first, last in ranges)
+
+        # Keycap emojis start with '#', '*' or a digit
+        _run_pattern = re.compile(f'[#*0-9]?[{char_class}]+')
+    return _run_pattern
+
+
+# Split a run into emoji sequences, taking the longest sequence at every position
+def split_run(run):
+    trie = emoji_trie()
+    emojis = []
+    start = 0
+    while start < len(run):
+        node = trie
+        end = None
+        position = start
+        while position < len(run) and run[position] in node:
+            node = node[run[position]]
+            position += 1
+            if '' in node:
+                end = position
+
+        if end is None:
+            start += 1  # A modifier or joiner that is not part of an emoji
+        else:
+            emojis.append(run[start:end])
+            start = end
+    return emojis
+
+
+# Emoji sequences of a text
+def find_emojis(text):
+    return [found for run in run_pattern().findall(text) for found in split_run(run)]
+
+
+# Map every emoji sequence to its fully-qualified form, so '❤' and '❤️' are counted together
+def canonical_emojis():
+    global _canonical
+    if _canonical is None:
+        fully_qualified = {data['en']: sequence for sequence, data in emoji.EMOJI_DATA.items()
+                           if data['status'] == emoji.STATUS['fully_qualified']}
+        _canonical = {sequence: fully_qualified.get(data['en'], sequence) for sequence, data in emoji.EMOJI_DATA.items()}
+    return _canonical
+
+
+# Count the emojis of one chunk with 'date', 'candidate' and 'tweet' columns
+def _count_chunk(chunk):
+    grouper = chunk.groupby(['date', 'candidate'], sort=False)
+    group_of_row = grouper.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    groups = grouper.size().index
+
+    # Find the runs of emoji characters of every tweet with the compiled regex (ASCII-only tweets have none)
+    findall = run_pattern().findall
+    runs_per_row = [findall(text) if isinstance(text, str) and not text.isascii() else [] for text in chunk['tweet'].tolist()]
+    run_lengths = np.fromiter(map(len, runs_per_row), dtype=np.int64, count=len(runs_per_row))
+    run_codes, unique_runs = pd.factorize(np.array([run for runs in runs_per_row for run in runs], dtype=object))
+
+    # Count every distinct (group, run) pair, then split each distinct run into emojis only once
+    group_of_run = np.repeat(group_of_row, run_lengths)
+    counted = group_of_run >= 0  # Rows without a date are not counted
+    pairs, pair_counts = np.unique(group_of_run[counted] * len(unique_runs) + run_codes[counted], return_counts=True)
+
+    canonical = canonical_emojis()
+    split_runs = [[canonical[found] for found in split_run(run)] for run in unique_runs]
+
+    counts = {}
+    for pair, pair_count in zip(pairs.tolist(), pair_counts.tolist()):
+        group, run = divmod(pair, len(unique_runs))
+        for found in split_runs[run]:
+            key = (group, found)
+            counts[key] = counts.get(key, 0) + pair_count
+
+    group_codes = np.array([group for group, _ in counts], dtype=np.int64)
+    return pd.DataFrame({
+        'date': groups.get_level_values('date')[group_codes],
+        'candidate': groups.get_level_values('candidate')[group_codes],
+        'emoji': [found for _, found in counts],
+        'count': np.array(list(counts.values()), dtype=np.int64),
+    })
+
+
+# Split a frame into consecutive row chunks
+def _chunks(df, chunk_size):
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+# Count the emojis of every tweet per (date, candidate), returning 'date', 'candidate', 'emoji' and 'count'
+@timed()
+def count_emojis(df, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    tweets = pd.DataFrame({
+        'date': pd.to_datetime(df['created_at'], errors='coerce').dt.normalize(),
+        'candidate': df['candidate'].astype(str),
+        'tweet': df['tweet'],
+    })
+
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, -(-len(tweets) // chunk_size)))
+
+    # Single worker: count in this process
+    if workers == 1:
+        counts = [_count_chunk(chunk) for chunk in _chunks(tweets, chunk_size)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = list(executor.map(_count_chunk, _chunks(tweets, chunk_size)))
+
+    return merge_emoji_counts(counts if counts else [_count_chunk(tweets)])
+
+
+# Merge emoji counts (e.g. of successive batches of tweets), adding up the counts of equal keys
+def merge_emoji_counts(counts):
+    counts = pd.concat(counts, ignore_index=True)
+    counts = counts.groupby(COUNT_KEYS, sort=True)['count'].sum().reset_index()
+    counts['count'] = counts['count'].astype('int64')
+    return counts
+
+
+# Top n emojis (all when n is None) of a candidate over a date range, as a DataFrame with 'Emoji' and 'Frequency' columns
+def top_emojis(counts, candidate, start=None, end=None, n=10):
+    mask = counts['candidate'] == candidate
+    if start is not None:
+        mask &= counts['date'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= counts['date'] <= pd.Timestamp(end)
+
+    frequency = counts[mask].groupby('emoji')['count'].sum().sort_values(ascending=False, kind='stable')
+    return pd.DataFrame({'Emoji': frequency.index[:n], 'Frequency': frequency.to_numpy()[:n]})
+
+
+# Write the emoji counts to disk
+def write_emoji_counts(counts, path=EMOJI_COUNTS_FILE):
+    tmp_path = f'{path}.tmp'
+    counts.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+# Read the emoji counts from disk
+def read_emoji_counts(path=EMOJI_COUNTS_FILE):
+    return pd.read_parquet(path)
+
+
+# Check if the emoji counts have been written
+def emoji_counts_exists(path=EMOJI_COUNTS_FILE):
+    return os.path.exists(path)
@@ -0,0 +1,323 @@
+# Engagement statistics from mergeable sketches
+#
+# Likes and retweets are summarized per (date, candidate) in one pass over each chunk of tweets:
+#   - a log-bucketed quantile sketch (DDSketch): every value is counted in the bucket
+#     (gamma^(k-1), gamma^k], so any quantile is known within RELATIVE_ACCURACY of its value;
+#   - the running moments: count, mean, the sums of the 2nd to 4th powers of the deviations
+#     from the mean (m2, m3, m4), min, max and whether every value is an integer.
+# Chunks are summarized across a process pool and merged, sketches by adding the bucket counts and
+# moments with the pairwise update formulas of Pébay (2008), so the quantiles, IQR outlier
+# thresholds, skewness and kurtosis of any candidate and date range are computed from the small
+# summary tables instead of the tweet rows.
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+ENGAGEMENT_SKETCH_FILE = 'engagement_sketch.parquet'
+ENGAGEMENT_MOMENTS_FILE = 'engagement_moments.parquet'
+
+GROUP_KEYS = ['date', 'candidate']
+MEASURES = ['likes', 'retweet_count']
+
+SKETCH_KEYS = [*GROUP_KEYS, 'measure', 'bucket']
+MOMENT_KEYS = [*GROUP_KEYS, 'measure']
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Relative error of the quantiles given by the sketch
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+# Values closer to 0 than MIN_VALUE are counted in the zero bucket (0); the bucket of any other value
+# is offset so positive values have positive buckets and negative values negative ones
+MIN_VALUE = 1e-9
+BUCKET_OFFSET = math.ceil(-math.log(MIN_VALUE) / LOG_GAMMA) + 1
+
+# Quantiles shown by default
+DEFAULT_QUANTILES = (0.25, 0.5, 0.75, 0.9, 0.99)
+
+# IQR factor of the outlier thresholds (Q1 - factor * IQR, Q3 + factor * IQR)
+DEFAULT_IQR_FACTOR = 3
+
+
+# Sketch bucket of every value (buckets increase with the values)
+def bucket_keys(values):
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.abs(values)
+    keys = np.zeros(len(values), dtype=np.int32)
+
+    indexed = magnitude >= MIN_VALUE
+    exponent = np.ceil(np.log(magnitude[indexed]) / LOG_GAMMA) + BUCKET_OFFSET
+    keys[indexed] = (np.sign(values[indexed]) * exponent).astype(np.int32)
+    return keys
+
+
+# Value represented by every bucket, within RELATIVE_ACCURACY of any value counted in it
+def bucket_values(keys):
+    keys = np.asarray(keys, dtype=np.int64)
+    magnitude = 2 * GAMMA ** (np.abs(keys) - BUCKET_OFFSET).astype(np.float64) / (GAMMA + 1)
+    return np.where(keys == 0, 0.0, np.sign(keys) * magnitude)
+
+
+# Sketch and moments of one chunk with 'date', 'candidate' and the MEASURES columns
+def _summarize_chunk(chunk):
+    grouper = chunk.groupby(GROUP_KEYS, sort=False)
+    group_of_row = grouper.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    groups = grouper.size().index.to_frame(index=False)
+
+    sketches = []
+    moments = []
+    for measure in MEASURES:
+        values = pd.to_numeric(chunk[measure], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+        # Rows without a date or a value are not counted
+        counted = (group_of_row >= 0) & ~np.isnan(values)
+        group = group_of_row[counted]
+        values = values[counted]
+
+        # Bucket counts of every group
+        buckets = pd.DataFrame({'group': group, 'bucket': bucket_keys(values)})
+        buckets = buckets.groupby(['group', 'bucket']).size().reset_index(name='count')
+        sketch = groups.iloc[buckets['group']].reset_index(drop=True)
+        sketch['measure'] = measure
+        sketch['bucket'] = buckets['bucket'].to_numpy(dtype=np.int32)
+        sketch['count'] = buckets['count'].to_numpy(dtype=np.int64)
+        sketches.append(sketch)
+
+        # Moments of every group, from the deviations of each value from its group mean
+        count = np.bincount(group, minlength=len(groups))
+        mean = np.bincount(group, weights=values, minlength=len(groups)) / np.maximum(count, 1)
+        deviation = values - mean[group]
+        minimum = np.full(len(groups), np.inf)
+        maximum = np.full(len(groups), -np.inf)
+        np.minimum.at(minimum, group, values)
+        np.maximum.at(maximum, group, values)
+
+        present = count > 0
+        group_moments = groups[present].reset_index(drop=True)
+        group_moments['measure'] = measure
+        group_moments['count'] = count[present]
+        group_moments['mean'] = mean[present]
+        for power in (2, 3, 4):
+            group_moments[f'm{power}'] = np.bincount(group, weights=deviation ** power, minlength=len(groups))[present]
+        group_moments['min'] = minimum[present]
+        group_moments['max'] = maximum[present]
+        group_moments['integer'] = np.bincount(group, weights=values != np.round(values), minlength=len(groups))[present] == 0
+        moments.append(group_moments)
+
+    return pd.concat(sketches, ignore_index=True), pd.concat(moments, ignore_index=True)
+
+
+# Add up the bucket counts of several sketches
+def merge_sketches(sketches, keys=SKETCH_KEYS):
+    sketch = pd.concat(sketches, ignore_index=True) if isinstance(sketches, (list, tuple)) else sketches
+    sketch = sketch.groupby(list(keys), sort=True, observed=True)['count'].sum().reset_index()
+    sketch['count'] = sketch['count'].astype('int64')
+    return sketch
+
+
+# Combine the moments of several parts per key (Pébay): the deviation sums of every part are shifted
+# from the part mean to the combined mean before they are added up
+def merge_moments(moments, keys=MOMENT_KEYS):
+    moments = pd.concat(moments, ignore_index=True) if isinstance(moments, (list, tuple)) else moments
+    keys = list(keys)
+
+    count = moments.groupby(keys, sort=False, observed=True)['count'].transform('sum')
+    weighted = moments['count'] * moments['mean']
+    combined_mean = weighted.groupby([moments[key] for key in keys], sort=False, observed=True).transform('sum') / count
+    delta = moments['mean'] - combined_mean
+
+    parts = moments[keys].copy()
+    parts['count'] = moments['count']
+    parts['weighted'] = weighted
+    parts['m2'] = moments['m2'] + moments['count'] * delta ** 2
+    parts['m3'] = moments['m3'] + 3 * delta * moments['m2'] + moments['count'] * delta ** 3
+    parts['m4'] = (moments['m4'] + 4 * delta * moments['m3'] + 6 * delta ** 2 * moments['m2']
+                   + moments['count'] * delta ** 4)
+    parts['min'] = moments['min']
+    parts['max'] = moments['max']
+    parts['integer'] = moments['integer']
+
+    merged = parts.groupby(keys, sort=True, observed=True).agg(
+        count=('count', 'sum'), weighted=('weighted', 'sum'), m2=('m2', 'sum'), m3=('m3', 'sum'), m4=('m4', 'sum'),
+        min=('min', 'min'), max=('max', 'max'), integer=('integer', 'all'),
+    ).reset_index()
+    merged.insert(len(keys) + 1, 'mean', merged.pop('weighted') / merged['count'])
+    merged['count'] = merged['count'].astype('int64')
+    return merged
+
+
+# Standard deviation, skewness and excess kurtosis of merged moments, with the bias corrections of
+# Series.std(), Series.skew() and Series.kurtosis()
+def moment_statistics(moments):
+    n = moments['count'].astype('float64')
+    m2, m3, m4 = moments['m2'], moments['m3'], moments['m4']
+    flat = m2 <= 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.sqrt(m2 / (n - 1))
+        skew = n * np.sqrt(n - 1) / (n - 2) * m3 / m2 ** 1.5
+        kurtosis = n * (n + 1) * (n - 1) * m4 / ((n - 2) * (n - 3) * m2 ** 2) - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+
+    statistics = moments[[column for column in moments if column not in ('m2', 'm3', 'm4')]].copy()
+    statistics['std'] = std.where(n > 1)
+    statistics['skew'] = skew.mask(flat, 0.0).where(n > 2)
+    statistics['kurtosis'] = kurtosis.mask(flat, 0.0).where(n > 3)
+    return statistics
+
+
+# Quantiles per key of a merged sketch, as one column per quantile
+def sketch_quantiles(sketch, q=DEFAULT_QUANTILES, keys=MOMENT_KEYS):
+    keys = list(keys)
+    sketch = sketch.sort_values([*keys, 'bucket'], ignore_index=True)
+    grouper = sketch.groupby(keys, sort=True, observed=True)['count']
+    total = grouper.transform('sum')
+    cumulative = grouper.cumsum()
+
+    quantiles = []
+    for quantile in q:
+        # Bucket of the value of rank floor(q * (n - 1)) (0-based) of every key
+        rank = np.floor(quantile * (total - 1))
+        first = sketch[cumulative > rank].groupby(keys, sort=True, observed=True)['bucket'].first()
+        quantiles.append(pd.Series(bucket_values(first.to_numpy()), index=first.index, name=quantile))
+    return pd.concat(quantiles, axis=1)
+
+
+# Split a frame into consecutive row chunks
+def _chunks(df, chunk_size):
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+class EngagementStats:
+    def __init__(self, sketch, moments):
+        self.sketch = sketch
+        self.moments = moments
+
+    # Summarize the likes and retweets of every tweet per (date, candidate) in one pass per chunk
+    @classmethod
+    @timed()
+    def from_frame(cls, df, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        tweets = pd.DataFrame({
+            'date': pd.to_datetime(df['created_at'], errors='coerce').dt.normalize(),
+            'candidate': df['candidate'].astype(str),
+            **{measure: df[measure] for measure in MEASURES},
+        })
+
+        workers = workers or os.cpu_count() or 1
+        workers = max(1, min(workers, -(-len(tweets) // chunk_size)))
+
+        # Single worker: summarize in this process
+        if workers == 1:
+            parts = [_summarize_chunk(chunk) for chunk in _chunks(tweets, chunk_size)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parts = list(executor.map(_summarize_chunk, _chunks(tweets, chunk_size)))
+
+        if not parts:
+            parts = [_summarize_chunk(tweets)]
+        return cls.merge([cls(sketch, moments) for sketch, moments in parts])
+
+    # Merge the statistics of several frames or chunks
+    @classmethod
+    def merge(cls, parts):
+        return cls(merge_sketches([part.sketch for part in parts]), merge_moments([part.moments for part in parts]))
+
+    # Boolean mask of the rows of a table matching a measure, candidates and a date range
+    @staticmethod
+    def _mask(table, measure, candidate=None, start=None, end=None):
+        mask = table['measure'] == measure
+        if candidate is not None:
+            mask &= table['candidate'].isin([candidate] if isinstance(candidate, str) else list(candidate))
+        if start is not None:
+            mask &= table['date'] >= pd.Timestamp(start)
+        if end is not None:
+            mask &= table['date'] <= pd.Timestamp(end)
+        return mask
+
+    # Merged sketch and moments of a slice, keyed by `by` (a list of GROUP_KEYS, or None for one total)
+    def _slice(self, measure, by=None, candidate=None, start=None, end=None):
+        sketch = self.sketch[self._mask(self.sketch, measure, candidate, start, end)]
+        moments = self.moments[self._mask(self.moments, measure, candidate, start, end)]
+
+        keys = list(by) if by else ['measure']
+        return merge_sketches(sketch, [*keys, 'bucket']), merge_moments(moments, keys), keys
+
+    # Drop the key index of a one-row result when no grouping was asked for
+    @staticmethod
+    def _result(result, by):
+        if by:
+            return result
+        return result.iloc[0] if len(result) else pd.Series(np.nan, index=result.columns)
+
+    # Count, mean, standard deviation, skewness, excess kurtosis, min and max of a measure
+    def statistics(self, measure, by=None, candidate=None, start=None, end=None):
+        _, moments, keys = self._slice(measure, by, candidate, start, end)
+        statistics = moment_statistics(moments).set_index(keys)
+        return self._result(statistics[['count', 'mean', 'std', 'skew', 'kurtosis', 'min', 'max']], by)
+
+    # Sketch quantiles clipped to the exact min and max, and rounded for integer measures (exact below
+    # 1 / (2 * RELATIVE_ACCURACY), where a bucket never holds two integers)
+    @staticmethod
+    def _bounded_quantiles(sketch, moments, q, keys):
+        quantiles = sketch_quantiles(sketch, q, keys)
+        bounds = moments.set_index(keys).reindex(quantiles.index)
+        quantiles = quantiles.clip(lower=bounds['min'], upper=bounds['max'], axis=0)
+        integer = bounds['integer'].to_numpy(dtype=bool)
+        quantiles[integer] = quantiles[integer].round()
+        return quantiles, bounds
+
+    # Quantiles of a measure, one column per quantile
+    def quantiles(self, measure, q=DEFAULT_QUANTILES, by=None, candidate=None, start=None, end=None):
+        sketch, moments, keys = self._slice(measure, by, candidate, start, end)
+        return self._result(self._bounded_quantiles(sketch, moments, q, keys)[0], by)
+
+    # IQR outlier thresholds of a measure and the estimated number of values outside them
+    def outlier_thresholds(self, measure, factor=DEFAULT_IQR_FACTOR, by=None, candidate=None, start=None, end=None):
+        sketch, moments, keys = self._slice(measure, by, candidate, start, end)
+        quartiles, bounds = self._bounded_quantiles(sketch, moments, (0.25, 0.75), keys)
+
+        thresholds = pd.DataFrame({'q1': quartiles[0.25], 'q3': quartiles[0.75]})
+        thresholds['iqr'] = thresholds['q3'] - thresholds['q1']
+        thresholds['lower'] = thresholds['q1'] - factor * thresholds['iqr']
+        thresholds['upper'] = thresholds['q3'] + factor * thresholds['iqr']
+
+        # Count the values of the buckets outside the thresholds (exact except for the buckets holding a threshold)
+        bucket_index = pd.MultiIndex.from_frame(sketch[keys]) if len(keys) > 1 else pd.Index(sketch[keys[0]])
+        bucket_thresholds = thresholds.reindex(bucket_index)
+        values = bucket_values(sketch['bucket'].to_numpy())
+        values = np.where(bounds['integer'].reindex(bucket_index).to_numpy(dtype=bool), np.round(values), values)
+        outside = (values < bucket_thresholds['lower'].to_numpy()) | (values > bucket_thresholds['upper'].to_numpy())
+        outliers = sketch['count'].where(outside, 0).groupby([sketch[key] for key in keys], sort=True, observed=True).sum()
+        thresholds['outliers'] = outliers.reindex(thresholds.index).fillna(0).astype('int64')
+        thresholds['count'] = bounds['count']
+        return self._result(thresholds, by)
+
+    # Histogram of a measure: the value and count of every sketch bucket
+    def distribution(self, measure, candidate=None, start=None, end=None):
+        sketch, _, _ = self._slice(measure, None, candidate, start, end)
+        return pd.DataFrame({'value': bucket_values(sketch['bucket'].to_numpy()), 'count': sketch['count'].to_numpy()})
+
+
+# Write the sketch and moments tables to disk
+def write_engagement_stats(stats, sketch_path=ENGAGEMENT_SKETCH_FILE, moments_path=ENGAGEMENT_MOMENTS_FILE):
+    for table, path in ((stats.sketch, sketch_path), (stats.moments, moments_path)):
+        tmp_path = f'{path}.tmp'
+        table.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+
+# Read the sketch and moments tables from disk
+def read_engagement_stats(sketch_path=ENGAGEMENT_SKETCH_FILE, moments_path=ENGAGEMENT_MOMENTS_FILE):
+    return EngagementStats(pd.read_parquet(sketch_path), pd.read_parquet(moments_path))
+
+
+# Check if the engagement statistics have been written
+def engagement_stats_exists(sketch_path=ENGAGEMENT_SKETCH_FILE, moments_path=ENGAGEMENT_MOMENTS_FILE):
+    return os.path.exists(sketch_path) and os.path.exists(moments_path)
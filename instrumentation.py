@@ -0,0 +1,337 @@
+# Stage-level timing and memory instrumentation
+#
+# Pipeline steps and dashboard sections are wrapped with the timed() decorator or the stage()
+# context manager. While instrumentation is disabled (the default) they only check a flag. Once
+# enabled, every call records its wall time, rows in and out and memory, and the records can be
+# summarized or exported as JSON or Chrome trace (chrome://tracing, Perfetto) files.
+#
+# The peak memory of a stage is the highest resident set size of the process sampled every
+# RSS_SAMPLE_SECONDS while the stage runs (worker processes are not included). With
+# enable(trace_memory=True), stages also record the peak of their Python allocations; tracemalloc
+# has one process-wide peak, so that figure is left out (None) for stages that overlapped a stage
+# of another thread, such as the concurrent stages of pipeline.py.
+#
+# Set the TWITTER_PROFILE environment variable to 1 to enable it at import time.
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+
+# Most recent stage records kept in memory
+MAX_RECORDS = 100_000
+
+# Interval of the resident set size samples taken while stages run
+RSS_SAMPLE_SECONDS = 0.01
+
+_enabled = os.environ.get('TWITTER_PROFILE', '') not in ('', '0')
+_trace_memory = False
+
+_records = deque(maxlen=MAX_RECORDS)
+_local = threading.local()
+
+# Calls and misses of the counted caches (hits are calls minus misses)
+_cache_calls = Counter()
+_cache_misses = Counter()
+
+# Start of the trace clock
+_origin = time.perf_counter()
+
+# Running stages of every thread, and the thread sampling their resident set size
+_open_stages = set()
+_open_lock = threading.Lock()
+_sampler = None
+
+
+# Turn instrumentation on; trace_memory uses tracemalloc for exact per-stage peaks of Python allocations
+# (left out for stages that overlapped a stage of another thread, as tracemalloc has a single peak)
+def enable(trace_memory=False):
+    global _enabled, _trace_memory
+    _enabled = True
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+# Turn instrumentation off
+def disable():
+    global _enabled, _trace_memory
+    _enabled = False
+    if _trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _trace_memory = False
+
+
+def is_enabled():
+    return _enabled
+
+
+# Drop the recorded stages and cache counts
+def clear():
+    _records.clear()
+    _cache_calls.clear()
+    _cache_misses.clear()
+
+
+# Number of rows of a frame, series, array or list (None for anything else)
+def count_rows(value):
+    if value is None or isinstance(value, (str, bytes, dict, type)):
+        return None
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+# Current resident set size in bytes
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# Peak resident set size of the process in bytes since it started (ru_maxrss is in KiB on Linux)
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+# Raise the sampled peak of every running stage to the current resident set size
+def _sample_rss():
+    rss = current_rss()
+    if rss is None:
+        return
+    with _open_lock:
+        for stage in _open_stages:
+            stage.rss_peak = max(stage.rss_peak or 0, rss)
+
+
+# Sample the resident set size while stages run (daemon thread, started with the first stage)
+def _sample_loop():
+    while True:
+        time.sleep(RSS_SAMPLE_SECONDS)
+        _sample_rss()
+
+
+# Start the sampling thread once
+def _start_sampler():
+    global _sampler
+    with _open_lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name='instrumentation-rss', daemon=True)
+            _sampler.start()
+
+
+class Stage:
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+
+    def __enter__(self):
+        self.stack = getattr(_local, 'stack', None)
+        if self.stack is None:
+            self.stack = _local.stack = []
+        self.depth = len(self.stack)
+        self.stack.append(self)
+
+        self.rss_start = current_rss()
+        self.rss_peak = self.rss_start
+        self.thread = threading.get_ident()
+        self.concurrent = False
+        _start_sampler()
+        with _open_lock:
+            # Stages of other threads running at the same time share the tracemalloc peak with this one
+            for other in _open_stages:
+                if other.thread != self.thread:
+                    other.concurrent = self.concurrent = True
+            _open_stages.add(self)
+
+        self.memory_peak = 0
+        if _trace_memory:
+            # Keep the peak of the enclosing stage reached so far before resetting it
+            self.memory_start, peak = tracemalloc.get_traced_memory()
+            if self.depth:
+                parent = self.stack[-2]
+                parent.memory_peak = max(parent.memory_peak, peak)
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        end = time.perf_counter()
+        self.stack.pop()
+        _sample_rss()
+        with _open_lock:
+            _open_stages.discard(self)
+
+        record = {
+            'name': self.name,
+            'start': self.start - _origin,
+            'seconds': end - self.start,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rss_start_bytes': self.rss_start,
+            'rss_end_bytes': current_rss(),
+            'peak_rss_bytes': self.rss_peak,
+            'thread': self.thread,
+            'depth': self.depth,
+            'failed': exc_type is not None,
+        }
+
+        # Peak of the Python allocations during the stage, including the peaks of nested stages
+        if _trace_memory and tracemalloc.is_tracing():
+            self.memory_peak = max(self.memory_peak, tracemalloc.get_traced_memory()[1])
+            record['peak_traced_bytes'] = None if self.concurrent else self.memory_peak - self.memory_start
+            if self.stack:
+                self.stack[-1].memory_peak = max(self.stack[-1].memory_peak, self.memory_peak)
+
+        _records.append(record)
+        return False
+
+
+class _NoStage:
+    rows_in = None
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+# Context manager recording one stage; set rows_out on the returned object to record the output rows
+def stage(name, rows_in=None):
+    if not _enabled:
+        return _NO_STAGE
+    return Stage(name, rows_in)
+
+
+# Decorator recording every call of a function as a stage (rows in: first sized argument, rows out: the result)
+def timed(name=None):
+    def decorator(func):
+        stage_name = name or (func.__qualname__ if func.__module__ == '__main__' else f'{func.__module__}.{func.__qualname__}')
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            rows_in = next((rows for rows in map(count_rows, args) if rows is not None), None)
+            with Stage(stage_name, rows_in) as record:
+                result = func(*args, **kwargs)
+                record.rows_out = count_rows(result)
+            return result
+
+        return wrapper
+    return decorator
+
+
+# Wrap a caching decorator (st.cache_data, st.cache_resource) so its hits and misses are counted
+def counted_cache(cache, **cache_kwargs):
+    def decorator(func):
+        cache_name = func.__qualname__
+
+        # Only runs on a cache miss
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            _cache_misses[cache_name] += 1
+            return func(*args, **kwargs)
+
+        cached = cache(**cache_kwargs)(compute) if cache_kwargs else cache(compute)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            _cache_calls[cache_name] += 1
+            return cached(*args, **kwargs)
+
+        wrapper.clear = getattr(cached, 'clear', None)
+        return wrapper
+    return decorator
+
+
+# Recorded stages, oldest first
+def records():
+    return list(_records)
+
+
+# Calls, hits and misses of every counted cache
+def cache_stats():
+    return {
+        name: {'calls': calls, 'hits': calls - _cache_misses[name], 'misses': _cache_misses[name]}
+        for name, calls in sorted(_cache_calls.items())
+    }
+
+
+# Totals per stage name: calls, wall time, rows in and out and the largest memory figures
+def summary():
+    import pandas as pd
+
+    columns = ['stage', 'calls', 'total_seconds', 'mean_seconds', 'max_seconds', 'rows_in', 'rows_out', 'max_rss_growth_bytes',
+               'max_peak_rss_growth_bytes']
+    if not _records:
+        return pd.DataFrame(columns=columns)
+
+    df = pd.DataFrame(records())
+    df['rss_growth'] = df['rss_end_bytes'] - df['rss_start_bytes']
+    df['peak_rss_growth'] = df['peak_rss_bytes'] - df['rss_start_bytes']
+    totals = df.groupby('name', sort=False).agg(
+        calls=('seconds', 'size'),
+        total_seconds=('seconds', 'sum'),
+        mean_seconds=('seconds', 'mean'),
+        max_seconds=('seconds', 'max'),
+        rows_in=('rows_in', lambda rows: rows.sum(min_count=1)),
+        rows_out=('rows_out', lambda rows: rows.sum(min_count=1)),
+        max_rss_growth_bytes=('rss_growth', 'max'),
+        max_peak_rss_growth_bytes=('peak_rss_growth', 'max'),
+    )
+    return totals.rename_axis('stage').reset_index().sort_values('total_seconds', ascending=False, ignore_index=True)[columns]
+
+
+# Stage records and cache counts as a JSON document
+def to_json():
+    return {'stages': records(), 'caches': cache_stats()}
+
+
+# Stage records as a Chrome trace (complete events, microseconds)
+def to_chrome_trace():
+    pid = os.getpid()
+    events = []
+    for record in records():
+        args = {key: value for key, value in record.items() if key not in ('name', 'start', 'seconds', 'thread')}
+        events.append({
+            'name': record['name'],
+            'cat': 'stage',
+            'ph': 'X',
+            'ts': round(record['start'] * 1e6, 3),
+            'dur': round(record['seconds'] * 1e6, 3),
+            'pid': pid,
+            'tid': record['thread'],
+            'args': args,
+        })
+    for name, stats in cache_stats().items():
+        events.append({'name': f'cache {name}', 'cat': 'cache', 'ph': 'C', 'ts': 0, 'pid': pid,
+                       'args': {'hits': stats['hits'], 'misses': stats['misses']}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+# Write the records as 'json' or 'chrome' trace
+def write_trace(path, format='json'):
+    trace = to_chrome_trace() if format == 'chrome' else to_json()
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(trace, f, default=str)
+    os.replace(tmp_path, path)
+    return path
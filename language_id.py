@@ -0,0 +1,72 @@
+# Batched fastText language identification
+#
+# fastText's predict() accepts a list of strings, so tweets are predicted in large batches.
+# Worker processes are forked after the model is loaded and share it copy-on-write.
+import multiprocessing as mp
+
+import pandas as pd
+
+from instrumentation import timed
+
+MODEL_FILE = 'lid.176.bin'
+DEFAULT_BATCH_SIZE = 50_000
+
+LABEL_PREFIX = '__label__'
+
+# Model shared with forked worker processes
+_model = None
+
+
+# Load the FastText pre-trained language identification model
+def load_model(path=MODEL_FILE):
+    global _model
+    import fasttext
+    _model = fasttext.load_model(path)
+    return _model
+
+
+# Predict the language code of one batch of texts
+def _predict_batch(texts):
+    labels, _ = _model.predict(texts, k=1)
+    return [label[0][len(LABEL_PREFIX):] if len(label) else 'unknown' for label in labels]
+
+
+# Split a list into consecutive batches
+def _batches(values, batch_size):
+    for start in range(0, len(values), batch_size):
+        yield values[start:start + batch_size]
+
+
+# Detect the language of every text, returned as a Categorical aligned with the input
+@timed()
+def detect_languages(texts, model=None, batch_size=DEFAULT_BATCH_SIZE, workers=1):
+    global _model
+    if model is not None:
+        _model = model
+    if _model is None:
+        load_model()
+
+    texts = pd.Series(texts)
+    missing = texts.isna().to_numpy()
+
+    # fastText predicts one line at a time, so newlines are replaced up front
+    cleaned = texts.fillna('').astype(str).str.replace('\n', ' ', regex=False).str.replace('\r', ' ', regex=False).tolist()
+
+    # Fork after the model is loaded so every worker shares it
+    if workers > 1 and 'fork' in mp.get_all_start_methods():
+        with mp.get_context('fork').Pool(workers) as pool:
+            predictions = pool.imap(_predict_batch, _batches(cleaned, batch_size))
+            languages = [code for batch in predictions for code in batch]
+    else:
+        languages = [code for batch in _batches(cleaned, batch_size) for code in _predict_batch(batch)]
+
+    # Missing texts have no language
+    for i in missing.nonzero()[0]:
+        languages[i] = 'unknown'
+
+    return pd.Categorical(languages)
+
+
+# Boolean mask of the texts detected as the given language
+def language_mask(texts, language='en', **kwargs):
+    return (detect_languages(texts, **kwargs) == language)
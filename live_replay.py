@@ -0,0 +1,471 @@
+# Simulated live stream of the election week
+#
+# The raw candidate CSVs are replayed as one stream of tweets ordered by created_at, at a
+# configurable speed-up of the event time. Every batch_seconds of wall time, the tweets of the
+# next event-time window enter an asyncio pipeline of stages connected by bounded queues:
+#
+#   read -> clean -> language (language filter, stop words) -> polarity -> aggregate
+#
+# The aggregate stage merges every batch into the running metrics cube (daily counts, polarity
+# means, state counts), word and hashtag frequencies and emoji counts, and publishes them to
+# the output directory together with a status file. The dashboard polls the directory.
+#
+# A full queue blocks the stage feeding it, so a slow stage holds the reader back instead of
+# buffering the stream in memory. The status reports the end-to-end lag of every batch (from
+# leaving the reader to being published), the depth of every queue, the time each stage spent
+# blocked on a full queue, and how far the reader is behind the replay schedule.
+#
+# Unlike the static cleaning, which drops every copy of a duplicated row, the stream cannot
+# know future rows: the first copy is kept and later copies are dropped. The missing sources
+# are filled with the most frequent source seen so far.
+#
+# Usage:
+#   python live_replay.py --raw-dir data/raw --countries data/raw/Countries_list.xlsx --output-dir live --speedup 3600
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from cleaning import RAW_FILES, _duplicate_digests, _read_raw_chunks, clean_and_convert_text_columns, clean_chunk, finalize_chunk
+from country_matcher import CountryMatcher
+from emoji_counts import EMOJI_COUNTS_FILE, count_emojis, merge_emoji_counts, write_emoji_counts
+from metrics_cube import CUBE_FILE, build_metrics_cube, merge_metrics_cubes, write_metrics_cube
+from polarity import label_sentiment, score_polarity
+from word_frequencies import HASHTAG_FREQUENCIES_FILE, WORD_FREQUENCIES_FILE, WordFrequencies
+
+LIVE_DIR = 'live'
+STATUS_FILE = 'live_status.json'
+
+# Event seconds replayed per wall second (3600: one hour of tweets per second)
+DEFAULT_SPEEDUP = 3600
+
+# Wall seconds of stream per batch
+DEFAULT_BATCH_SECONDS = 1.0
+
+# Batches waiting between two stages
+DEFAULT_QUEUE_SIZE = 4
+
+# Wall seconds between two publications of the aggregates
+DEFAULT_PUBLISH_SECONDS = 2.0
+
+DEFAULT_CHUNK_SIZE = 20_000
+
+STAGE_NAMES = ['read', 'clean', 'language', 'polarity', 'aggregate']
+
+# Most recent batch lags kept for the lag statistics
+MAX_LAGS = 1_000
+
+
+# Tweets of successive event-time windows of batch_span, merged across the raw files by created_at
+#
+# Yields (window end, list of (raw rows, candidate), rows without a valid created_at). Every file is
+# read ahead until it has passed the end of the window, so rows slightly out of order within a file
+# are still emitted in the right window.
+def iter_event_batches(raw_files=RAW_FILES, batch_span=pd.Timedelta(hours=1), chunk_size=DEFAULT_CHUNK_SIZE):
+    readers = {candidate: iter(_read_raw_chunks(path, chunk_size)) for candidate, path in raw_files.items()}
+    buffers = {candidate: [] for candidate in raw_files}
+    frontier = {candidate: pd.NaT for candidate in raw_files}
+    untimed = 0
+
+    # Read the next chunk of a file into its buffer, returning False once the file is exhausted
+    def read_next(candidate):
+        nonlocal untimed
+        chunk = next(readers[candidate], None)
+        if chunk is None:
+            del readers[candidate]
+            return False
+
+        created_at = pd.to_datetime(chunk['created_at'], errors='coerce')
+        untimed += int(created_at.isna().sum())
+        chunk = chunk[created_at.notna()].assign(_event_time=created_at[created_at.notna()])
+        buffers[candidate].append(chunk)
+        if len(chunk):
+            frontier[candidate] = chunk['_event_time'].max() if pd.isna(frontier[candidate]) else max(
+                frontier[candidate], chunk['_event_time'].max())
+        return True
+
+    # The stream starts at the earliest tweet of the first chunks
+    for candidate in list(readers):
+        read_next(candidate)
+    first_times = [pd.concat(chunks)['_event_time'].min() for chunks in buffers.values() if chunks]
+    first_times = [first_time for first_time in first_times if pd.notna(first_time)]
+    if not first_times:
+        return
+    window_end = min(first_times).floor('s') + batch_span
+
+    while readers or any(buffers.values()):
+        for candidate in list(readers):
+            while candidate in readers and not frontier[candidate] >= window_end:
+                read_next(candidate)
+
+        # Emit the rows of the window, oldest first
+        batch = []
+        for candidate, chunks in buffers.items():
+            if not chunks:
+                continue
+            rows = pd.concat(chunks).sort_values('_event_time', kind='stable')
+            emitted = rows['_event_time'] < window_end
+            if emitted.any():
+                batch.append((rows[emitted].drop(columns='_event_time'), candidate))
+            buffers[candidate] = [rows[~emitted]] if not emitted.all() else []
+
+        if batch or untimed:
+            yield window_end, batch, untimed
+            untimed = 0
+        window_end += batch_span
+
+
+# Running mode of the cleaned source (ties broken like Series.mode())
+def _source_mode(source_counts):
+    if not source_counts:
+        return None
+    top = max(source_counts.values())
+    return min(source for source, count in source_counts.items() if count == top)
+
+
+# One micro-batch flowing through the stages: the rows of one or more event-time windows
+class Batch:
+    def __init__(self, window_end, chunks, rows, emitted_at):
+        self.window_end = window_end
+        self.chunks = chunks
+        self.rows = rows
+        self.emitted_at = emitted_at  # Wall time at which each window left the reader
+
+
+# Merge the batches waiting on a queue into one, so a stage that falls behind catches up with one call
+def _coalesce(batches):
+    if len(batches) == 1:
+        return batches[0]
+    return Batch(batches[-1].window_end, [chunk for batch in batches for chunk in batch.chunks],
+                 sum(batch.rows for batch in batches), [emitted_at for batch in batches for emitted_at in batch.emitted_at])
+
+
+# Every batch waiting on a queue (waiting for the first one), and whether the end of the stream was reached
+async def _take(queue):
+    batches = []
+    batch = await queue.get()
+    while batch is not None:
+        batches.append(batch)
+        if queue.empty():
+            return batches, False
+        batch = queue.get_nowait()
+    return batches, True
+
+
+class LiveReplay:
+    def __init__(self, known_countries, stop_words, raw_files=RAW_FILES, output_dir=LIVE_DIR, speedup=DEFAULT_SPEEDUP,
+                 batch_seconds=DEFAULT_BATCH_SECONDS, queue_size=DEFAULT_QUEUE_SIZE, language_model=None,
+                 publish_seconds=DEFAULT_PUBLISH_SECONDS, chunk_size=DEFAULT_CHUNK_SIZE, language_workers=1):
+        self.country_matcher = CountryMatcher(known_countries)
+        self.stop_words = stop_words
+        self.raw_files = raw_files
+        self.output_dir = output_dir
+        self.speedup = speedup
+        self.batch_seconds = batch_seconds
+        self.queue_size = queue_size
+        self.language_model = language_model
+        self.language_workers = language_workers
+        self.publish_seconds = publish_seconds
+        self.chunk_size = chunk_size
+
+        # Streaming duplicate filter and running source mode
+        self.seen_digests = set()
+        self.source_counts = Counter()
+
+        # Running aggregates
+        self.cube = None
+        self.word_frequencies = None
+        self.hashtag_frequencies = None
+        self.emoji_counts = None
+        self.unpublished = []
+
+        # Observability
+        self.counters = Counter()
+        self.lags = []
+        self.blocked_seconds = dict.fromkeys(STAGE_NAMES, 0.0)
+        self.blocked_puts = dict.fromkeys(STAGE_NAMES, 0)
+        self.stage_calls = dict.fromkeys(STAGE_NAMES[1:], 0)
+        self.behind_seconds = 0.0
+        self.replay_time = None
+        self.started = None
+        self.queues = {}
+
+    # Wall seconds of stream per event-time window
+    @property
+    def batch_span(self):
+        return pd.Timedelta(seconds=self.batch_seconds * (self.speedup if self.speedup > 0 else DEFAULT_SPEEDUP))
+
+    # Put a batch on the queue of the next stage, recording the time spent waiting for room (backpressure)
+    async def _put(self, stage_name, queue, batch):
+        if queue.full():
+            self.blocked_puts[stage_name] += 1
+        start = time.perf_counter()
+        await queue.put(batch)
+        self.blocked_seconds[stage_name] += time.perf_counter() - start
+
+    # Run a CPU-bound step of a stage in a thread so the event loop keeps pacing the stream
+    async def _run(self, stage_name, func, batch):
+        def run():
+            with instrumentation.stage(f'live_replay.{stage_name}', rows_in=batch.rows) as record:
+                result = func(batch)
+                record.rows_out = instrumentation.count_rows(result)
+            return result
+        return await asyncio.to_thread(run)
+
+    # Stage: pace the event-time windows to the replay schedule
+    async def _read(self, output):
+        windows = iter_event_batches(self.raw_files, self.batch_span, self.chunk_size)
+        start_wall = time.perf_counter()
+        first_window_end = None
+
+        while True:
+            window = await asyncio.to_thread(next, windows, None)
+            if window is None:
+                break
+            window_end, chunks, untimed = window
+            self.counters['events_without_time'] += untimed
+            if not chunks:
+                continue
+
+            # Wait until the window has ended on the replay clock (no waiting with a speed-up of 0)
+            first_window_end = first_window_end if first_window_end is not None else window_end
+            if self.speedup > 0:
+                due = start_wall + (window_end - first_window_end).total_seconds() / self.speedup
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.behind_seconds = -delay
+            self.replay_time = window_end
+
+            batch = Batch(window_end, chunks, sum(len(chunk) for chunk, _ in chunks), [time.perf_counter()])
+            self.counters['events_read'] += batch.rows
+            self.counters['windows_read'] += 1
+            await self._put('read', output, batch)
+
+        await output.put(None)
+
+    # Stage: drop duplicates and clean the raw rows of every candidate
+    def _clean(self, batch):
+        raw_chunks = {}
+        for chunk, candidate in batch.chunks:
+            raw_chunks.setdefault(candidate, []).append(chunk)
+
+        cleaned = []
+        for candidate, chunks in raw_chunks.items():
+            chunk = pd.concat(chunks)
+
+            # Keep the first copy of every row (the digests of earlier batches and earlier rows of this one)
+            digests = _duplicate_digests(chunk)
+            keep = ~pd.Series(digests).duplicated().to_numpy()
+            keep &= np.array([digest not in self.seen_digests for digest in digests.tolist()], dtype=bool)
+            self.seen_digests.update(digests[keep].tolist())
+            self.counters['duplicates'] += int((~keep).sum())
+            chunk = chunk[keep]
+            if chunk.empty:
+                continue
+
+            source = clean_and_convert_text_columns(chunk[['source']].copy(), ['source'])['source']
+            self.source_counts.update(source.dropna().tolist())
+            cleaned.append(clean_chunk(chunk, candidate, _source_mode(self.source_counts), self.country_matcher))
+        return cleaned
+
+    # Stage: filter English tweets and remove stop words
+    def _language(self, batch):
+        df = finalize_chunk(pd.concat(batch.chunks, ignore_index=True), self.stop_words, self.language_model,
+                            self.language_workers)
+        return [df] if len(df) else []
+
+    # Stage: score the polarity and extract the hashtags
+    def _polarity(self, batch):
+        df = pd.concat(batch.chunks, ignore_index=True)
+        df['hashtag'] = df['tweet'].str.findall(r'(#\w+)').apply(lambda x: ', '.join(x))
+        df['polarity'] = score_polarity(df['tweet_cleaned'], workers=1)
+        df['sentiment'] = label_sentiment(df['polarity'])
+        return [df]
+
+    # Stage: merge the batch into the running aggregates
+    def _aggregate(self, batch):
+        df = pd.concat(batch.chunks, ignore_index=True)
+        cube = build_metrics_cube(df)
+        word_frequencies = WordFrequencies.from_words(df)
+        hashtag_frequencies = WordFrequencies.from_hashtags(df)
+        emoji_counts = count_emojis(df, workers=1)
+
+        if self.cube is None:
+            self.cube, self.word_frequencies, self.hashtag_frequencies, self.emoji_counts = (
+                cube, word_frequencies, hashtag_frequencies, emoji_counts)
+        else:
+            self.cube = merge_metrics_cubes([self.cube, cube])
+            self.word_frequencies = WordFrequencies.merge([self.word_frequencies, word_frequencies])
+            self.hashtag_frequencies = WordFrequencies.merge([self.hashtag_frequencies, hashtag_frequencies])
+            self.emoji_counts = merge_emoji_counts([self.emoji_counts, emoji_counts])
+        return batch.chunks
+
+    # Take the waiting batches, process them at once and pass the result on (the aggregate stage publishes instead)
+    async def _stage(self, stage_name, func, input, output=None):
+        last_publish = time.perf_counter()
+        finished = False
+        while not finished:
+            batches, finished = await _take(input)
+            if not batches:
+                break
+            batch = _coalesce(batches)
+            self.stage_calls[stage_name] += 1
+
+            batch.chunks = await self._run(stage_name, func, batch)
+            batch.rows = sum(len(chunk) for chunk in batch.chunks)
+            if not batch.chunks:
+                # Every tweet of the batch was dropped (duplicates or other languages)
+                self.counters['windows_dropped'] += len(batch.emitted_at)
+            elif output is not None:
+                await self._put(stage_name, output, batch)
+            else:
+                self.counters['tweets_aggregated'] += batch.rows
+                self.counters['windows_aggregated'] += len(batch.emitted_at)
+                self.unpublished.append(batch)
+
+                if time.perf_counter() - last_publish >= self.publish_seconds:
+                    await asyncio.to_thread(self.publish)
+                    last_publish = time.perf_counter()
+
+        if output is not None:
+            await output.put(None)
+        else:
+            await asyncio.to_thread(self.publish, True)
+
+    # Write the aggregates and the status to the output directory (every file is replaced atomically)
+    def publish(self, finished=False):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.cube is not None:
+            write_metrics_cube(self.cube, os.path.join(self.output_dir, CUBE_FILE))
+            _save_word_frequencies(self.word_frequencies, os.path.join(self.output_dir, WORD_FREQUENCIES_FILE))
+            _save_word_frequencies(self.hashtag_frequencies, os.path.join(self.output_dir, HASHTAG_FREQUENCIES_FILE))
+            write_emoji_counts(self.emoji_counts, os.path.join(self.output_dir, EMOJI_COUNTS_FILE))
+
+        # The batches are visible once published: that is the end of their end-to-end lag
+        now = time.perf_counter()
+        self.lags.extend(now - emitted_at for batch in self.unpublished for emitted_at in batch.emitted_at)
+        self.lags = self.lags[-MAX_LAGS:]
+        self.unpublished = []
+
+        _write_json(self.status(finished), os.path.join(self.output_dir, STATUS_FILE))
+
+    # Progress, lag and backpressure of the replay
+    def status(self, finished=False):
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0.0
+        lags = np.array(self.lags)
+        return {
+            'finished': finished,
+            'updated_at': pd.Timestamp.now().isoformat(),
+            'replay_time': None if self.replay_time is None else self.replay_time.isoformat(),
+            'speedup': self.speedup,
+            'batch_seconds': self.batch_seconds,
+            'elapsed_seconds': elapsed,
+            'events_read': self.counters['events_read'],
+            'events_without_time': self.counters['events_without_time'],
+            'duplicates': self.counters['duplicates'],
+            'tweets_aggregated': self.counters['tweets_aggregated'],
+            'windows_read': self.counters['windows_read'],
+            'windows_aggregated': self.counters['windows_aggregated'],
+            'windows_dropped': self.counters['windows_dropped'],
+            'events_per_second': self.counters['events_read'] / elapsed if elapsed else 0.0,
+            'lag_seconds': {
+                'last': float(lags[-1]) if len(lags) else None,
+                'mean': float(lags.mean()) if len(lags) else None,
+                'p95': float(np.quantile(lags, 0.95)) if len(lags) else None,
+                'max': float(lags.max()) if len(lags) else None,
+            },
+            'behind_schedule_seconds': self.behind_seconds,
+            'queues': {name: {'depth': queue.qsize(), 'maxsize': queue.maxsize} for name, queue in self.queues.items()},
+            'blocked_seconds': self.blocked_seconds,
+            'blocked_puts': self.blocked_puts,
+            'stage_calls': self.stage_calls,
+        }
+
+    # Replay the whole stream
+    async def run_async(self):
+        self.started = time.perf_counter()
+        self.queues = {name: asyncio.Queue(maxsize=self.queue_size) for name in STAGE_NAMES[1:]}
+        queues = self.queues
+        await asyncio.gather(
+            self._read(queues['clean']),
+            self._stage('clean', self._clean, queues['clean'], queues['language']),
+            self._stage('language', self._language, queues['language'], queues['polarity']),
+            self._stage('polarity', self._polarity, queues['polarity'], queues['aggregate']),
+            self._stage('aggregate', self._aggregate, queues['aggregate']),
+        )
+        return self.status(finished=True)
+
+    def run(self):
+        return asyncio.run(self.run_async())
+
+
+# Save a word frequency engine, replacing the previous file atomically
+def _save_word_frequencies(frequencies, path):
+    tmp_path = f'{path[:-len(".npz")]}.tmp.npz'
+    frequencies.save(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_json(document, path):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(document, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+# Read the status written by a replay (None before the first publication)
+def read_status(output_dir=LIVE_DIR):
+    path = os.path.join(output_dir, STATUS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    from pipeline import DEFAULT_CONFIG, load_countries, load_stop_words, raw_files, read_stop_words
+
+    parser = argparse.ArgumentParser(description='Replay the raw candidate CSVs as a live stream and publish running aggregates.')
+    parser.add_argument('--raw-dir', default=DEFAULT_CONFIG['raw_dir'], help='directory of the raw candidate CSVs')
+    parser.add_argument('--countries', default=None, help='countries spreadsheet or CSV (default: Countries_list.xlsx in the raw directory)')
+    parser.add_argument('--language-model', default=None, help='fastText language identification model (no language filtering if omitted)')
+    parser.add_argument('--stop-words', default=None, help='text file of stop words, one per line (default: the NLTK English stop words)')
+    parser.add_argument('--language-workers', type=int, default=1, help='worker processes for language identification')
+    parser.add_argument('--output-dir', default=LIVE_DIR, help='directory of the published aggregates, polled by the dashboard')
+    parser.add_argument('--speedup', type=float, default=DEFAULT_SPEEDUP, help='event seconds replayed per wall second (0: as fast as possible)')
+    parser.add_argument('--batch-seconds', type=float, default=DEFAULT_BATCH_SECONDS, help='wall seconds of stream per micro-batch')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help='batches waiting between two stages')
+    parser.add_argument('--publish-seconds', type=float, default=DEFAULT_PUBLISH_SECONDS, help='wall seconds between two publications')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='rows read from a raw CSV at a time')
+    args = parser.parse_args(argv)
+
+    config = {
+        **DEFAULT_CONFIG,
+        'raw_dir': args.raw_dir,
+        'countries_file': args.countries or os.path.join(args.raw_dir, DEFAULT_CONFIG['countries_file']),
+        'stop_words': read_stop_words(args.stop_words) if args.stop_words is not None else None,
+    }
+    language_model = None
+    if args.language_model is not None:
+        from language_id import load_model
+        language_model = load_model(args.language_model)
+
+    replay = LiveReplay(load_countries(config), load_stop_words(config), raw_files=raw_files(config), output_dir=args.output_dir,
+                        speedup=args.speedup, batch_seconds=args.batch_seconds, queue_size=args.queue_size,
+                        language_model=language_model, publish_seconds=args.publish_seconds, chunk_size=args.chunk_size,
+                        language_workers=args.language_workers)
+    status = replay.run()
+    print(f"Replayed {status['events_read']:,} tweets ({status['tweets_aggregated']:,} aggregated) "
+          f"in {status['elapsed_seconds']:.1f}s, p95 lag {status['lag_seconds']['p95'] or 0:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Per-candidate daily polarity series
+#
+# The daily series are read from the stored sums of the metrics cube (tweets, polarity sum, sum of
+# squares and count per date and candidate), with one row per date of the whole period and one
+# column per candidate. A day without tweets of a candidate is a missing value on its own date,
+# so differences between candidates are aligned on the date instead of the position, and every
+# mean, difference, rolling mean, date lookup and confidence interval is computed in O(days).
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+SERIES_MEASURES = ['tweets', 'polarity_sum', 'polarity_sq_sum', 'polarity_count']
+
+
+# Daily sums of the measures per candidate: columns (measure, candidate), one row per date between the first and last date
+def daily_series(cube, candidates=None):
+    daily = cube[cube['date'].notna()]
+    if candidates is not None:
+        daily = daily[daily['candidate'].isin(candidates)]
+
+    # Cubes written before the sums of squares were stored have no confidence intervals
+    measures = [measure for measure in SERIES_MEASURES if measure in daily]
+    daily = daily.groupby(['date', 'candidate'], observed=True)[measures].sum().unstack('candidate', fill_value=0)
+    if 'polarity_sq_sum' not in measures:
+        daily = daily.join(pd.concat({'polarity_sq_sum': daily['polarity_sum'] * np.nan}, axis=1))
+
+    # Every date of the period, including the days without tweets
+    if len(daily):
+        daily = daily.reindex(pd.date_range(daily.index.min(), daily.index.max(), freq='D'), fill_value=0)
+    daily.columns = daily.columns.set_names(['measure', 'candidate'])
+    daily.columns = daily.columns.set_levels(daily.columns.levels[1].astype(str), level='candidate')
+    return daily.rename_axis('date')
+
+
+# Polarity means per date and candidate (missing on the days without polarity)
+def polarity_means(series):
+    counts = series['polarity_count']
+    return (series['polarity_sum'] / counts).where(counts > 0)
+
+
+# Polarity means over a rolling window of days, weighted by the number of tweets of each day
+def rolling_polarity_means(series, window, min_periods=1):
+    sums = series['polarity_sum'].rolling(window, min_periods=min_periods).sum()
+    counts = series['polarity_count'].rolling(window, min_periods=min_periods).sum()
+    return (sums / counts).where(counts > 0)
+
+
+# Standard errors of the polarity means per date and candidate
+def polarity_standard_errors(series):
+    counts = series['polarity_count']
+    means = polarity_means(series)
+    variances = ((series['polarity_sq_sum'] - counts * means ** 2) / (counts - 1)).clip(lower=0)
+    return np.sqrt(variances / counts).where(counts > 1)
+
+
+# Normal confidence intervals of the polarity means: DataFrame with the mean, lower and upper bounds of a candidate
+def polarity_confidence_intervals(series, candidate, level=0.95):
+    z = NormalDist().inv_cdf(0.5 + level / 2)
+    means = polarity_means(series)[candidate]
+    margins = z * polarity_standard_errors(series)[candidate]
+    return pd.DataFrame({'mean': means, 'lower': means - margins, 'upper': means + margins})
+
+
+# Difference of the polarity means of two candidates aligned on the date, with its normal confidence interval
+# (missing on the days without polarity for either candidate)
+def polarity_difference(series, left='biden', right='trump', level=0.95, window=None):
+    if window is None:
+        means = polarity_means(series)
+        errors = polarity_standard_errors(series)
+    else:
+        # Rolling means and their standard errors from the sums over the window
+        series = series.rolling(window, min_periods=1).sum()
+        means = polarity_means(series)
+        errors = polarity_standard_errors(series)
+
+    z = NormalDist().inv_cdf(0.5 + level / 2)
+    difference = means[left] - means[right]
+    margins = z * np.sqrt(errors[left] ** 2 + errors[right] ** 2)
+    return pd.DataFrame({'difference': difference, 'lower': difference - margins, 'upper': difference + margins})
+
+
+# Date of the lowest ('min') or highest ('max') daily polarity mean of a candidate (None without polarity)
+def extreme_polarity_date(series, candidate, how='min'):
+    if candidate not in series['polarity_count']:
+        return None
+    means = polarity_means(series)[candidate].dropna()
+    if means.empty:
+        return None
+    return means.idxmin() if how == 'min' else means.idxmax()
@@ -0,0 +1,143 @@
+# Pre-aggregated metrics cube for the dashboard
+#
+# The cube is keyed by (date, candidate, state, sentiment) and holds the tweet count,
+# the sums of likes and retweets and the sum, sum of squares and count of polarity. Every chart in the
+# dashboard is a roll-up of the cube instead of a scan of the raw tweet frame.
+import os
+
+import pandas as pd
+
+from instrumentation import timed
+
+CUBE_FILE = 'twitter_metrics_cube.parquet'
+
+CUBE_KEYS = ['date', 'candidate', 'state', 'sentiment']
+CUBE_COLUMNS = ('created_at', 'candidate', 'state', 'country', 'sentiment', 'likes', 'retweet_count', 'polarity')
+
+# Measures restricted to the representatives of the near-duplicate clusters
+REPRESENTATIVE_MEASURES = {
+    'tweets': 'rep_tweets',
+    'likes': 'rep_likes',
+    'retweets': 'rep_retweets',
+    'polarity_sum': 'rep_polarity_sum',
+    'polarity_sq_sum': 'rep_polarity_sq_sum',
+    'polarity_count': 'rep_polarity_count',
+}
+
+
+# Build the cube from the sentiment DataFrame
+@timed()
+def build_metrics_cube(df):
+    # Only U.S. states are used by the dashboard, so the state of any other country is bucketed as 'unknown'
+    is_us = df['country'].astype(str).str.strip().str.lower() == 'united states'
+
+    keys = pd.DataFrame({
+        'date': pd.to_datetime(df['created_at'], errors='coerce').dt.normalize(),
+        'candidate': df['candidate'].astype(str),
+        'state': df['state'].astype(str).where(is_us, 'unknown'),
+        'sentiment': df['sentiment'],
+    })
+    values = pd.DataFrame({
+        'tweets': 1,
+        'likes': df['likes'],
+        'retweets': df['retweet_count'],
+        'polarity_sum': df['polarity'].astype('float64'),
+        'polarity_sq_sum': df['polarity'].astype('float64') ** 2,
+        'polarity_count': df['polarity'].notna().astype('int64'),
+    })
+
+    # The same measures over the representatives of the near-duplicate clusters only
+    if 'is_representative' in df:
+        representative = df['is_representative'].to_numpy(dtype=bool)
+        for measure, rep_measure in REPRESENTATIVE_MEASURES.items():
+            values[rep_measure] = values[measure].where(representative, 0)
+
+    cube = pd.concat([keys, values], axis=1).groupby(CUBE_KEYS, dropna=False, observed=True).sum().reset_index()
+
+    for column in ['candidate', 'state', 'sentiment']:
+        cube[column] = cube[column].astype('category')
+
+    return cube
+
+
+# Merge cubes (e.g. of successive batches of tweets), adding up the measures of equal keys
+def merge_metrics_cubes(cubes):
+    cubes = [cube.astype({column: object for column in ['candidate', 'state', 'sentiment']}) for cube in cubes]
+    cube = pd.concat(cubes, ignore_index=True).groupby(CUBE_KEYS, dropna=False, observed=True).sum().reset_index()
+
+    for column in ['candidate', 'state', 'sentiment']:
+        cube[column] = cube[column].astype('category')
+
+    return cube
+
+
+# Write the cube to disk
+def write_metrics_cube(cube, path=CUBE_FILE):
+    tmp_path = f'{path}.tmp'
+    cube.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+# Read the cube from disk
+def read_metrics_cube(path=CUBE_FILE):
+    return pd.read_parquet(path)
+
+
+# Check if a cube has been written
+def metrics_cube_exists(path=CUBE_FILE):
+    return os.path.exists(path)
+
+
+# Cube whose measures count each near-duplicate cluster once (unchanged for cubes without representative measures)
+def collapse_near_duplicates(cube):
+    if not all(rep_measure in cube for rep_measure in REPRESENTATIVE_MEASURES.values()):
+        return cube
+
+    collapsed = cube.drop(columns=list(REPRESENTATIVE_MEASURES))
+    collapsed = collapsed.rename(columns={rep_measure: measure for measure, rep_measure in REPRESENTATIVE_MEASURES.items()})
+    return collapsed[collapsed['tweets'] > 0].reset_index(drop=True)
+
+
+# Total tweets and likes per candidate
+def candidate_totals(cube):
+    return cube.groupby('candidate', observed=True)[['tweets', 'likes', 'retweets']].sum()
+
+
+# Tweets per day and candidate
+def daily_tweet_counts(cube):
+    daily_tweets = cube.groupby(['date', 'candidate'], observed=True)['tweets'].sum().reset_index(name='count')
+    daily_tweets['candidate'] = daily_tweets['candidate'].astype(str)
+    return daily_tweets
+
+
+# Total likes and retweets per candidate
+def engagement_totals(cube):
+    engagement_data = candidate_totals(cube)[['likes', 'retweets']].rename(columns={'retweets': 'retweet_count'}).reset_index()
+    engagement_data['candidate'] = engagement_data['candidate'].astype(str)
+    return engagement_data
+
+
+# Tweets per U.S. state and candidate
+def state_tweet_counts(cube):
+    us_cube = cube[cube['state'] != 'unknown']
+    state_counts = us_cube.groupby(['state', 'candidate'], observed=True)['tweets'].sum().reset_index(name='Tweet Count')
+    for column in ['state', 'candidate']:
+        state_counts[column] = state_counts[column].astype(str)
+    return state_counts
+
+
+# Sentiment distribution of one candidate, ordered like value_counts()
+def sentiment_counts(cube, candidate):
+    candidate_cube = cube[cube['candidate'] == candidate]
+    counts = candidate_cube.groupby('sentiment', observed=True)['tweets'].sum()
+    counts = counts[counts > 0].sort_values(ascending=False)
+    counts.index = counts.index.astype(str)
+    return counts.reset_index().set_axis(['Sentiment', 'Count'], axis=1)
+
+
+# Daily polarity means of one candidate
+def daily_polarity_means(cube, candidate):
+    candidate_cube = cube[cube['candidate'] == candidate]
+    daily = candidate_cube.groupby('date')[['polarity_sum', 'polarity_count']].sum()
+    daily = daily[daily['polarity_count'] > 0]
+    return (daily['polarity_sum'] / daily['polarity_count']).rename('polarity')
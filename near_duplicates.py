@@ -0,0 +1,209 @@
+# Near-duplicate tweet detection with MinHash and locality-sensitive hashing
+#
+# Copy-paste campaigns and bot retweets differ only by a URL, a mention or a hashtag. Every
+# tweet_cleaned is reduced to a MinHash signature of its word bigrams (computed in chunks across
+# a process pool), signatures are bucketed by bands (LSH), and tweets sharing a bucket whose
+# signatures agree on at least `threshold` of their values are linked into clusters. Tweets of
+# different groups (candidates) are never linked, so every cluster belongs to one candidate.
+#
+# The cluster id of a tweet is the row position of its representative, the first tweet of its
+# cluster, so values computed for the representatives can be broadcast to the whole cluster.
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from instrumentation import timed
+from tokens import TokenTable
+
+CLUSTERS_FILE = 'near_duplicate_clusters.parquet'
+
+NUM_PERM = 32
+BANDS = 8
+
+# Minimum estimated Jaccard similarity of the word bigrams of two near-duplicates
+DEFAULT_THRESHOLD = 0.7
+
+DEFAULT_CHUNK_SIZE = 50_000
+DEFAULT_SEED = 1
+
+# Permutations hashed at once (bounds the temporary arrays to shingles x PERM_BLOCK)
+PERM_BLOCK = 8
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_EMPTY = np.iinfo(np.uint32).max
+
+
+# Random parameters of the num_perm hash functions
+def _permutations(num_perm, seed):
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2**63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)  # Odd
+    offsets = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+    return multipliers, offsets
+
+
+# 64-bit hash of every shingle (word bigram, or the single word of one-word texts) and the row offsets of the shingles
+def _shingles(texts):
+    tokens = TokenTable.from_texts(texts)
+
+    # Hash words by their text, so every chunk and process agrees on the shingle hashes
+    word_hashes = pd.util.hash_array(tokens.vocab.astype(object))[tokens.ids]
+    lengths = tokens.lengths()
+
+    # Bigrams pair each token with the next token of the same row (rows without tokens end no token)
+    pairs = np.ones(len(word_hashes), dtype=bool)
+    pairs[tokens.offsets[1:][lengths > 0] - 1] = False
+    pairs &= np.repeat(lengths > 1, lengths)
+
+    starts = np.flatnonzero(pairs)
+    with np.errstate(over='ignore'):
+        bigrams = (word_hashes[starts] * _MIX) ^ word_hashes[starts + 1]
+
+    singles = np.repeat(lengths == 1, lengths)
+    shingle_rows = np.concatenate([tokens.row_ids()[starts], tokens.row_ids()[singles]])
+    hashes = np.concatenate([bigrams, word_hashes[singles]])
+
+    order = np.argsort(shingle_rows, kind='stable')
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(shingle_rows, minlength=len(tokens)), out=offsets[1:])
+    return hashes[order], offsets
+
+
+# MinHash signatures (rows x num_perm, uint32) of a list of texts; texts without words get _EMPTY everywhere
+def minhash_signatures(texts, num_perm=NUM_PERM, seed=DEFAULT_SEED):
+    hashes, offsets = _shingles(texts)
+    multipliers, perm_offsets = _permutations(num_perm, seed)
+
+    rows = len(offsets) - 1
+    signatures = np.full((rows, num_perm), _EMPTY, dtype=np.uint32)
+    has_shingles = np.diff(offsets) > 0
+    if not has_shingles.any():
+        return signatures
+
+    # Multiply-shift hashing: the top 32 bits of a * x + b, minimized over the shingles of every row
+    starts = offsets[:-1][has_shingles]
+    for block in range(0, num_perm, PERM_BLOCK):
+        columns = slice(block, min(block + PERM_BLOCK, num_perm))
+        with np.errstate(over='ignore'):
+            values = (hashes[:, None] * multipliers[None, columns] + perm_offsets[None, columns]) >> np.uint64(32)
+        signatures[has_shingles, columns] = np.minimum.reduceat(values, starts, axis=0).astype(np.uint32)
+
+    return signatures
+
+
+# Signatures of one chunk of texts (run in worker processes)
+def _signature_chunk(args):
+    texts, num_perm, seed = args
+    return minhash_signatures(texts, num_perm, seed)
+
+
+# Split a list into consecutive chunks
+def _chunks(values, chunk_size):
+    for start in range(0, len(values), chunk_size):
+        yield values[start:start + chunk_size]
+
+
+# Signatures of every text, computed in chunks across a process pool
+def compute_signatures(texts, num_perm=NUM_PERM, seed=DEFAULT_SEED, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    texts = pd.Series(texts).fillna('').astype(str).tolist()
+    if not texts:
+        return np.empty((0, num_perm), dtype=np.uint32)
+
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, -(-len(texts) // chunk_size)))
+    tasks = ((chunk, num_perm, seed) for chunk in _chunks(texts, chunk_size))
+
+    # Single worker: hash in this process
+    if workers == 1:
+        return np.concatenate([_signature_chunk(task) for task in tasks])
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return np.concatenate(list(executor.map(_signature_chunk, tasks)))
+
+
+# Candidate pairs (row, first row of the bucket) of every LSH band; group_codes (int64 per row) keep the
+# rows of different groups in different buckets
+def _band_pairs(signatures, bands, group_codes):
+    rows_per_band = signatures.shape[1] // bands
+    candidates = np.flatnonzero(signatures[:, 0] != _EMPTY)  # Texts without words are never duplicates
+
+    pairs = []
+    for band in range(bands):
+        # Combine the group and the values of the band into one 64-bit bucket key
+        key = group_codes[candidates].astype(np.uint64)
+        with np.errstate(over='ignore'):
+            for column in range(band * rows_per_band, (band + 1) * rows_per_band):
+                key = (key ^ signatures[candidates, column].astype(np.uint64)) * _MIX
+
+        # Link every row of a bucket to the first row of the bucket
+        order = np.argsort(key, kind='stable')
+        sorted_key = key[order]
+        new_bucket = np.ones(len(order), dtype=bool)
+        new_bucket[1:] = sorted_key[1:] != sorted_key[:-1]
+        bucket_first = order[np.flatnonzero(new_bucket)[np.cumsum(new_bucket) - 1]]
+
+        linked = ~new_bucket
+        pairs.append(np.column_stack([candidates[order[linked]], candidates[bucket_first[linked]]]))
+
+    pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+    return np.unique(pairs, axis=0)
+
+
+# Cluster ids (row position of the representative) from the MinHash signatures, within the groups of the rows
+# (e.g. their candidate; all rows are one group by default)
+def cluster_signatures(signatures, threshold=DEFAULT_THRESHOLD, bands=BANDS, groups=None):
+    rows = len(signatures)
+    group_codes = np.zeros(rows, dtype=np.int64) if groups is None else pd.factorize(np.asarray(groups), use_na_sentinel=False)[0]
+    pairs = _band_pairs(signatures, bands, group_codes)
+
+    # Keep the pairs of the same group whose signatures agree on enough values (estimated Jaccard similarity)
+    if len(pairs):
+        agreement = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+        pairs = pairs[(agreement >= threshold) & (group_codes[pairs[:, 0]] == group_codes[pairs[:, 1]])]
+
+    graph = sparse.coo_matrix((np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])), shape=(rows, rows))
+    _, labels = connected_components(graph, directed=False)
+
+    # The representative of a cluster is its first row
+    first_row = np.full(labels.max() + 1 if rows else 0, rows, dtype=np.int64)
+    np.minimum.at(first_row, labels, np.arange(rows, dtype=np.int64))
+    return first_row[labels]
+
+
+# Cluster id of every text: the row position of the first text of its near-duplicate cluster. Pass the candidate
+# of every text as groups so each candidate keeps its own clusters and representatives
+@timed()
+def find_near_duplicates(texts, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, bands=BANDS, workers=None,
+                         chunk_size=DEFAULT_CHUNK_SIZE, seed=DEFAULT_SEED, groups=None):
+    if num_perm % bands:
+        raise ValueError(f'num_perm ({num_perm}) must be a multiple of bands ({bands})')
+
+    signatures = compute_signatures(texts, num_perm, seed, workers, chunk_size)
+    return cluster_signatures(signatures, threshold, bands, groups)
+
+
+# Boolean mask of the representative rows
+def representative_mask(cluster_id):
+    cluster_id = np.asarray(cluster_id)
+    return cluster_id == np.arange(len(cluster_id))
+
+
+# Broadcast values computed for the representatives (in row order) to every row of their clusters
+def expand_representatives(representative_values, cluster_id):
+    cluster_id = np.asarray(cluster_id)
+    position = np.cumsum(representative_mask(cluster_id)) - 1
+    return np.asarray(representative_values)[position[cluster_id]]
+
+
+# Write and read the cluster ids of a cleaned dataset (one row per tweet, in file order)
+def write_clusters(cluster_id, path=CLUSTERS_FILE):
+    tmp_path = f'{path}.tmp'
+    pd.DataFrame({'cluster_id': np.asarray(cluster_id, dtype=np.int64)}).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def read_clusters(path=CLUSTERS_FILE):
+    return pd.read_parquet(path)['cluster_id'].to_numpy()
@@ -0,0 +1,567 @@
+# Incremental pipeline runner
+#
+# The steps of Data_Cleaning.ipynb and sentiment_backend.ipynb are declared as stages of a
+# dependency graph. Each stage is fingerprinted by its external input files, its parameters,
+# the source code of the modules it uses and of the modules of this repository they import,
+# and the fingerprints of the stages it depends on.
+# Only stale stages are executed, and stages whose dependencies are done run concurrently.
+#
+# Usage:
+#   python pipeline.py --raw-dir data/raw --data-dir data --countries data/raw/Countries_list.xlsx \
+#       --language-model data/raw/lid.176.bin [--stop-words stop_words.txt] [--stage emoji] [--force] [--dry-run] \
+#       [--trace trace.json]
+import argparse
+import ast
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+import instrumentation
+
+# Bump when the pipeline itself changes so every artifact is rebuilt
+PIPELINE_VERSION = 1
+
+STATE_FILE = 'pipeline_state.json'
+
+# Directory of the pipeline modules, whose imports are fingerprinted with the stages using them
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+UNFILTERED_FILE = 'twitter_cleaned_unfiltered.csv'
+CLEANED_FILE = 'twitter_cleaned_data.csv'
+SENTIMENT_FILE = 'twitter_sentiment.csv'
+
+DEFAULT_CONFIG = {
+    'raw_dir': '.',
+    'data_dir': '.',
+    'countries_file': 'Countries_list.xlsx',
+    'language_model': None,
+    'stop_words': None,
+    'workers': None,
+    'chunk_size': 100_000,
+    'duplicate_threshold': 0.7,
+    'score_representatives': False,
+}
+
+
+# Path of an artifact in the data directory
+def data_path(config, name):
+    return os.path.join(config['data_dir'], name)
+
+
+# Paths of the raw candidate CSVs
+def raw_files(config):
+    from cleaning import RAW_FILES
+    return {candidate: os.path.join(config['raw_dir'], name) for candidate, name in RAW_FILES.items()}
+
+
+# Path of the near-duplicate clusters
+def clusters_path(config):
+    from near_duplicates import CLUSTERS_FILE
+    return data_path(config, CLUSTERS_FILE)
+
+
+# Known countries list (first column 'Country' of the countries spreadsheet or CSV)
+def load_countries(config):
+    path = config['countries_file']
+    countries_df = pd.read_csv(path) if path.endswith('.csv') else pd.read_excel(path)
+    return countries_df['Country']
+
+
+# Stop words of a text file, one per line
+def read_stop_words(path):
+    with open(path, encoding='utf-8') as f:
+        return [word for word in (line.strip() for line in f) if word]
+
+
+# English stop words, from the config or from NLTK
+def load_stop_words(config):
+    if config['stop_words'] is not None:
+        return set(config['stop_words'])
+    from nltk.corpus import stopwords
+    return set(stopwords.words('english'))
+
+
+# Stages
+
+def run_clean(config):
+    from cleaning import CLEANED_CHUNK_COLUMNS, iter_clean_chunks, write_csv_chunks
+
+    chunks = iter_clean_chunks(load_countries(config), raw_files(config), config['chunk_size'], config['workers'])
+    return write_csv_chunks(chunks, data_path(config, UNFILTERED_FILE), CLEANED_CHUNK_COLUMNS)
+
+
+def run_language(config):
+    from cleaning import finalize_csv
+
+    model = None
+    if config['language_model'] is not None:
+        from language_id import load_model
+        model = load_model(config['language_model'])
+
+    return finalize_csv(data_path(config, UNFILTERED_FILE), data_path(config, CLEANED_FILE),
+                        load_stop_words(config), model, config['chunk_size'], language_workers=config['workers'])
+
+
+def run_near_duplicates(config):
+    from near_duplicates import find_near_duplicates, representative_mask, write_clusters
+
+    tweets = pd.read_csv(data_path(config, CLEANED_FILE), lineterminator='\n', usecols=['tweet_cleaned', 'candidate'])
+    cluster_id = find_near_duplicates(tweets['tweet_cleaned'], threshold=config['duplicate_threshold'], workers=config['workers'],
+                                      groups=tweets['candidate'])
+    write_clusters(cluster_id, clusters_path(config))
+    return int(representative_mask(cluster_id).sum())
+
+
+def run_polarity(config):
+    from near_duplicates import expand_representatives, read_clusters, representative_mask
+    from polarity import label_sentiment
+    from polarity_cache import CACHE_FILE, PolarityCache, cached_polarity
+    from schema import apply_schema
+    from snapshot import PARTITIONS_DIR, SNAPSHOT_FILE, write_partitions, write_snapshot
+
+    twitter_df = pd.read_csv(data_path(config, CLEANED_FILE), lineterminator='\n')
+    twitter_df.columns = twitter_df.columns.str.replace('\r', '')
+    twitter_df['country'] = twitter_df['country'].str.replace('\r', '')
+    twitter_df = apply_schema(twitter_df)
+
+    # Extract hashtags
+    twitter_df['hashtag'] = twitter_df['tweet'].str.findall(r'(#\w+)').apply(lambda x: ', '.join(x))
+
+    # Near-duplicate clusters
+    twitter_df['cluster_id'] = read_clusters(clusters_path(config))
+    twitter_df['is_representative'] = representative_mask(twitter_df['cluster_id'])
+
+    # Score every tweet, or only the representatives and reuse their score for the rest of their cluster
+    with PolarityCache(data_path(config, CACHE_FILE)) as polarity_cache:
+        if config['score_representatives']:
+            representative_texts = twitter_df.loc[twitter_df['is_representative'], 'tweet_cleaned']
+            representative_polarity = cached_polarity(representative_texts, polarity_cache, workers=config['workers'])
+            twitter_df['polarity'] = expand_representatives(representative_polarity, twitter_df['cluster_id'])
+        else:
+            twitter_df['polarity'] = cached_polarity(twitter_df['tweet_cleaned'], polarity_cache, workers=config['workers'])
+    twitter_df['sentiment'] = pd.Categorical(label_sentiment(twitter_df['polarity']))
+
+    twitter_df.to_csv(data_path(config, SENTIMENT_FILE), index=False)
+    write_snapshot(twitter_df, data_path(config, SNAPSHOT_FILE))
+    write_partitions(twitter_df, data_path(config, PARTITIONS_DIR))
+    return len(twitter_df)
+
+
+def run_aggregates(config):
+    from metrics_cube import CUBE_COLUMNS, CUBE_FILE, build_metrics_cube, write_metrics_cube
+    from snapshot import SNAPSHOT_FILE, read_snapshot
+
+    cube = build_metrics_cube(read_snapshot(data_path(config, SNAPSHOT_FILE), columns=[*CUBE_COLUMNS, 'is_representative']))
+    write_metrics_cube(cube, data_path(config, CUBE_FILE))
+    return len(cube)
+
+
+def run_word_frequencies(config):
+    from metrics_api import daily_series, extreme_polarity_date
+    from metrics_cube import CUBE_FILE, read_metrics_cube
+    from snapshot import SNAPSHOT_FILE, read_snapshot
+    from tokens import TokenTable
+    from wordcloud_cache import prerender_wordclouds
+    from word_frequencies import (
+        COLLAPSED_HASHTAG_FREQUENCIES_FILE, COLLAPSED_WORD_FREQUENCIES_FILE, HASHTAG_FREQUENCIES_FILE, WORD_FREQUENCIES_FILE,
+        WordFrequencies, write_min_polarity_csvs, write_wordcloud_csvs
+    )
+
+    twitter_df = read_snapshot(data_path(config, SNAPSHOT_FILE),
+                               columns=['created_at', 'day', 'candidate', 'sentiment', 'polarity', 'tweet_cleaned', 'hashtag',
+                                        'is_representative'])
+
+    word_tokens = TokenTable.from_texts(twitter_df['tweet_cleaned'])
+    hashtag_tokens = TokenTable.from_texts(twitter_df['hashtag'], sep=', ')
+    word_frequencies = WordFrequencies.from_words(twitter_df, word_tokens)
+    hashtag_frequencies = WordFrequencies.from_hashtags(twitter_df, hashtag_tokens)
+    word_frequencies.save(data_path(config, WORD_FREQUENCIES_FILE))
+    hashtag_frequencies.save(data_path(config, HASHTAG_FREQUENCIES_FILE))
+
+    # The same engines counting each near-duplicate cluster once
+    representative = twitter_df['is_representative'].to_numpy(dtype=bool)
+    representative_df = twitter_df[representative]
+    WordFrequencies.from_words(representative_df, word_tokens.take(representative)).save(
+        data_path(config, COLLAPSED_WORD_FREQUENCIES_FILE))
+    WordFrequencies.from_hashtags(representative_df, hashtag_tokens.take(representative)).save(
+        data_path(config, COLLAPSED_HASHTAG_FREQUENCIES_FILE))
+
+    # Date of the min polarity mean for each candidate, from the daily sums of the metrics cube
+    series = daily_series(read_metrics_cube(data_path(config, CUBE_FILE)), candidates=['biden', 'trump'])
+    min_polarity_dates = {candidate: extreme_polarity_date(series, candidate, 'min') for candidate in series['polarity_count']}
+
+    csv_files = write_wordcloud_csvs(word_frequencies, hashtag_frequencies, config['data_dir'])
+    csv_files += write_min_polarity_csvs(word_frequencies, hashtag_frequencies, min_polarity_dates, config['data_dir'])
+    prerender_wordclouds(csv_files, cache_dir=data_path(config, 'wordcloud_cache'))
+    return len(csv_files)
+
+
+def run_emoji(config):
+    from emoji_counts import EMOJI_COUNTS_FILE, count_emojis, top_emojis, write_emoji_counts
+    from snapshot import SNAPSHOT_FILE, read_snapshot
+
+    twitter_df = read_snapshot(data_path(config, SNAPSHOT_FILE), columns=['created_at', 'candidate', 'tweet'])
+    emoji_counts = count_emojis(twitter_df, workers=config['workers'])
+    write_emoji_counts(emoji_counts, data_path(config, EMOJI_COUNTS_FILE))
+
+    for candidate in ['biden', 'trump']:
+        top_emojis(emoji_counts, candidate).to_csv(data_path(config, f'{candidate}_emojis.csv'))
+    return len(emoji_counts)
+
+
+def run_engagement(config):
+    from engagement_stats import ENGAGEMENT_MOMENTS_FILE, ENGAGEMENT_SKETCH_FILE, EngagementStats, write_engagement_stats
+    from snapshot import SNAPSHOT_FILE, read_snapshot
+
+    twitter_df = read_snapshot(data_path(config, SNAPSHOT_FILE), columns=['created_at', 'candidate', 'likes', 'retweet_count'])
+    engagement_stats = EngagementStats.from_frame(twitter_df, workers=config['workers'])
+    write_engagement_stats(engagement_stats, data_path(config, ENGAGEMENT_SKETCH_FILE), data_path(config, ENGAGEMENT_MOMENTS_FILE))
+    return len(engagement_stats.moments)
+
+
+def run_search_index(config):
+    from search_index import INDEX_COLUMNS, SEARCH_INDEX_DIR, write_search_index
+    from snapshot import SNAPSHOT_FILE, read_snapshot
+
+    twitter_df = read_snapshot(data_path(config, SNAPSHOT_FILE), columns=[*INDEX_COLUMNS, 'is_representative'])
+    return write_search_index(twitter_df, data_path(config, SEARCH_INDEX_DIR))['terms']
+
+
+def run_timeseries(config):
+    from snapshot import SNAPSHOT_FILE, read_snapshot
+    from timeseries import TIMESERIES_COLUMNS, TIMESERIES_FILE, build_timeseries, write_timeseries
+
+    series = build_timeseries(read_snapshot(data_path(config, SNAPSHOT_FILE), columns=[*TIMESERIES_COLUMNS, 'is_representative']))
+    write_timeseries(series, data_path(config, TIMESERIES_FILE))
+    return len(series)
+
+
+# Stage graph: dependencies, code modules, external inputs, parameters and outputs of every stage
+STAGES = {
+    'clean': {
+        'run': run_clean,
+        'depends': [],
+        'modules': ['cleaning', 'country_matcher', 'tokens'],
+        'inputs': lambda config: [*raw_files(config).values(), config['countries_file']],
+        'params': ['chunk_size'],
+        'outputs': lambda config: [data_path(config, UNFILTERED_FILE)],
+    },
+    'language': {
+        'run': run_language,
+        'depends': ['clean'],
+        'modules': ['cleaning', 'language_id', 'tokens'],
+        'inputs': lambda config: [config['language_model']] if config['language_model'] else [],
+        'params': ['chunk_size', 'stop_words'],
+        'outputs': lambda config: [data_path(config, CLEANED_FILE)],
+    },
+    'near_duplicates': {
+        'run': run_near_duplicates,
+        'depends': ['language'],
+        'modules': ['near_duplicates', 'tokens'],
+        'inputs': lambda config: [],
+        'params': ['duplicate_threshold'],
+        'outputs': lambda config: [clusters_path(config)],
+    },
+    'polarity': {
+        'run': run_polarity,
+        'depends': ['near_duplicates'],
+        'modules': ['near_duplicates', 'polarity', 'polarity_cache', 'schema', 'snapshot'],
+        'inputs': lambda config: [],
+        'params': ['score_representatives'],
+        'outputs': lambda config: [data_path(config, SENTIMENT_FILE), data_path(config, 'twitter_sentiment.parquet'),
+                                   data_path(config, os.path.join('twitter_sentiment_partitions', 'manifest.json'))],
+    },
+    'aggregates': {
+        'run': run_aggregates,
+        'depends': ['polarity'],
+        'modules': ['metrics_cube', 'snapshot'],
+        'inputs': lambda config: [],
+        'params': [],
+        'outputs': lambda config: [data_path(config, 'twitter_metrics_cube.parquet')],
+    },
+    'word_frequencies': {
+        'run': run_word_frequencies,
+        'depends': ['polarity', 'aggregates'],
+        'modules': ['tokens', 'word_frequencies', 'wordcloud_cache', 'metrics_api', 'metrics_cube', 'snapshot'],
+        'inputs': lambda config: [],
+        'params': [],
+        'outputs': lambda config: [data_path(config, 'word_frequencies.npz'), data_path(config, 'hashtag_frequencies.npz'),
+                                   data_path(config, 'word_frequencies_collapsed.npz'),
+                                   data_path(config, 'hashtag_frequencies_collapsed.npz')],
+    },
+    'emoji': {
+        'run': run_emoji,
+        'depends': ['polarity'],
+        'modules': ['emoji_counts', 'snapshot'],
+        'inputs': lambda config: [],
+        'params': [],
+        'outputs': lambda config: [data_path(config, 'emoji_counts.parquet'),
+                                   data_path(config, 'biden_emojis.csv'), data_path(config, 'trump_emojis.csv')],
+    },
+    'engagement': {
+        'run': run_engagement,
+        'depends': ['polarity'],
+        'modules': ['engagement_stats', 'snapshot'],
+        'inputs': lambda config: [],
+        'params': [],
+        'outputs': lambda config: [data_path(config, 'engagement_sketch.parquet'), data_path(config, 'engagement_moments.parquet')],
+    },
+    'search_index': {
+        'run': run_search_index,
+        'depends': ['polarity'],
+        'modules': ['search_index', 'schema', 'snapshot', 'tokens'],
+        'inputs': lambda config: [],
+        'params': [],
+        'outputs': lambda config: [data_path(config, os.path.join('search_index', 'meta.json'))],
+    },
+    'timeseries': {
+        'run': run_timeseries,
+        'depends': ['polarity'],
+        'modules': ['timeseries', 'metrics_cube', 'snapshot'],
+        'inputs': lambda config: [],
+        'params': [],
+        'outputs': lambda config: [data_path(config, 'twitter_timeseries.parquet')],
+    },
+}
+
+
+# Stages needed to build the targets, in dependency order
+def stage_order(targets=None):
+    order = []
+
+    def visit(name):
+        if name not in STAGES:
+            raise ValueError(f'Unknown stage: {name}')
+        if name in order:
+            return
+        for dependency in STAGES[name]['depends']:
+            visit(dependency)
+        order.append(name)
+
+    for name in (targets or list(STAGES)):
+        visit(name)
+    return order
+
+
+# Fingerprint of an external input file (size and modification time)
+def _file_fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 'missing'
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+# Fingerprint of a module's source code
+def _module_fingerprint(module):
+    spec = importlib.util.find_spec(module)
+    with open(spec.origin, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# Modules of this repository imported by a module (at the top level or inside its functions)
+def _local_imports(module):
+    with open(importlib.util.find_spec(module).origin, 'rb') as f:
+        tree = ast.parse(f.read())
+
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module.split('.')[0])
+
+    local = set()
+    for name in names:
+        spec = importlib.util.find_spec(name)
+        if spec is not None and spec.has_location and os.path.dirname(os.path.abspath(spec.origin)) == REPO_DIR:
+            local.add(name)
+    return local
+
+
+# The modules and every module of this repository they import, directly or not
+def module_closure(modules):
+    closure = set()
+    pending = list(modules)
+    while pending:
+        module = pending.pop()
+        if module not in closure:
+            closure.add(module)
+            pending.extend(_local_imports(module))
+    return sorted(closure)
+
+
+# Fingerprint of a stage given the fingerprints of the stages it depends on
+def stage_fingerprint(name, config, dependency_fingerprints):
+    stage = STAGES[name]
+    params = {param: config[param] for param in stage['params']}
+    if params.get('stop_words') is not None:
+        params['stop_words'] = sorted(params['stop_words'])
+
+    fingerprint = {
+        'pipeline_version': PIPELINE_VERSION,
+        'stage': name,
+        'modules': {module: _module_fingerprint(module) for module in module_closure(stage['modules'])},
+        'inputs': {path: _file_fingerprint(path) for path in stage['inputs'](config)},
+        'params': params,
+        'depends': {dependency: dependency_fingerprints[dependency] for dependency in stage['depends']},
+    }
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+# Read and write the state of the last runs
+def read_state(config):
+    path = data_path(config, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_state(config, state):
+    path = data_path(config, STATE_FILE)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# Plan a run: the fingerprint of every needed stage and whether it is stale
+def plan(config, targets=None, force=False):
+    state = read_state(config)
+    fingerprints = {}
+    stale = {}
+
+    for name in stage_order(targets):
+        fingerprints[name] = stage_fingerprint(name, config, fingerprints)
+        stale[name] = (
+            force
+            or state.get(name, {}).get('fingerprint') != fingerprints[name]
+            or not all(os.path.exists(path) for path in STAGES[name]['outputs'](config))
+            or any(stale.get(dependency, False) for dependency in STAGES[name]['depends'])
+        )
+
+    return fingerprints, stale
+
+
+# Run the stale stages, running stages whose dependencies are done concurrently
+#
+# The worker processes (config['workers'], or one per CPU) are divided between the jobs stages
+# running at the same time, which default to one per worker, so concurrent stages do not
+# oversubscribe the CPUs.
+def run_pipeline(config, targets=None, force=False, jobs=None, dry_run=False, log=print):
+    config = {**DEFAULT_CONFIG, **config}
+    os.makedirs(config['data_dir'], exist_ok=True)
+
+    fingerprints, stale = plan(config, targets, force)
+    pending = [name for name in fingerprints if stale[name]]
+    for name in fingerprints:
+        log(f"{name}: {'stale' if stale[name] else 'up to date'}")
+    if dry_run or not pending:
+        return pending
+
+    total_workers = config['workers'] or os.cpu_count() or 1
+    jobs = jobs or min(len(pending), total_workers)
+    stage_config = {**config, 'workers': max(1, total_workers // jobs)}
+
+    state = read_state(config)
+    state_lock = threading.Lock()
+    done = {name for name in fingerprints if not stale[name]}
+    failed = set()
+
+    def execute(name):
+        start = time.perf_counter()
+        with instrumentation.stage(f'pipeline.{name}') as record:
+            result = STAGES[name]['run'](stage_config)
+            record.rows_out = result
+        seconds = time.perf_counter() - start
+
+        with state_lock:
+            state[name] = {'fingerprint': fingerprints[name], 'result': result, 'seconds': round(seconds, 3),
+                           'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            write_state(config, state)
+        log(f'{name}: done in {seconds:.1f}s')
+        return name
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while pending or running:
+            # Start every stage whose dependencies are done
+            for name in list(pending):
+                if any(dependency in failed for dependency in STAGES[name]['depends']):
+                    pending.remove(name)
+                    failed.add(name)
+                    log(f'{name}: skipped (a dependency failed)')
+                elif all(dependency in done for dependency in STAGES[name]['depends']):
+                    pending.remove(name)
+                    log(f'{name}: running')
+                    running[executor.submit(execute, name)] = name
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    done.add(name)
+                except Exception as error:
+                    failed.add(name)
+                    log(f'{name}: failed ({error!r})')
+
+    if failed:
+        raise RuntimeError(f"Pipeline stages failed: {', '.join(sorted(failed))}")
+    return [name for name in fingerprints if stale[name]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the stale stages of the Twitter sentiment pipeline.')
+    parser.add_argument('--raw-dir', default=DEFAULT_CONFIG['raw_dir'], help='directory of the raw candidate CSVs')
+    parser.add_argument('--data-dir', default=DEFAULT_CONFIG['data_dir'], help='directory of the pipeline artifacts')
+    parser.add_argument('--countries', default=None, help='countries spreadsheet or CSV (default: Countries_list.xlsx in the raw directory)')
+    parser.add_argument('--language-model', default=None, help='fastText language identification model (no language filtering if omitted)')
+    parser.add_argument('--stop-words', default=None, help='text file of stop words, one per line (default: the NLTK English stop words)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes for cleaning, polarity scoring, emoji counting and engagement statistics, '
+                             'divided between the stages running at the same time')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CONFIG['chunk_size'], help='rows per cleaning chunk')
+    parser.add_argument('--duplicate-threshold', type=float, default=DEFAULT_CONFIG['duplicate_threshold'],
+                        help='minimum estimated Jaccard similarity of near-duplicate tweets')
+    parser.add_argument('--score-representatives', action='store_true',
+                        help='score one representative per near-duplicate cluster and reuse its polarity')
+    parser.add_argument('--jobs', type=int, default=None, help='stages run at the same time (default: one per worker)')
+    parser.add_argument('--stage', action='append', choices=list(STAGES), help='build only this stage and its dependencies')
+    parser.add_argument('--force', action='store_true', help='run every stage even if it is up to date')
+    parser.add_argument('--dry-run', action='store_true', help='only show which stages are stale')
+    parser.add_argument('--trace', default=None, help='record the stages and write a Chrome trace (chrome://tracing) to this file')
+    args = parser.parse_args(argv)
+
+    config = {
+        'raw_dir': args.raw_dir,
+        'data_dir': args.data_dir,
+        'countries_file': args.countries or os.path.join(args.raw_dir, DEFAULT_CONFIG['countries_file']),
+        'language_model': args.language_model,
+        'stop_words': read_stop_words(args.stop_words) if args.stop_words is not None else None,
+        'workers': args.workers,
+        'chunk_size': args.chunk_size,
+        'duplicate_threshold': args.duplicate_threshold,
+        'score_representatives': args.score_representatives,
+    }
+    if args.trace is not None:
+        instrumentation.enable()
+    try:
+        run_pipeline(config, targets=args.stage, force=args.force, jobs=args.jobs, dry_run=args.dry_run)
+    finally:
+        if args.trace is not None:
+            instrumentation.write_trace(args.trace, format='chrome')
+
+
+if __name__ == '__main__':
+    main()
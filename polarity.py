@@ -0,0 +1,82 @@
+# Parallel, batched polarity scoring
+#
+# Scores tweet_cleaned with the same lexicon TextBlob uses (TextBlob(text).sentiment.polarity),
+# streaming the texts in chunks across a process pool. Each worker loads the lexicon once.
+import hashlib
+import importlib.metadata
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+DEFAULT_CHUNK_SIZE = 20_000
+
+# Bump when the scoring logic changes so cached polarity values are invalidated
+POLARITY_ENGINE_VERSION = 1
+
+# Lexicon loaded once per worker process
+_lexicon = None
+
+
+# Load the TextBlob pattern lexicon in the current process
+def _load_lexicon():
+    global _lexicon
+    if _lexicon is None:
+        from textblob.en import sentiment
+        sentiment('')  # The lexicon is read lazily on the first call
+        _lexicon = sentiment
+    return _lexicon
+
+
+# Fingerprint of the scoring model: engine version, TextBlob version and lexicon contents
+def model_fingerprint():
+    import textblob.en
+
+    lexicon_path = os.path.join(os.path.dirname(textblob.en.__file__), 'en-sentiment.xml')
+    with open(lexicon_path, 'rb') as f:
+        lexicon_hash = hashlib.sha256(f.read()).hexdigest()
+
+    return f"{POLARITY_ENGINE_VERSION}:{importlib.metadata.version('textblob')}:{lexicon_hash}"
+
+
+# Score one chunk of texts
+def _score_chunk(texts):
+    lexicon = _load_lexicon()
+    polarity = np.empty(len(texts), dtype=np.float32)
+    for i, text in enumerate(texts):
+        polarity[i] = lexicon(text)[0]
+    return polarity
+
+
+# Split a list into consecutive chunks
+def _chunks(values, chunk_size):
+    for start in range(0, len(values), chunk_size):
+        yield values[start:start + chunk_size]
+
+
+# Score the polarity of every text, returning a float32 array aligned with the input
+@timed()
+def score_polarity(texts, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Missing texts (tweets left empty by cleaning) are scored as empty strings
+    texts = pd.Series(texts).fillna('').astype(str).tolist()
+    if not texts:
+        return np.empty(0, dtype=np.float32)
+
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, -(-len(texts) // chunk_size))
+
+    # Single worker: score in this process
+    if workers == 1:
+        return np.concatenate([_score_chunk(chunk) for chunk in _chunks(texts, chunk_size)])
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_lexicon) as executor:
+        return np.concatenate(list(executor.map(_score_chunk, _chunks(texts, chunk_size))))
+
+
+# Label polarity as positive, neutral or negative
+def label_sentiment(polarity):
+    polarity = np.asarray(polarity)
+    return np.select([polarity > 0, polarity == 0], ['positive', 'neutral'], default='negative')
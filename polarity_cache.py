@@ -0,0 +1,118 @@
+# Content-addressed polarity cache
+#
+# Maps a 64-bit hash of tweet_cleaned to its polarity in a SQLite database, so reruns only
+# score texts that are new. Identical texts are deduplicated before scoring, and the cache is
+# cleared automatically when the scoring model fingerprint changes.
+import hashlib
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from polarity import model_fingerprint, score_polarity
+
+CACHE_FILE = 'polarity_cache.sqlite'
+
+
+# 64-bit content hash of a text, as a signed integer so it fits an SQLite INTEGER key
+def text_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+class PolarityCache:
+    def __init__(self, path=CACHE_FILE, fingerprint=None):
+        self.path = path
+        self.fingerprint = fingerprint or model_fingerprint()
+        self.hits = 0
+        self.misses = 0
+        self.duplicates = 0
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS polarity (hash INTEGER PRIMARY KEY, polarity REAL)')
+        self._check_fingerprint()
+
+    # Drop every cached value if the scoring model has changed
+    def _check_fingerprint(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is None or row[0] != self.fingerprint:
+            with self.connection:
+                self.connection.execute('DELETE FROM polarity')
+                self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (self.fingerprint,))
+
+    # Look up hashes, returning the polarity values and a mask of which were found
+    def lookup(self, hashes):
+        polarity = np.zeros(len(hashes), dtype=np.float64)
+        found = np.zeros(len(hashes), dtype=bool)
+        if len(hashes) == 0:
+            return polarity, found
+
+        # Join against a temporary table instead of issuing one query per hash
+        with self.connection:
+            self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS lookup (position INTEGER, hash INTEGER)')
+            self.connection.execute('DELETE FROM lookup')
+            self.connection.executemany('INSERT INTO lookup VALUES (?, ?)', enumerate(map(int, hashes)))
+            rows = self.connection.execute(
+                'SELECT lookup.position, polarity.polarity FROM lookup JOIN polarity ON lookup.hash = polarity.hash'
+            ).fetchall()
+            self.connection.execute('DELETE FROM lookup')
+
+        if rows:
+            positions, values = zip(*rows)
+            polarity[list(positions)] = values
+            found[list(positions)] = True
+        return polarity, found
+
+    # Store polarity values for hashes
+    def store(self, hashes, polarity):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO polarity VALUES (?, ?)', zip(map(int, hashes), map(float, polarity))
+            )
+
+    # Hit and miss statistics of this session (counted over distinct texts)
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'duplicates': self.duplicates,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Score the polarity of every text, using the cache for texts that were scored before
+@timed()
+def cached_polarity(texts, cache, workers=None):
+    texts = pd.Series(texts).fillna('').astype(str)
+
+    # Deduplicate identical texts before hashing and scoring
+    codes, unique_texts = pd.factorize(texts)
+    unique_texts = np.asarray(unique_texts, dtype=object)
+    hashes = np.fromiter((text_hash(text) for text in unique_texts), dtype=np.int64, count=len(unique_texts))
+
+    polarity, found = cache.lookup(hashes)
+
+    # Score only the texts missing from the cache
+    missing = ~found
+    if missing.any():
+        scored = score_polarity(unique_texts[missing], workers=workers)
+        cache.store(hashes[missing], scored)
+        polarity[missing] = scored
+
+    cache.hits += int(found.sum())
+    cache.misses += int(missing.sum())
+    cache.duplicates += len(texts) - len(unique_texts)
+
+    return polarity[codes].astype(np.float32)
@@ -0,0 +1,75 @@
+# Compact column types of the tweet frames
+#
+# Low-cardinality text columns are stored as categoricals, counters as 32-bit integers and
+# polarity as float32. The calendar day of created_at is an int32 day key (days since
+# 1970-01-01) instead of a second datetime column.
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+# Low-cardinality text columns
+CATEGORY_COLUMNS = ['candidate', 'sentiment', 'state', 'country', 'city', 'source', 'user_location']
+
+# Non-negative counters
+COUNTER_COLUMNS = ['likes', 'retweet_count', 'user_followers_count']
+
+FLOAT32_COLUMNS = ['polarity']
+DATETIME_COLUMNS = ['created_at', 'user_join_date']
+
+# Day key of a missing created_at
+MISSING_DAY = np.iinfo(np.int32).min
+
+
+# Day key (days since 1970-01-01) of every timestamp
+def day_key(created_at):
+    days = pd.to_datetime(pd.Series(created_at), errors='coerce').to_numpy(dtype='datetime64[D]')
+    missing = np.isnat(days)
+    keys = days.astype(np.int64)
+    keys[missing] = MISSING_DAY
+    return keys.astype(np.int32)
+
+
+# Dates (datetime64) of day keys, NaT for missing days
+def day_to_date(day):
+    day = np.asarray(day, dtype=np.int64)
+    dates = day.astype('datetime64[D]').astype('datetime64[ns]')
+    dates[day == MISSING_DAY] = np.datetime64('NaT')
+    return pd.to_datetime(dates) if dates.ndim else pd.Timestamp(dates[()])
+
+
+# Day key of a date
+def date_to_day(date):
+    return int(day_key([pd.Timestamp(date)])[0])
+
+
+# Smallest integer type holding a counter column (uint32 unless a value does not fit)
+def _counter_dtype(values):
+    if len(values) == 0 or (values.min() >= 0 and values.max() <= np.iinfo(np.uint32).max):
+        return np.uint32
+    return np.int64
+
+
+# Convert a tweet frame to the compact column types, replacing created_at_date with the day key
+@timed()
+def apply_schema(df):
+    df = df.drop(columns=['created_at_date'], errors='ignore')
+    df.columns = df.columns.str.replace('\r', '')
+
+    for column in DATETIME_COLUMNS:
+        if column in df and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+    for column in CATEGORY_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype('category')
+    for column in COUNTER_COLUMNS:
+        if column in df and pd.api.types.is_integer_dtype(df[column]):
+            df[column] = df[column].astype(_counter_dtype(df[column]))
+    for column in FLOAT32_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype(np.float32)
+
+    if 'created_at' in df:
+        df['day'] = day_key(df['created_at'])
+
+    return df
@@ -0,0 +1,275 @@
+# Inverted full-text index over tweet_cleaned and the hashtags
+#
+# Every word of tweet_cleaned and every hashtag (lowercased, with its '#') is a term. The posting
+# list of a term holds the sorted row ids of the tweets containing it, delta-encoded and packed as
+# variable-length integers (7 bits per byte, high bit set on every byte but the last).
+#
+# The index is a directory written by the backend:
+#   postings.bin  packed posting lists of every term, memory-mapped
+#   terms.arrow   term, byte offset, byte length and document frequency of every term
+#   rows.arrow    candidate, sentiment, day key, polarity and tweet of every row, memory-mapped
+#   meta.json     number of rows, terms and postings and the date range
+# Queries decode only the posting lists of their terms, so counts, polarity series and sample
+# tweets of any query come back without scanning the tweet texts.
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from instrumentation import timed
+from schema import MISSING_DAY, date_to_day, day_key, day_to_date
+from tokens import TokenTable
+
+SEARCH_INDEX_DIR = 'search_index'
+
+POSTINGS_FILE = 'postings.bin'
+TERMS_FILE = 'terms.arrow'
+ROWS_FILE = 'rows.arrow'
+META_FILE = 'meta.json'
+
+# Columns of the frame the index is built from ('is_representative' is optional)
+INDEX_COLUMNS = ['created_at', 'candidate', 'sentiment', 'polarity', 'tweet', 'tweet_cleaned', 'hashtag']
+
+# Largest number of bytes of a packed row id delta (row ids are below 2**35)
+MAX_VARINT_BYTES = 5
+
+
+# Pack non-negative integers as variable-length integers, returning the bytes and the byte length of every value
+def encode_varints(values):
+    values = np.asarray(values, dtype=np.uint64)
+
+    lengths = np.ones(len(values), dtype=np.int64)
+    for size in range(1, MAX_VARINT_BYTES):
+        lengths += values >= np.uint64(1 << (7 * size))
+
+    starts = np.zeros(len(values), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    packed = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for position in range(MAX_VARINT_BYTES):
+        has_byte = lengths > position
+        byte = (values[has_byte] >> np.uint64(7 * position)) & np.uint64(0x7F)
+        more = (lengths[has_byte] > position + 1).astype(np.uint64) << np.uint64(7)
+        packed[starts[has_byte] + position] = (byte | more).astype(np.uint8)
+    return packed, lengths
+
+
+# Unpack variable-length integers
+def decode_varints(packed):
+    packed = np.asarray(packed, dtype=np.uint8)
+    if not len(packed):
+        return np.empty(0, dtype=np.int64)
+
+    # Every value ends on a byte without the high bit
+    last = packed < 0x80
+    value_of_byte = np.zeros(len(packed), dtype=np.int64)
+    np.cumsum(last[:-1], out=value_of_byte[1:])
+    value_starts = np.zeros(int(last.sum()), dtype=np.int64)
+    value_starts[1:] = np.flatnonzero(last)[:-1] + 1
+    position = np.arange(len(packed), dtype=np.int64) - value_starts[value_of_byte]
+
+    parts = (packed & 0x7F).astype(np.int64) << (7 * position)
+    return np.add.reduceat(parts, value_starts)
+
+
+# Terms of a word column and a hashtag column, as (term ids, row ids, terms)
+def _row_terms(words, hashtags):
+    word_tokens = TokenTable.from_texts(words)
+    hashtag_tokens = TokenTable.from_texts(hashtags, sep=', ').split_vocab(lambda hashtag: [hashtag.lower()])
+
+    # One shared vocabulary for words and hashtags
+    codes, terms = pd.factorize(np.concatenate([word_tokens.vocab, hashtag_tokens.vocab]))
+    term_ids = np.concatenate([codes[:len(word_tokens.vocab)][word_tokens.ids],
+                               codes[len(word_tokens.vocab):][hashtag_tokens.ids]])
+    row_ids = np.concatenate([word_tokens.row_ids(), hashtag_tokens.row_ids()])
+    return term_ids, row_ids, np.asarray(terms, dtype=object)
+
+
+# Build the index of a frame with the INDEX_COLUMNS and write it to a directory
+@timed()
+def write_search_index(df, path=SEARCH_INDEX_DIR):
+    rows = len(df)
+    term_ids, row_ids, terms = _row_terms(df['tweet_cleaned'].reset_index(drop=True), df['hashtag'].reset_index(drop=True))
+
+    # Sorted, distinct (term, row) pairs: the posting lists one after the other
+    pairs = np.sort(term_ids.astype(np.int64) * max(rows, 1) + row_ids)
+    pairs = pairs[np.append(True, pairs[1:] != pairs[:-1])] if len(pairs) else pairs
+    pair_terms = pairs // max(rows, 1)
+    pair_rows = pairs % max(rows, 1)
+
+    # Delta-encode the row ids of every posting list (the first row id is kept as it is)
+    first = np.ones(len(pairs), dtype=bool)
+    first[1:] = pair_terms[1:] != pair_terms[:-1]
+    deltas = np.where(first, pair_rows, pair_rows - np.roll(pair_rows, 1))
+    packed, lengths = encode_varints(deltas)
+
+    document_frequency = np.bincount(pair_terms, minlength=len(terms)).astype(np.int32)
+    byte_lengths = np.bincount(pair_terms, weights=lengths, minlength=len(terms)).astype(np.int64)
+    byte_offsets = np.zeros(len(terms), dtype=np.int64)
+    np.cumsum(byte_lengths[:-1], out=byte_offsets[1:])
+
+    # Filter columns, polarity and text of every row
+    row_table = pa.table({
+        'candidate': pa.array(df['candidate'].astype(str).to_numpy(dtype=object)).dictionary_encode(),
+        'sentiment': pa.array(df['sentiment'].astype(str).to_numpy(dtype=object)).dictionary_encode(),
+        'day': pa.array(day_key(df['created_at'])),
+        'polarity': pa.array(df['polarity'].to_numpy(dtype=np.float32)),
+        'is_representative': pa.array(df['is_representative'].to_numpy(dtype=bool) if 'is_representative' in df
+                                       else np.ones(rows, dtype=bool)),
+        'tweet': pa.array(df['tweet'].astype(object).where(df['tweet'].notna(), '').to_numpy(dtype=object), type=pa.string()),
+    })
+    term_table = pa.table({
+        'term': pa.array(terms, type=pa.string()),
+        'offset': byte_offsets,
+        'length': byte_lengths,
+        'count': document_frequency,
+    })
+
+    # Write to a temporary directory first so readers never see a half-written index
+    tmp_path = f'{path}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    packed.tofile(os.path.join(tmp_path, POSTINGS_FILE))
+    for table, name in ((term_table, TERMS_FILE), (row_table, ROWS_FILE)):
+        with pa.OSFile(os.path.join(tmp_path, name), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    days = row_table.column('day').to_numpy()
+    days = days[days != MISSING_DAY]
+    meta = {
+        'rows': rows, 'terms': len(terms), 'postings': len(pairs), 'bytes': len(packed),
+        'first_date': str(day_to_date(days.min()).date()) if len(days) else None,
+        'last_date': str(day_to_date(days.max()).date()) if len(days) else None,
+    }
+    with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+    # Swap the new index in place of the old one
+    old_path = f'{path}.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    return meta
+
+
+# Check if an index has been written
+def search_index_exists(path=SEARCH_INDEX_DIR):
+    return os.path.exists(os.path.join(path, META_FILE))
+
+
+# Split a query into OR groups of AND terms: 'covid mask OR #maga' -> [['covid', 'mask'], ['#maga']]
+def parse_query(query):
+    groups = []
+    for group in f' {query.lower()} '.split(' or '):
+        terms = group.split()
+        if terms:
+            groups.append(terms)
+    return groups
+
+
+# Read an Arrow IPC file memory-mapped
+def _read_arrow(path):
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+class SearchIndex:
+    def __init__(self, path=SEARCH_INDEX_DIR):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+
+        # Packed posting lists and row columns are memory-mapped, only the term lookup is held in memory
+        self.postings = np.memmap(os.path.join(path, POSTINGS_FILE), dtype=np.uint8, mode='r') if self.meta['bytes'] else np.empty(0, dtype=np.uint8)
+        terms = _read_arrow(os.path.join(path, TERMS_FILE))
+        self.terms = pd.Index(terms.column('term').to_numpy(zero_copy_only=False))
+        self.offsets = terms.column('offset').to_numpy()
+        self.lengths = terms.column('length').to_numpy()
+        self.counts = terms.column('count').to_numpy()
+
+        self.rows = _read_arrow(os.path.join(path, ROWS_FILE))
+        candidates = self.rows.column('candidate').combine_chunks()
+        sentiments = self.rows.column('sentiment').combine_chunks()
+        self.candidate_labels = np.asarray(candidates.dictionary.to_pylist(), dtype=object)
+        self.candidate_codes = candidates.indices.to_numpy(zero_copy_only=False)
+        self.sentiment_labels = np.asarray(sentiments.dictionary.to_pylist(), dtype=object)
+        self.sentiment_codes = sentiments.indices.to_numpy(zero_copy_only=False)
+        self.day = self.rows.column('day').to_numpy()
+        self.polarity = self.rows.column('polarity').to_numpy()
+        self.is_representative = self.rows.column('is_representative').to_numpy(zero_copy_only=False)
+
+    def __len__(self):
+        return self.meta['rows']
+
+    # Sorted row ids of the tweets containing a term (empty for unknown terms)
+    def posting_list(self, term):
+        position = self.terms.get_indexer([term])[0]
+        if position < 0:
+            return np.empty(0, dtype=np.int64)
+        offset = self.offsets[position]
+        return np.cumsum(decode_varints(self.postings[offset:offset + self.lengths[position]]))
+
+    # Number of tweets containing a term
+    def document_frequency(self, term):
+        position = self.terms.get_indexer([term])[0]
+        return int(self.counts[position]) if position >= 0 else 0
+
+    # Rows matching every term of a group, intersecting the rarest posting lists first
+    def _match_all(self, terms):
+        result = None
+        for term in sorted(set(terms), key=self.document_frequency):
+            postings = self.posting_list(term)
+            result = postings if result is None else np.intersect1d(result, postings, assume_unique=True)
+            if not len(result):
+                break
+        return result if result is not None else np.empty(0, dtype=np.int64)
+
+    # Sorted row ids matching a query (OR groups of AND terms, see parse_query), candidates, sentiments,
+    # a date range (inclusive) and optionally only the representatives of the near-duplicate clusters
+    @timed()
+    def search(self, query, candidates=None, sentiments=None, start=None, end=None, representatives_only=False):
+        groups = parse_query(query) if isinstance(query, str) else query
+        matches = [self._match_all(terms) for terms in groups]
+        rows = np.unique(np.concatenate(matches)) if len(matches) > 1 else (matches[0] if matches else np.empty(0, dtype=np.int64))
+
+        # Filter the matching rows on the memory-mapped row columns
+        mask = np.ones(len(rows), dtype=bool)
+        if candidates is not None:
+            mask &= np.isin(self.candidate_labels, list(candidates))[self.candidate_codes[rows]]
+        if sentiments is not None:
+            mask &= np.isin(self.sentiment_labels, list(sentiments))[self.sentiment_codes[rows]]
+        if start is not None:
+            mask &= self.day[rows] >= date_to_day(start)
+        if end is not None:
+            mask &= self.day[rows] <= date_to_day(end)
+        if representatives_only:
+            mask &= self.is_representative[rows]
+        return rows[mask]
+
+    # Number of matching tweets per candidate
+    def candidate_counts(self, rows):
+        counts = np.bincount(self.candidate_codes[rows], minlength=len(self.candidate_labels))
+        return pd.Series(counts, index=self.candidate_labels, name='tweets')
+
+    # Tweets and polarity mean of the matching rows per day and candidate
+    def daily_polarity(self, rows):
+        daily = pd.DataFrame({
+            'day': self.day[rows],
+            'candidate': self.candidate_labels[self.candidate_codes[rows]],
+            'polarity': self.polarity[rows],
+        })
+        daily = daily.groupby(['day', 'candidate']).agg(tweets=('polarity', 'size'), polarity=('polarity', 'mean')).reset_index()
+        daily.insert(0, 'date', day_to_date(daily.pop('day').to_numpy()))
+        return daily
+
+    # Up to n matching tweets, picked at random (reproducible with the seed)
+    def sample(self, rows, n=10, seed=0):
+        if len(rows) > n:
+            rows = np.sort(np.random.default_rng(seed).choice(rows, n, replace=False))
+        sample = self.rows.take(pa.array(rows, type=pa.int64())).select(['candidate', 'sentiment', 'day', 'polarity', 'tweet']).to_pandas()
+        sample.insert(0, 'date', day_to_date(sample.pop('day').to_numpy()))
+        return sample
@@ -0,0 +1,160 @@
+# Columnar snapshot of the sentiment dataset
+#
+# The backend writes a typed, compressed Parquet file next to twitter_sentiment.csv
+# and the dashboard memory-maps it, reading only the columns it needs.
+#
+# The datasets can also be stored partitioned by date and candidate, as Hive-style directories
+# (date=2020-10-23/candidate=biden/part-0.parquet) with a JSON manifest of the partitions, so
+# loading a day or a date range only opens the files of the matching partitions. A dataset written
+# chunk by chunk has one part file per chunk in each partition.
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instrumentation import timed
+from schema import apply_schema
+
+SNAPSHOT_FILE = 'twitter_sentiment.parquet'
+PARTITIONS_DIR = 'twitter_sentiment_partitions'
+MANIFEST_FILE = 'manifest.json'
+
+# Partition directory of rows without a date
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+# Convert the sentiment DataFrame to the snapshot column types
+def to_snapshot_frame(df):
+    return apply_schema(df)
+
+
+# Write the snapshot (the int32 day key replaces created_at_date)
+@timed()
+def write_snapshot(df, path=SNAPSHOT_FILE, compression='zstd'):
+    table = pa.Table.from_pandas(to_snapshot_frame(df), preserve_index=False)
+
+    # Write to a temporary file first so readers never see a half-written snapshot
+    tmp_path = f'{path}.tmp'
+    pq.write_table(table, tmp_path, compression=compression)
+    os.replace(tmp_path, path)
+
+
+# Check if a snapshot has been written
+def snapshot_exists(path=SNAPSHOT_FILE):
+    return os.path.exists(path)
+
+
+# Read the snapshot, optionally restricted to a subset of columns
+@timed()
+def read_snapshot(path=SNAPSHOT_FILE, columns=None):
+    table = pq.read_table(path, columns=None if columns is None else list(columns), memory_map=True)
+    return table.to_pandas()
+
+
+# Write the dataset partitioned by date and candidate, with a manifest of the partitions
+def write_partitions(df, path=PARTITIONS_DIR, compression='zstd'):
+    return write_partition_chunks([df], path, compression)
+
+
+# Write DataFrame chunks (e.g. read from a CSV with chunksize) partitioned by date and candidate, one chunk
+# in memory at a time: every chunk adds a part file to each partition it has rows of
+@timed()
+def write_partition_chunks(chunks, path=PARTITIONS_DIR, compression='zstd'):
+    # Write to a temporary directory first so readers never see a half-written dataset
+    tmp_path = f'{path}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = []
+    partitions = []
+    for part, chunk in enumerate(chunks):
+        partition_df = to_snapshot_frame(chunk)
+        columns = columns or list(partition_df.columns)
+        dates = pd.to_datetime(partition_df['created_at'], errors='coerce').dt.strftime('%Y-%m-%d').fillna(NULL_PARTITION)
+        candidates = partition_df['candidate'].astype(str)
+
+        for (date, candidate), rows in partition_df.groupby([dates, candidates], sort=True).groups.items():
+            partition_path = os.path.join(f'date={date}', f'candidate={candidate}', f'part-{part}.parquet')
+            os.makedirs(os.path.join(tmp_path, os.path.dirname(partition_path)), exist_ok=True)
+
+            table = pa.Table.from_pandas(partition_df.loc[rows], preserve_index=False)
+            pq.write_table(table, os.path.join(tmp_path, partition_path), compression=compression)
+            partitions.append({
+                'date': None if date == NULL_PARTITION else date,
+                'candidate': candidate,
+                'path': partition_path,
+                'rows': table.num_rows,
+            })
+
+    # Parts of the same partition are listed next to each other
+    partitions.sort(key=lambda partition: (partition['date'] or NULL_PARTITION, partition['candidate']))
+    manifest = {'columns': columns, 'partitions': partitions}
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    # Swap the new dataset in place of the old one
+    old_path = f'{path}.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    return manifest
+
+
+# Check if a partitioned dataset has been written
+def partitions_exist(path=PARTITIONS_DIR):
+    return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+
+# Read the manifest of a partitioned dataset
+def read_manifest(path=PARTITIONS_DIR):
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+# Partitions of the manifest within a date range (inclusive) and a list of candidates
+def select_partitions(manifest, start=None, end=None, candidates=None):
+    start = None if start is None else pd.Timestamp(start).strftime('%Y-%m-%d')
+    end = None if end is None else pd.Timestamp(end).strftime('%Y-%m-%d')
+
+    selected = []
+    for partition in manifest['partitions']:
+        date = partition['date']
+        if (start is not None or end is not None) and date is None:
+            continue
+        if start is not None and date < start:
+            continue
+        if end is not None and date > end:
+            continue
+        if candidates is not None and partition['candidate'] not in candidates:
+            continue
+        selected.append(partition)
+    return selected
+
+
+# Read the rows of a date range (inclusive) and a list of candidates, opening only the matching partitions
+@timed()
+def read_partitions(path=PARTITIONS_DIR, start=None, end=None, candidates=None, columns=None):
+    manifest = read_manifest(path)
+    selected = select_partitions(manifest, start, end, candidates)
+
+    read_columns = None if columns is None else list(columns)
+
+    tables = [pq.read_table(os.path.join(path, partition['path']), columns=read_columns, memory_map=True)
+              for partition in selected]
+    if not tables and manifest['partitions']:
+        # No matching partition: an empty table with the schema of the dataset
+        schema = pq.read_schema(os.path.join(path, manifest['partitions'][0]['path']))
+        empty = schema.empty_table()
+        tables = [empty.select(read_columns) if read_columns is not None else empty]
+    if not tables:
+        return pd.DataFrame(columns=read_columns if read_columns is not None else manifest['columns'])
+
+    # Parts written from different chunks may differ in their column types (dictionary index and counter widths,
+    # all-null columns), which are promoted to a common type
+    return pa.concat_tables(tables, promote_options='permissive').to_pandas()
@@ -0,0 +1,163 @@
+# Multi-resolution time series of the tweet volume and polarity
+#
+# The tweets are rolled up per (minute, candidate), (hour, candidate) and (day, candidate) into
+# the tweet count and the sum and count of polarity. A chart picks the finest resolution whose
+# number of buckets over the visible time range stays under max_buckets, and downsamples the
+# series with Largest-Triangle-Three-Buckets (LTTB), which keeps the peaks and dips that a
+# plain average would flatten, so zooming into a debate night shows minutes while the whole
+# election week ships a few hundred points.
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from metrics_cube import REPRESENTATIVE_MEASURES
+
+TIMESERIES_FILE = 'twitter_timeseries.parquet'
+TIMESERIES_COLUMNS = ('created_at', 'candidate', 'polarity')
+
+# Resolutions from the finest to the coarsest, with their bucket lengths
+RESOLUTIONS = {
+    'minute': pd.Timedelta(minutes=1),
+    'hour': pd.Timedelta(hours=1),
+    'day': pd.Timedelta(days=1),
+}
+
+MEASURES = ['tweets', 'polarity_sum', 'polarity_count']
+
+# Most buckets a chart reads before downsampling, and most points it draws per series
+DEFAULT_MAX_BUCKETS = 5_000
+DEFAULT_MAX_POINTS = 1_000
+
+
+# Roll the tweets up per (resolution, time, candidate)
+@timed()
+def build_timeseries(df):
+    created_at = pd.to_datetime(df['created_at'], errors='coerce')
+    values = pd.DataFrame({
+        'candidate': df['candidate'].astype(str).to_numpy(),
+        'tweets': 1,
+        'polarity_sum': df['polarity'].astype('float64').to_numpy(),
+        'polarity_count': df['polarity'].notna().astype('int64').to_numpy(),
+    })
+
+    # The same measures over the representatives of the near-duplicate clusters only
+    if 'is_representative' in df:
+        representative = df['is_representative'].to_numpy(dtype=bool)
+        for measure in MEASURES:
+            values[REPRESENTATIVE_MEASURES[measure]] = values[measure].where(representative, 0)
+
+    # Roll up the minutes once, then the hours and days from the minutes
+    minutes = values.assign(time=created_at.dt.floor('min').to_numpy()).dropna(subset=['time'])
+    rollup = minutes.groupby(['time', 'candidate'], sort=True).sum().reset_index()
+
+    series = []
+    for resolution, length in RESOLUTIONS.items():
+        if resolution != 'minute':
+            rollup = rollup.assign(time=rollup['time'].dt.floor(length)).groupby(['time', 'candidate'], sort=True).sum().reset_index()
+        series.append(rollup.assign(resolution=resolution))
+
+    series = pd.concat(series, ignore_index=True)
+    series['resolution'] = pd.Categorical(series['resolution'], categories=list(RESOLUTIONS))
+    series['candidate'] = series['candidate'].astype('category')
+    return series[['resolution', 'time', 'candidate', *series.columns.difference(['resolution', 'time', 'candidate'], sort=False)]]
+
+
+# Write the time series to disk
+def write_timeseries(series, path=TIMESERIES_FILE):
+    tmp_path = f'{path}.tmp'
+    series.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+# Read the time series from disk
+def read_timeseries(path=TIMESERIES_FILE):
+    return pd.read_parquet(path)
+
+
+# Check if the time series have been written
+def timeseries_exists(path=TIMESERIES_FILE):
+    return os.path.exists(path)
+
+
+# Finest resolution with at most max_buckets buckets between start and end
+def choose_resolution(start, end, max_buckets=DEFAULT_MAX_BUCKETS):
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    for resolution, length in RESOLUTIONS.items():
+        if span / length <= max_buckets:
+            return resolution
+    return list(RESOLUTIONS)[-1]
+
+
+# Indices of the points kept by Largest-Triangle-Three-Buckets downsampling to n_out points
+#
+# The first and last points are kept. The other points are split into n_out - 2 buckets, and each
+# bucket keeps the point forming the largest triangle with the point kept in the previous bucket
+# and the average of the next bucket.
+def lttb_indices(x, y, n_out):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+
+    # Average point of every bucket (the last bucket's next neighbour is the last point)
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    means_x = np.append(sums_x / sizes, x[-1])
+    means_y = np.append(sums_y / sizes, y[-1])
+
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Twice the area of the triangles (previous kept point, candidate, next bucket average)
+        areas = np.abs((x[previous] - means_x[bucket + 1]) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (means_y[bucket + 1] - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+
+    return kept
+
+
+# LTTB downsampling of a series with a datetime index
+def lttb(series, n_out=DEFAULT_MAX_POINTS):
+    series = series.dropna()
+    x = series.index.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    return series.iloc[lttb_indices(x, series.to_numpy(), n_out)]
+
+
+# Tweet count ('tweets') or polarity mean ('polarity') of one candidate at a resolution over a time range,
+# downsampled to at most max_points points
+@timed()
+def query_series(series, candidate, measure, resolution, start=None, end=None, collapse_duplicates=False,
+                 max_points=DEFAULT_MAX_POINTS):
+    rows = (series['resolution'] == resolution) & (series['candidate'] == candidate)
+    if start is not None:
+        rows &= series['time'] >= pd.Timestamp(start)
+    if end is not None:
+        rows &= series['time'] <= pd.Timestamp(end)
+    rows = series[rows].set_index('time')
+
+    # Count each near-duplicate cluster once
+    column = {name: REPRESENTATIVE_MEASURES[name] if collapse_duplicates and REPRESENTATIVE_MEASURES[name] in series else name
+              for name in MEASURES}
+
+    if measure == 'tweets':
+        # Buckets without tweets count zero tweets
+        values = rows[column['tweets']].astype('float64')
+        if len(values):
+            grid = pd.date_range(values.index.min() if start is None else pd.Timestamp(start).ceil(RESOLUTIONS[resolution]),
+                                 values.index.max() if end is None else pd.Timestamp(end), freq=RESOLUTIONS[resolution])
+            values = values.reindex(grid, fill_value=0.0)
+    else:
+        counts = rows[column['polarity_count']]
+        values = (rows[column['polarity_sum']] / counts).where(counts > 0)
+
+    return lttb(values.rename(measure).rename_axis('time'), max_points)
@@ -0,0 +1,113 @@
+# Flat token layout for tweet_cleaned and hashtags
+#
+# A TokenTable holds every token of a text column as one int32 array of interned token ids
+# plus CSR-style row offsets: the tokens of row i are ids[offsets[i]:offsets[i + 1]].
+# Stop word filtering and word counts work on the token ids, without re-splitting the text.
+import numpy as np
+import pandas as pd
+
+
+class TokenTable:
+    def __init__(self, vocab, ids, offsets):
+        self.vocab = vocab
+        self.ids = ids
+        self.offsets = offsets
+
+    # Tokenize a text column (split on whitespace like str.split(), or on sep)
+    @classmethod
+    def from_texts(cls, texts, sep=None):
+        texts = pd.Series(texts).fillna('').astype(str).reset_index(drop=True)
+        split = texts.str.split(sep)
+
+        # One token per row of the exploded frame, indexed by the row it came from
+        tokens = split.explode()
+        tokens = tokens[tokens.notna() & (tokens != '')]
+        lengths = np.bincount(tokens.index.to_numpy(dtype=np.int64), minlength=len(texts))
+        tokens = tokens.to_numpy(dtype=object)
+
+        ids, vocab = pd.factorize(tokens)
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        return cls(np.asarray(vocab, dtype=object), ids.astype(np.int32), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # Number of tokens of every row
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    # Row index of every token
+    def row_ids(self):
+        return np.repeat(np.arange(len(self), dtype=np.int64), self.lengths())
+
+    # Ids of the given words that are in the vocabulary
+    def word_ids(self, words):
+        return np.flatnonzero(pd.Index(self.vocab).isin(list(words)))
+
+    # Keep only the tokens selected by a boolean mask over the flat token array
+    def _select(self, keep):
+        kept_before = np.zeros(len(keep) + 1, dtype=np.int64)
+        np.cumsum(keep, out=kept_before[1:])
+        return TokenTable(self.vocab, self.ids[keep], kept_before[self.offsets])
+
+    # Remove every token in words with a single vectorized isin on the token ids
+    def remove(self, words):
+        return self._select(~np.isin(self.ids, self.word_ids(words)))
+
+    # Map every vocabulary entry to zero or more new tokens (e.g. normalizing or splitting words),
+    # rewriting the token ids without touching the text
+    def split_vocab(self, func):
+        pieces = [func(word) for word in self.vocab]
+        piece_counts = np.array([len(piece) for piece in pieces], dtype=np.int64)
+        piece_offsets = np.zeros(len(pieces) + 1, dtype=np.int64)
+        np.cumsum(piece_counts, out=piece_offsets[1:])
+
+        flat_pieces = np.array([word for piece in pieces for word in piece], dtype=object)
+        piece_ids, vocab = pd.factorize(flat_pieces)
+
+        # Expand every token into the ids of its pieces
+        token_counts = piece_counts[self.ids]
+        token_ends = np.cumsum(token_counts)
+        within = np.arange(token_ends[-1] if len(token_ends) else 0) - np.repeat(token_ends - token_counts, token_counts)
+        ids = piece_ids[np.repeat(piece_offsets[self.ids], token_counts) + within]
+
+        ends_before = np.zeros(len(self.ids) + 1, dtype=np.int64)
+        ends_before[1:] = token_ends
+        return TokenTable(np.asarray(vocab, dtype=object), ids.astype(np.int32), ends_before[self.offsets])
+
+    # Keep only the given rows (a boolean mask or ascending row indices)
+    def take(self, rows):
+        rows = np.asarray(rows)
+        if rows.dtype != bool:
+            mask = np.zeros(len(self), dtype=bool)
+            mask[rows] = True
+            rows = mask
+
+        lengths = self.lengths()[rows]
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return TokenTable(self.vocab, self.ids[np.repeat(rows, self.lengths())], offsets)
+
+    # Count every token id, optionally only over a boolean mask of rows
+    def counts(self, rows=None):
+        if rows is None:
+            return np.bincount(self.ids, minlength=len(self.vocab))
+        token_mask = np.repeat(np.asarray(rows, dtype=bool), self.lengths())
+        return np.bincount(self.ids[token_mask], minlength=len(self.vocab))
+
+    # Rebuild the texts, joining the tokens of every row with a space
+    def to_strings(self):
+        tokens = self.vocab[self.ids].tolist()
+        offsets = self.offsets.tolist()
+        return [' '.join(tokens[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
+
+    # Save and load the table as a compressed .npz file
+    def save(self, path):
+        np.savez_compressed(path, vocab=self.vocab.astype(str), ids=self.ids, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['vocab'].astype(object), data['ids'], data['offsets'])
@@ -3,50 +3,163 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
-import matplotlib.pyplot as plt
+import pyarrow.parquet as pq
 from matplotlib.ticker import FuncFormatter
 import matplotlib.dates as mdates
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
-import io
-from datetime import datetime
-from wordcloud import WordCloud
-
-# Load dataset with caching
-@st.cache_data
-def load_data():
-    return pd.read_csv(r"C:\Users\User\iCloudDrive\Cursos\Data Circle\DataCircle_Twitter_Project\twitter_sentiment.csv", lineterminator='\n')
-
-# Load data
-twitter_df = load_data()
-
-# Clean column names
-twitter_df.columns = twitter_df.columns.str.replace('\r', '')
-
-# Convert created_at to datetime
-twitter_df['created_at'] = pd.to_datetime(twitter_df['created_at'], errors='coerce')
-
-# Create a column for 'created_at' with date only (without time info)
-twitter_df["created_at_date"] = twitter_df["created_at"].dt.date
-
-# Convert to datetime
-twitter_df["created_at_date"] = pd.to_datetime(twitter_df["created_at_date"])
+import json
+import os
+
+from schema import apply_schema
+from snapshot import SNAPSHOT_FILE, snapshot_exists, read_snapshot
+from metrics_cube import (
+    CUBE_FILE, CUBE_COLUMNS, metrics_cube_exists, read_metrics_cube, build_metrics_cube, collapse_near_duplicates,
+    candidate_totals, daily_tweet_counts, engagement_totals, state_tweet_counts, sentiment_counts, daily_polarity_means
+)
+from wordcloud_cache import cached_wordcloud, cached_wordcloud_from_csv
+from word_frequencies import (
+    WORD_FREQUENCIES_FILE, HASHTAG_FREQUENCIES_FILE, COLLAPSED_WORD_FREQUENCIES_FILE, COLLAPSED_HASHTAG_FREQUENCIES_FILE,
+    WORD_STOPWORDS, HASHTAG_STOPWORDS, WordFrequencies
+)
+from emoji_counts import EMOJI_COUNTS_FILE, emoji_counts_exists, read_emoji_counts, top_emojis
+from engagement_stats import (
+    ENGAGEMENT_SKETCH_FILE, ENGAGEMENT_MOMENTS_FILE, EngagementStats, engagement_stats_exists, read_engagement_stats
+)
+from search_index import SEARCH_INDEX_DIR, SearchIndex, search_index_exists
+from live_replay import LIVE_DIR, read_status
+from metrics_api import daily_series, extreme_polarity_date, polarity_difference
+from timeseries import (
+    TIMESERIES_FILE, TIMESERIES_COLUMNS, RESOLUTIONS, timeseries_exists, read_timeseries, build_timeseries, choose_resolution,
+    query_series
+)
+from data_server import SharedArrowStore, date_bounds, default_store_dir, select_tweets, to_frame
+import instrumentation
+from instrumentation import counted_cache, timed
+
+# Define custom colors for the candidates
+candidate_colors = {
+    'biden': 'blue',
+    'trump': 'red'
+}
+
+# State abbreviation dictionary for conversion
+state_abbreviations = {
+    'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR', 'California': 'CA',
+    'Colorado': 'CO', 'Connecticut': 'CT', 'Delaware': 'DE', 'Florida': 'FL', 'Georgia': 'GA',
+    'Hawaii': 'HI', 'Idaho': 'ID', 'Illinois': 'IL', 'Indiana': 'IN', 'Iowa': 'IA', 'Kansas': 'KS',
+    'Kentucky': 'KY', 'Louisiana': 'LA', 'Maine': 'ME', 'Maryland': 'MD', 'Massachusetts': 'MA',
+    'Michigan': 'MI', 'Minnesota': 'MN', 'Mississippi': 'MS', 'Missouri': 'MO', 'Montana': 'MT',
+    'Nebraska': 'NE', 'Nevada': 'NV', 'New Hampshire': 'NH', 'New Jersey': 'NJ', 'New Mexico': 'NM',
+    'New York': 'NY', 'North Carolina': 'NC', 'North Dakota': 'ND', 'Ohio': 'OH', 'Oklahoma': 'OK',
+    'Oregon': 'OR', 'Pennsylvania': 'PA', 'Rhode Island': 'RI', 'South Carolina': 'SC', 'South Dakota': 'SD',
+    'Tennessee': 'TN', 'Texas': 'TX', 'Utah': 'UT', 'Vermont': 'VT', 'Virginia': 'VA', 'Washington': 'WA',
+    'West Virginia': 'WV', 'Wisconsin': 'WI', 'Wyoming': 'WY'
+    }
 
-# Create a Dataframe for Biden and Trump separately
-biden_df = twitter_df[twitter_df['candidate'] == 'biden']
-trump_df = twitter_df[twitter_df['candidate'] == 'trump']
+# Shared-memory Arrow store of the dataset and the aggregates, built once per host and mapped by every server process
+@st.cache_resource
+def data_store():
+    return SharedArrowStore(default_store_dir())
+
+# Sentiment CSV written by the backend, read when there is no snapshot
+SENTIMENT_CSV_FILE = r"C:\Users\User\iCloudDrive\Cursos\Data Circle\DataCircle_Twitter_Project\twitter_sentiment.csv"
+
+# Columns of the tweet data used by the dashboard
+TWEET_COLUMNS = ['created_at', 'day', 'candidate', 'state', 'country', 'sentiment', 'likes', 'retweet_count', 'polarity',
+                 'is_representative']
+
+# Read the tweet data from the snapshot or the CSV (only run when the shared store builds its tweet table)
+def read_tweet_data():
+    # Read the columnar snapshot when the backend has written one
+    if snapshot_exists(SNAPSHOT_FILE):
+        snapshot_columns = set(pq.read_schema(SNAPSHOT_FILE).names)
+        return read_snapshot(SNAPSHOT_FILE, columns=[column for column in TWEET_COLUMNS if column in snapshot_columns])
+
+    # Fall back to parsing the CSV
+    csv_columns = set(TWEET_COLUMNS) - {'day'}
+    usecols = lambda column: column.replace('\r', '') in csv_columns
+    df = pd.read_csv(SENTIMENT_CSV_FILE, lineterminator='\n', usecols=usecols)
+
+    # Convert to the compact column types (derives the day key from created_at)
+    return apply_schema(df)
+
+# Tweet data as a table mapped from the shared store
+@counted_cache(st.cache_resource)
+def load_tweet_table():
+    return data_store().table('tweets', [SNAPSHOT_FILE, SENTIMENT_CSV_FILE], read_tweet_data)
+
+# Load dataset columns (numeric columns are views of the shared store)
+def load_data(columns=None):
+    return to_frame(load_tweet_table(), columns)
+
+# Load the metrics cube from the shared store
+@counted_cache(st.cache_resource)
+def load_cube(collapse_duplicates=False):
+    # Map the cube written by the backend, or the cube built from the tweet data
+    cube = to_frame(data_store().table(
+        'metrics_cube', [CUBE_FILE, SNAPSHOT_FILE, SENTIMENT_CSV_FILE],
+        lambda: read_metrics_cube(CUBE_FILE) if metrics_cube_exists(CUBE_FILE) else build_metrics_cube(load_data(CUBE_COLUMNS))
+    ))
 
-# Create tabs
-tab1, tab2, tab3 = st.tabs(["Exploratory Data Analysis", "Sentiment Analysis", "WordCloud Analysis"])
+    # Count each near-duplicate cluster once
+    return collapse_near_duplicates(cube) if collapse_duplicates else cube
+
+# Load the minute, hour and day rollups of the tweet counts and polarity from the shared store
+@counted_cache(st.cache_resource)
+def load_timeseries():
+    # Map the rollups written by the backend, or the rollups built from the tweet data
+    columns = [column for column in [*TIMESERIES_COLUMNS, 'is_representative'] if column in load_tweet_table().column_names]
+    return to_frame(data_store().table(
+        'timeseries', [TIMESERIES_FILE, SNAPSHOT_FILE, SENTIMENT_CSV_FILE],
+        lambda: read_timeseries(TIMESERIES_FILE) if timeseries_exists(TIMESERIES_FILE) else build_timeseries(load_data(columns))
+    ))
 
-# Create variables for KPIs
-biden_tweet_count = twitter_df[twitter_df['candidate']=='biden']['candidate'].count()
-trump_tweet_count = twitter_df[twitter_df['candidate']=='trump']['candidate'].count()
-biden_total_likes = twitter_df[twitter_df['candidate']=='biden']['likes'].sum()
-trump_total_likes = twitter_df[twitter_df['candidate']=='trump']['likes'].sum()
+# Load the tweets of a date range, filtered on the shared tweet table
+@counted_cache(st.cache_data)
+def load_date_range(start_date, end_date, candidates, columns):
+    return select_tweets(load_tweet_table(), start=start_date, end=end_date, candidates=candidates, columns=columns)
+
+# Load the per-(date, candidate) emoji counts written by the backend, from the shared store
+@counted_cache(st.cache_resource)
+def load_emoji_counts():
+    if not emoji_counts_exists(EMOJI_COUNTS_FILE):
+        return None
+    return to_frame(data_store().table('emoji_counts', [EMOJI_COUNTS_FILE], lambda: read_emoji_counts(EMOJI_COUNTS_FILE)))
+
+# Load the per-(date, candidate) engagement sketches written by the backend, or summarize the tweet data
+@counted_cache(st.cache_resource)
+def load_engagement_stats():
+    if engagement_stats_exists(ENGAGEMENT_SKETCH_FILE, ENGAGEMENT_MOMENTS_FILE):
+        return read_engagement_stats(ENGAGEMENT_SKETCH_FILE, ENGAGEMENT_MOMENTS_FILE)
+    return EngagementStats.from_frame(load_data(('created_at', 'candidate', 'likes', 'retweet_count')))
+
+# Load the inverted index of the words and hashtags written by the backend (memory-mapped)
+@counted_cache(st.cache_resource)
+def load_search_index():
+    return SearchIndex(SEARCH_INDEX_DIR) if search_index_exists(SEARCH_INDEX_DIR) else None
+
+# Load the word and hashtag frequency engines written by the backend
+@counted_cache(st.cache_resource)
+def load_word_frequencies(path):
+    return WordFrequencies.load(path) if os.path.exists(path) else None
+
+
+# The dashboard is split into sections. Figures are built by cached functions whose arguments are
+# the widget values they depend on, and sections holding widgets are fragments, so a widget change
+# reruns only its own section.
+
+
+# KPIs
+@timed()
+def kpis_section():
+    # Create variables for KPIs
+    totals = candidate_totals(load_cube(collapse_duplicates))
+    biden_tweet_count = totals.loc['biden', 'tweets']
+    trump_tweet_count = totals.loc['trump', 'tweets']
+    biden_total_likes = totals.loc['biden', 'likes']
+    trump_total_likes = totals.loc['trump', 'likes']
 
-# Visualizations in tab 1
-with tab1:
     # Create columns for KPIs
     col1, col2 = st.columns(2)
     with col1:
@@ -60,32 +173,45 @@ with tab1:
         st.metric(label=r"Trump's total likes:", value=f"{trump_total_likes:,}")
 
 
-    # Visualization 1: Total Tweets by Candidate
-    
-    # Header
-    st.header("Total Tweets per Day by Candidate")
+# Time range and resolution widgets of a time series chart; 'Auto' picks the finest resolution that fits the range
+def timeseries_controls(key):
+    times = load_timeseries()['time']
+    if times.empty:
+        return None
+    first_time, last_time = times.min().to_pydatetime(), times.max().to_pydatetime()
 
-    # Group by date and candidate to get the count of tweets per day
-    daily_tweets = (twitter_df.groupby([pd.Grouper(key='created_at', freq='D'), 'candidate']).size().reset_index(name='count'))
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        start_time, end_time = st.slider("Select a time range:", min_value=first_time, max_value=last_time, value=(first_time, last_time),
+                                         step=pd.Timedelta(hours=1).to_pytimedelta(), format="YYYY-MM-DD HH:mm", key=f'{key}_range')
+    with col2:
+        resolution = st.selectbox("Resolution:", options=['auto', *RESOLUTIONS], format_func=str.capitalize, key=f'{key}_resolution')
 
-    # Rename columns for clarity
-    daily_tweets.rename(columns={'created_at': 'date'}, inplace=True)
+    if resolution == 'auto':
+        resolution = choose_resolution(start_time, end_time)
+    return start_time, end_time, resolution
 
-    # Define custom colors for the candidates
-    candidate_colors = {
-        'biden': 'blue',
-        'trump': 'red'
-    }
+
+# Visualization 1: Total Tweets by Candidate
+@counted_cache(st.cache_data)
+def daily_tweets_figure(collapse_duplicates, start_time=None, end_time=None, resolution='day'):
+    # Count of tweets per bucket and candidate, downsampled for drawing
+    series = load_timeseries()
+    daily_tweets = pd.concat([
+        query_series(series, candidate, 'tweets', resolution, start_time, end_time, collapse_duplicates)
+        .rename('count').reset_index().assign(candidate=candidate)
+        for candidate in ['biden', 'trump']
+    ], ignore_index=True)
 
     # Create the Plotly line chart
     fig = px.line(
         daily_tweets,
-        x='date',
+        x='time',
         y='count',
         color='candidate',
-        markers=True,
-        title="Daily Tweets Count by Candidate",
-        labels={'date': 'Date', 'count': 'Number of Tweets'},
+        markers=resolution == 'day',
+        title=f"Tweets Count per {resolution.capitalize()} by Candidate",
+        labels={'time': 'Date', 'count': 'Number of Tweets'},
         color_discrete_map=candidate_colors  # Apply custom colors
     )
 
@@ -96,23 +222,36 @@ with tab1:
     fig.update_layout(
         title_font_size=20,
         xaxis_title="Date",
-        yaxis_title="Number of Tweets",
+        yaxis_title=f"Number of Tweets per {resolution.capitalize()}",
         xaxis=dict(showgrid=True),
         yaxis=dict(showgrid=True, tickformat=','),
         legend_title="Candidate",
         legend=dict(font=dict(size=12)),
     )
 
-    # Display the chart in Streamlit
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
 
-    # Visualization 2: Tweet Engagement (Likes and Retweets)
 
-    # Plotting
-    st.header("Tweet Engagement (Likes and Retweets)")
+@st.fragment
+@timed()
+def daily_tweets_section():
+    # Header
+    st.header("Total Tweets over Time by Candidate")
+
+    # Visible time range and resolution
+    controls = timeseries_controls('volume')
+    if controls is None:
+        return
+
+    # Display the chart in Streamlit
+    st.plotly_chart(daily_tweets_figure(collapse_duplicates, *controls), width='stretch')
+
 
-    # Group by candidate to get total likes and retweets
-    engagement_data = twitter_df.groupby('candidate').agg({'likes': 'sum', 'retweet_count': 'sum'}).reset_index()
+# Visualization 2: Tweet Engagement (Likes and Retweets)
+@counted_cache(st.cache_data)
+def engagement_figure(collapse_duplicates):
+    # Roll up the cube by candidate to get total likes and retweets
+    engagement_data = engagement_totals(load_cube(collapse_duplicates))
 
     # Capitalize the candidate names for x-axis labels
     engagement_data['candidate'] = engagement_data['candidate'].str.capitalize()
@@ -128,48 +267,105 @@ with tab1:
         color_discrete_sequence=['royalblue', 'darkblue']
     )
 
+    return fig
+
+
+@timed()
+def engagement_section():
+    # Plotting
+    st.header("Tweet Engagement (Likes and Retweets)")
+
     # Display the plot in Streamlit
-    st.plotly_chart(fig)
+    st.plotly_chart(engagement_figure(collapse_duplicates))
 
 
-# Visualization 3: Geoplot
+# Engagement measures of the distribution section
+engagement_measures = {'Likes': 'likes', 'Retweets': 'retweet_count'}
 
-    # State abbreviation dictionary for conversion
-    state_abbreviations = {
-        'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR', 'California': 'CA',
-        'Colorado': 'CO', 'Connecticut': 'CT', 'Delaware': 'DE', 'Florida': 'FL', 'Georgia': 'GA',
-        'Hawaii': 'HI', 'Idaho': 'ID', 'Illinois': 'IL', 'Indiana': 'IN', 'Iowa': 'IA', 'Kansas': 'KS',
-        'Kentucky': 'KY', 'Louisiana': 'LA', 'Maine': 'ME', 'Maryland': 'MD', 'Massachusetts': 'MA',
-        'Michigan': 'MI', 'Minnesota': 'MN', 'Mississippi': 'MS', 'Missouri': 'MO', 'Montana': 'MT',
-        'Nebraska': 'NE', 'Nevada': 'NV', 'New Hampshire': 'NH', 'New Jersey': 'NJ', 'New Mexico': 'NM',
-        'New York': 'NY', 'North Carolina': 'NC', 'North Dakota': 'ND', 'Ohio': 'OH', 'Oklahoma': 'OK',
-        'Oregon': 'OR', 'Pennsylvania': 'PA', 'Rhode Island': 'RI', 'South Carolina': 'SC', 'South Dakota': 'SD',
-        'Tennessee': 'TN', 'Texas': 'TX', 'Utah': 'UT', 'Vermont': 'VT', 'Virginia': 'VA', 'Washington': 'WA',
-        'West Virginia': 'WV', 'Wisconsin': 'WI', 'Wyoming': 'WY'
-        }
-
-    # Filter tweets for U.S.
-    us_tweets = twitter_df[twitter_df['country'].str.strip().str.lower() == 'united states']
 
-    # Ensure states have consistent capitalization and convert full names to abbreviations
-    us_tweets['state'] = us_tweets['state'].str.title()
-    us_tweets['state'] = us_tweets['state'].map(state_abbreviations)  # Convert to abbreviations
+# Visualization 9: Engagement Distribution, from the quantile sketches and moments only
+@counted_cache(st.cache_data)
+def engagement_distribution_figure(measure, start_date, end_date, factor):
+    stats = load_engagement_stats()
 
-    # Drop any rows where state conversion failed (NaN in 'state' column)
-    us_tweets = us_tweets.dropna(subset=['state'])
+    # Daily median, 90th and 99th percentiles and upper outlier threshold of every candidate
+    quantiles = stats.quantiles(measure, q=(0.5, 0.9, 0.99), by=['date', 'candidate'], start=start_date, end=end_date)
+    quantiles.columns = ['Median', '90th percentile', '99th percentile']
+    quantiles['Upper outlier threshold'] = stats.outlier_thresholds(measure, factor, by=['date', 'candidate'],
+                                                                    start=start_date, end=end_date)['upper']
+    daily = quantiles.rename_axis(columns='statistic').stack().reset_index(name='value')
+    daily['candidate'] = daily['candidate'].astype(str)
+
+    # Create the Plotly line chart
+    fig = px.line(
+        daily,
+        x='date',
+        y='value',
+        color='candidate',
+        line_dash='statistic',
+        title=f"Daily {measure.replace('_', ' ').title()} Distribution by Candidate",
+        labels={'date': 'Date', 'value': 'Value', 'statistic': 'Statistic'},
+        color_discrete_map=candidate_colors  # Apply custom colors
+    )
+    fig.update_layout(yaxis=dict(showgrid=True, tickformat=','), legend_title="Candidate, Statistic")
 
-    # Group by state and candidate to calculate tweet counts
-    tweets_by_state_and_candidate = us_tweets.groupby(['state', 'candidate']).size().reset_index(name='Tweet Count')
+    return fig
 
-    # Add a dropdown filter for candidate selection
-    candidate = st.selectbox("Select a candidate:", options=['Trump', 'Biden'])
+
+# Quantiles, moments and IQR outliers of every candidate over a date range
+@counted_cache(st.cache_data)
+def engagement_summary(measure, start_date, end_date, factor):
+    stats = load_engagement_stats()
+
+    summary = pd.concat([
+        stats.statistics(measure, by=['candidate'], start=start_date, end=end_date),
+        stats.quantiles(measure, by=['candidate'], start=start_date, end=end_date).rename(columns=lambda q: f'p{q * 100:g}'),
+        stats.outlier_thresholds(measure, factor, by=['candidate'], start=start_date, end=end_date)[['lower', 'upper', 'outliers']],
+    ], axis=1)
+    summary.index = summary.index.astype(str).str.capitalize()
+    return summary.rename_axis('Candidate')
+
+
+@st.fragment
+@timed()
+def engagement_distribution_section():
+    st.header("Engagement Distribution and Outliers")
+
+    stats = load_engagement_stats()
+    if not len(stats.moments):
+        st.info("Run the sentiment backend to create the engagement statistics.")
+        return
+
+    # Engagement type, date range and IQR factor filters
+    measure = engagement_measures[st.radio("Engagement type:", options=list(engagement_measures), horizontal=True, key='engagement_measure')]
+    first_date = stats.moments['date'].min().date()
+    last_date = stats.moments['date'].max().date()
+    date_range = st.date_input("Select the engagement date range:", value=(first_date, last_date), min_value=first_date, max_value=last_date, key='engagement_date_range')
+    start_date, end_date = (date_range[0], date_range[-1]) if isinstance(date_range, (list, tuple)) else (date_range, date_range)
+    factor = st.slider("IQR factor of the outlier thresholds:", min_value=1.0, max_value=5.0, value=3.0, step=0.5, key='engagement_iqr_factor')
+
+    # Display the chart and the summary table
+    st.plotly_chart(engagement_distribution_figure(measure, start_date, end_date, factor), width='stretch')
+    st.dataframe(engagement_summary(measure, start_date, end_date, factor))
+
+
+# Visualization 3: Geoplot
+@counted_cache(st.cache_data)
+def geoplot_figure(candidate, collapse_duplicates):
+    # Roll up the cube by U.S. state and candidate to calculate tweet counts
+    tweets_by_state_and_candidate = state_tweet_counts(load_cube(collapse_duplicates))
+
+    # Ensure states have consistent capitalization and convert full names to abbreviations
+    tweets_by_state_and_candidate['state'] = tweets_by_state_and_candidate['state'].str.title()
+    tweets_by_state_and_candidate['state'] = tweets_by_state_and_candidate['state'].map(state_abbreviations)  # Convert to abbreviations
+
+    # Drop any rows where state conversion failed (NaN in 'state' column)
+    tweets_by_state_and_candidate = tweets_by_state_and_candidate.dropna(subset=['state'])
+    tweets_by_state_and_candidate = tweets_by_state_and_candidate.groupby(['state', 'candidate'], as_index=False)['Tweet Count'].sum()
 
     # Filter data for the selected candidate
     filtered_data_geo = tweets_by_state_and_candidate[tweets_by_state_and_candidate['candidate'].str.strip().str.lower() == candidate.lower()]
 
-    # Visualization 3: Geoplot
-    st.header("Tweets by States")
-
     # Create a choropleth map for tweet counts by state for the selected candidate
     fig_geo = px.choropleth(
         filtered_data_geo,
@@ -182,53 +378,136 @@ with tab1:
         labels={'state': 'State', 'Tweet Count': 'Number of Tweets'}
     )
 
-    # Display the map
-    st.plotly_chart(fig_geo)
+    return fig_geo
 
-    # Visualization 7: Emoji Analysis
-    st.header("Emoji Analysis")
 
-    # Function to load emoji data from CSV and get top 5 emojis with their percentages
-    def load_top_emojis(csv_file):
-        df = pd.read_csv(csv_file)
-        total_frequency = df['Frequency'].sum()  # Calculate total frequency
-        df['Percentage'] = (df['Frequency'] / total_frequency) * 100  # Calculate percentage
-        top_emojis = df.nlargest(5, 'Frequency')  # Get top 5 emojis
-        return top_emojis
+# Function to load emoji data from CSV and get top 5 emojis with their percentages
+def load_top_emojis(csv_file):
+    df = pd.read_csv(csv_file)
+    total_frequency = df['Frequency'].sum()  # Calculate total frequency
+    df['Percentage'] = (df['Frequency'] / total_frequency) * 100  # Calculate percentage
+    top_emojis = df.nlargest(5, 'Frequency')  # Get top 5 emojis
+    return top_emojis
 
-    # Load the appropriate emoji data for the selected candidate
-    emoji_file = 'biden_emojis.csv' if candidate.lower() == 'biden' else 'trump_emojis.csv'
-    emojis = load_top_emojis(emoji_file)
+
+# Visualization 7: Emoji Analysis
+@counted_cache(st.cache_data)
+def emoji_figure(candidate, start_date=None, end_date=None):
+    emoji_counts = load_emoji_counts()
+
+    if emoji_counts is None:
+        # Load the appropriate emoji data for the selected candidate
+        emoji_file = 'biden_emojis.csv' if candidate.lower() == 'biden' else 'trump_emojis.csv'
+        emojis = load_top_emojis(emoji_file)
+    else:
+        # Top 5 emojis of the selected candidate over the selected dates, as a percentage of all their emojis
+        all_emojis = top_emojis(emoji_counts, candidate.lower(), start=start_date, end=end_date, n=None)
+        emojis = all_emojis.head(5).copy()
+        emojis['Percentage'] = (emojis['Frequency'] / all_emojis['Frequency'].sum()) * 100
 
     # Create a bar chart for the selected candidate
     fig_emojis = px.bar(
-        emojis, 
-        x='Emoji', 
-        y='Percentage', 
+        emojis,
+        x='Emoji',
+        y='Percentage',
         title=f'Top 5 Emojis for {candidate} (by Percentage)',
         labels={'Emoji': 'Emoji', 'Percentage': 'Percentage (%)'},
         color_discrete_sequence=['blue'] if candidate.lower() == 'biden' else ['red']
     )
 
     # Dynamically adjust y-axis range based on data
-    fig_emojis.update_yaxes(range=[0, emojis['Percentage'].max() + 5])
+    fig_emojis.update_yaxes(range=[0, (emojis['Percentage'].max() if len(emojis) else 0) + 5])
+
+    return fig_emojis
+
+
+# Geoplot and Emoji Analysis depend on the selected candidate
+@st.fragment
+@timed()
+def candidate_section():
+    # Add a dropdown filter for candidate selection
+    candidate = st.selectbox("Select a candidate:", options=['Trump', 'Biden'])
+
+    # Visualization 3: Geoplot
+    st.header("Tweets by States")
+
+    # Display the map
+    st.plotly_chart(geoplot_figure(candidate, collapse_duplicates))
+
+    # Visualization 7: Emoji Analysis
+    st.header("Emoji Analysis")
+
+    # Date range filter for the emoji counts
+    start_date, end_date = None, None
+    emoji_counts = load_emoji_counts()
+    if emoji_counts is not None and len(emoji_counts):
+        first_date = emoji_counts['date'].min().date()
+        last_date = emoji_counts['date'].max().date()
+        date_range = st.date_input("Select the emoji date range:", value=(first_date, last_date), min_value=first_date, max_value=last_date)
+        start_date, end_date = (date_range[0], date_range[-1]) if isinstance(date_range, (list, tuple)) else (date_range, date_range)
 
     # Display the emoji bar chart
-    st.plotly_chart(fig_emojis)
+    st.plotly_chart(emoji_figure(candidate, start_date, end_date))
+
+
+# Visualization 8: Tweets in a Date Range, filtered on the shared tweet table
+@counted_cache(st.cache_data)
+def date_range_figure(start_date, end_date, candidates, collapse_duplicates):
+    # Keep only the representatives of the near-duplicate clusters when collapsing
+    if collapse_duplicates and 'is_representative' in load_tweet_table().column_names:
+        tweets = load_date_range(start_date, end_date, tuple(candidates), ('created_at', 'candidate', 'is_representative'))
+        tweets = tweets[tweets['is_representative']]
+    else:
+        tweets = load_date_range(start_date, end_date, tuple(candidates), ('created_at', 'candidate'))
+
+    # Count the tweets of each hour
+    hourly_tweets = (
+        tweets.assign(hour=tweets['created_at'].dt.floor('h'), candidate=tweets['candidate'].astype(str))
+        .groupby(['hour', 'candidate']).size().reset_index(name='count')
+    )
 
-# Visualizations in tab 2
-with tab2:
-    # Visualization 4: Sentiment Analysis
+    # Create the Plotly line chart
+    fig = px.line(
+        hourly_tweets,
+        x='hour',
+        y='count',
+        color='candidate',
+        title="Hourly Tweets Count by Candidate",
+        labels={'hour': 'Hour', 'count': 'Number of Tweets'},
+        color_discrete_map=candidate_colors  # Apply custom colors
+    )
 
-    # Create pie charts
-    st.header("Sentiment Analysis by Candidate")
+    # Capitalize legend labels
+    fig.for_each_trace(lambda trace: trace.update(name=trace.name.capitalize()))
+
+    return fig
+
+
+@st.fragment
+@timed()
+def date_range_section():
+    st.header("Tweets in a Date Range")
 
-    # Group by sentiment for each candidate
-    biden_sentiment_counts = biden_df['sentiment'].value_counts().reset_index()
-    biden_sentiment_counts.columns = ['Sentiment', 'Count']
+    # Date range and candidate filters, bounded by the dates of the tweets
+    bounds = date_bounds(load_tweet_table())
+    if bounds is None:
+        return
+    first_date, last_date = bounds
+    date_range = st.date_input("Select a date range:", value=(last_date, last_date), min_value=first_date, max_value=last_date, key='tweets_date_range')
+    start_date, end_date = (date_range[0], date_range[-1]) if isinstance(date_range, (list, tuple)) else (date_range, date_range)
+    candidates = st.multiselect("Select candidates:", options=['biden', 'trump'], default=['biden', 'trump'], format_func=str.capitalize)
 
-    trump_sentiment_counts = trump_df['sentiment'].value_counts().reset_index()
-    trump_sentiment_counts.columns = ['Sentiment', 'Count']
+    # Display the chart in Streamlit
+    st.plotly_chart(date_range_figure(start_date, end_date, candidates, collapse_duplicates), width='stretch')
+
+
+# Visualization 4: Sentiment Analysis
+@counted_cache(st.cache_data)
+def sentiment_pie_figures(collapse_duplicates):
+    # Roll up the cube by sentiment for each candidate
+    metrics_cube = load_cube(collapse_duplicates)
+    biden_sentiment_counts = sentiment_counts(metrics_cube, 'biden')
+    trump_sentiment_counts = sentiment_counts(metrics_cube, 'trump')
 
     # Plot for Biden
     fig_biden = px.pie(
@@ -248,25 +527,37 @@ with tab2:
         color_discrete_sequence=['#ffeb3b', '#4caf50', '#f44336']  # Colors: yellow, green, red
     )
 
+    return fig_biden, fig_trump
+
+
+@timed()
+def sentiment_pies_section():
+    # Create pie charts
+    st.header("Sentiment Analysis by Candidate")
+
+    fig_biden, fig_trump = sentiment_pie_figures(collapse_duplicates)
+
     # Display the plots side by side
     col1, col2 = st.columns(2)
     with col1:
-        st.plotly_chart(fig_biden, use_container_width=True)
+        st.plotly_chart(fig_biden, width='stretch')
     with col2:
-        st.plotly_chart(fig_trump, use_container_width=True)
-
+        st.plotly_chart(fig_trump, width='stretch')
 
-    # Visualization 5: Sentiment Trends Over Time 
 
-    # Biden's Polarity Sentiment Means Over Time
-    biden_sentiment_means = biden_df.groupby('created_at_date')['polarity'].mean()
+# Daily polarity sums of both candidates, aligned on the date
+@counted_cache(st.cache_data)
+def load_daily_series(collapse_duplicates):
+    return daily_series(load_cube(collapse_duplicates), candidates=['biden', 'trump'])
 
-    # Trump's Polarity Sentiment Means Over Time
-    trump_sentiment_means = trump_df.groupby('created_at_date')['polarity'].mean()
 
-    # Ensure datetime index for plotting
-    biden_sentiment_means.index = pd.to_datetime(biden_sentiment_means.index)
-    trump_sentiment_means.index = pd.to_datetime(trump_sentiment_means.index)
+# Visualization 5: Sentiment Trends Over Time
+@counted_cache(st.cache_data)
+def polarity_means_figure(collapse_duplicates, start_time=None, end_time=None, resolution='day'):
+    # Polarity means per bucket of both candidates, downsampled for drawing
+    series = load_timeseries()
+    biden_sentiment_means = query_series(series, 'biden', 'polarity', resolution, start_time, end_time, collapse_duplicates)
+    trump_sentiment_means = query_series(series, 'trump', 'polarity', resolution, start_time, end_time, collapse_duplicates)
 
     # Create a figure
     fig = go.Figure()
@@ -289,45 +580,66 @@ with tab2:
         line=dict(color='red')
     ))
 
-    # Update layout
+    # Update layout (minute and hour means are noisier than the daily range)
     fig.update_layout(
         title='Sentiment Polarity Means Over Time',
-        xaxis=dict(title='Date', tickformat='%Y-%m-%d'),
-        yaxis=dict(title='Polarity Mean', range=[0, 0.15]),
+        xaxis=dict(title='Date', tickformat='%Y-%m-%d' if resolution == 'day' else '%Y-%m-%d %H:%M'),
+        yaxis=dict(title='Polarity Mean', range=[0, 0.15] if resolution == 'day' else None),
         height=500,
         legend=dict(title='Legend'),
         template='plotly_white'
     )
 
-    # Show the plot in Streamlit
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
+
 
+@st.fragment
+@timed()
+def polarity_means_section():
+    # Visible time range and resolution
+    controls = timeseries_controls('polarity')
+    if controls is None:
+        return
 
-    # Visualization 6: Polarity Difference Over Time 
-    # Convert trumps daily means to a dataframe
-    trump_daily_means_df = pd.DataFrame(trump_sentiment_means).reset_index()
+    # Show the plot in Streamlit
+    st.plotly_chart(polarity_means_figure(collapse_duplicates, *controls), width='stretch')
 
-    # Convert Bidens daily means to a dataframe
-    biden_daily_means_df = pd.DataFrame(biden_sentiment_means).reset_index()
 
-    # Convert the difference between both candidates daily means to a dataframe
-    diff_daily_means_df = pd.DataFrame(
-        {
-        'Date': trump_daily_means_df['created_at_date'], 
-        'Difference': biden_daily_means_df['polarity'] - trump_daily_means_df['polarity']
-        }
-        )
-    
-    # Ensure that the 'Date' column in diff_daily_means_df is in datetime format
-    diff_daily_means_df['Date'] = pd.to_datetime(diff_daily_means_df['Date'])
+# Visualization 6: Polarity Difference Over Time
+@counted_cache(st.cache_data)
+def polarity_difference_figure(collapse_duplicates, window=1):
+    # Difference between both candidates daily (or rolling) means, aligned on the date, with its 95% confidence interval
+    series = load_daily_series(collapse_duplicates)
+    if not {'biden', 'trump'} <= set(series.columns.get_level_values('candidate')):
+        return None
+    diff_daily_means_df = polarity_difference(series, 'biden', 'trump', window=window if window > 1 else None)
 
     # Plot with Plotly
     fig = go.Figure()
 
+    # Add the confidence band (upper bound, then the lower bound filled up to it)
+    fig.add_trace(go.Scatter(
+        x=diff_daily_means_df.index,
+        y=diff_daily_means_df['upper'],
+        mode='lines',
+        line=dict(width=0),
+        showlegend=False,
+        hoverinfo='skip'
+    ))
+    fig.add_trace(go.Scatter(
+        x=diff_daily_means_df.index,
+        y=diff_daily_means_df['lower'],
+        mode='lines',
+        line=dict(width=0),
+        fill='tonexty',
+        fillcolor='rgba(128, 128, 128, 0.3)',
+        name='95% Confidence Interval'
+    ))
+
     # Add the main line for sentiment polarity difference
     fig.add_trace(go.Scatter(
-        x=diff_daily_means_df['Date'],
-        y=diff_daily_means_df['Difference'],
+        x=diff_daily_means_df.index,
+        y=diff_daily_means_df['difference'],
         mode='lines',
         line=dict(color='white'),
         name='Difference in Sentiment Polarity'
@@ -337,328 +649,343 @@ with tab2:
     fig.update_layout(
         title='Sentiment Polarity Means Difference Over Time',
         xaxis_title='Date',
-        yaxis_title='Polarity Difference',
-        yaxis=dict(range=[0, 0.1], tick0=0, dtick=0.05),
+        yaxis_title='Polarity Difference (Biden - Trump)',
+        yaxis=dict(tick0=0, dtick=0.05),
         xaxis=dict(tickformat='%Y-%m-%d'
         ),
         legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='right', x=1)
     )
 
-    # Display the Plotly chart in Streamlit
-    st.plotly_chart(fig)
-
-# Visualization 6: Word Clouds
-
-with tab3:
-    # Function to generate word cloud from CSV
-    def generate_wordcloud(csv_file):
-        # Read the CSV file
-        df = pd.read_csv(csv_file)
-        
-        # Create a dictionary from the DataFrame
-        word_freq = dict(zip(df['Word'], df['Frequency']))
-        
-        # Generate the word cloud
-        wordcloud = WordCloud(width=800, height=400, background_color='white').generate_from_frequencies(word_freq)
-        
-        return wordcloud
-
-
-    # Whole Period Word Cloud
-    st.subheader("Whole Period")
-
-    # Generate word clouds for both candidates
-    biden_positive_wordcloud = generate_wordcloud('biden_positive_wordcloud.csv')
-    biden_negative_wordcloud = generate_wordcloud('biden_negative_wordcloud.csv')
-    trump_positive_wordcloud = generate_wordcloud('trump_positive_wordcloud.csv')
-    trump_negative_wordcloud = generate_wordcloud('trump_negative_wordcloud.csv')
-
-    # Create side-by-side Positive word clouds
-    positive_fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
+    return fig
 
-    # Display Biden's word cloud
-    ax1.imshow(biden_positive_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Positive", fontsize=16)
 
-    # Display Trump's word cloud
-    ax2.imshow(trump_positive_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Positive", fontsize=16)
+@st.fragment
+@timed()
+def polarity_difference_section():
+    # Rolling window of the means (1 day shows the daily means)
+    window = st.select_slider("Rolling window (days):", options=[1, 3, 7, 14], value=1, key='polarity_difference_window')
 
-    # Show the plot in Streamlit
-    st.pyplot(positive_fig)
-
-    # Create side-by-side Negative word clouds
-    negative_fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
-
-    # Display Biden's word cloud
-    ax1.imshow(biden_negative_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Negative", fontsize=16)
-
-    # Display Trump's word cloud
-    ax2.imshow(trump_negative_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Negative", fontsize=16)
+    # Display the Plotly chart in Streamlit
+    fig = polarity_difference_figure(collapse_duplicates, window)
+    if fig is None:
+        st.info("Both candidates are needed for the polarity difference.")
+        return
+    st.plotly_chart(fig)
 
-    # Show the plot in Streamlit
-    st.pyplot(negative_fig)
 
-    # Generate word clouds for both candidates
-    biden_negative_hashtag_wordcloud = generate_wordcloud('biden_hashtag_negative_wordcloud.csv')
-    trump_negative_hashtag_wordcloud = generate_wordcloud('trump_hashtag_negative_wordcloud.csv')
+# Visualization 6: Word Clouds
 
-    # Create side-by-side Negative word clouds
-    negative_hashtag_fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
+# Function to show two cached word cloud images side by side
+def show_wordcloud_pair(left_image, right_image, left_title, right_title):
+    col1, col2 = st.columns(2)
+    for col, image, title in [(col1, left_image, left_title), (col2, right_image, right_title)]:
+        with col:
+            st.markdown(f"**{title}**")
+            if image is None:
+                st.caption("No words to display.")
+            else:
+                st.image(image, width='stretch')
 
-    # Display Biden's word cloud
-    ax1.imshow(biden_negative_hashtag_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Negative Hashtag", fontsize=16)
+# Function to show side-by-side word clouds from the CSVs written by the backend
+def show_wordcloud_csv_pair(left_csv, right_csv, left_title, right_title):
+    show_wordcloud_pair(cached_wordcloud_from_csv(left_csv), cached_wordcloud_from_csv(right_csv), left_title, right_title)
 
-    # Display Trump's word cloud
-    ax2.imshow(trump_negative_hashtag_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Negative Hashtag", fontsize=16)
 
-    # Show the plot in Streamlit
-    st.pyplot(negative_hashtag_fig)
+@timed()
+def wordclouds_section():
+    # Whole Period Word Cloud
+    st.subheader("Whole Period")
+    show_wordcloud_csv_pair('biden_positive_wordcloud.csv', 'trump_positive_wordcloud.csv', "Biden's Positive", "Trump's Positive")
+    show_wordcloud_csv_pair('biden_negative_wordcloud.csv', 'trump_negative_wordcloud.csv', "Biden's Negative", "Trump's Negative")
+    show_wordcloud_csv_pair('biden_hashtag_negative_wordcloud.csv', 'trump_hashtag_negative_wordcloud.csv', "Biden's Negative Hashtag", "Trump's Negative Hashtag")
 
 
     # 16/10/20 Word Cloud
     st.subheader("Town Hall - 16/10/20")
-    # Generate word clouds for both candidates
-    biden_16_10_positive_wordcloud = generate_wordcloud('biden_16_10_positive_wordcloud.csv')
-    biden_16_10_negative_wordcloud = generate_wordcloud('biden_16_10_negative_wordcloud.csv')
-    trump_16_10_positive_wordcloud = generate_wordcloud('trump_16_10_positive_wordcloud.csv')
-    trump_16_10_negative_wordcloud = generate_wordcloud('trump_16_10_negative_wordcloud.csv')
-    
-    # Create side-by-side Positive word clouds
-    positive_fig_16_10, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
-    
-    # Display Biden's word cloud
-    ax1.imshow(biden_16_10_positive_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Positive", fontsize=16)
-
-    # Display Trump's word cloud
-    ax2.imshow(trump_16_10_positive_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Positive", fontsize=16)
+    show_wordcloud_csv_pair('biden_16_10_positive_wordcloud.csv', 'trump_16_10_positive_wordcloud.csv', "Biden's Positive", "Trump's Positive")
+    show_wordcloud_csv_pair('biden_16_10_negative_wordcloud.csv', 'trump_16_10_negative_wordcloud.csv', "Biden's Negative", "Trump's Negative")
+    show_wordcloud_csv_pair('biden_16_10_hashtag_negative_wordcloud.csv', 'trump_16_10_hashtag_negative_wordcloud.csv', "Biden's Negative Hashtag", "Trump's Negative Hashtag")
 
-    # Show the plot in Streamlit
-    st.pyplot(positive_fig_16_10)
-
-    # Create side-by-side Negative word clouds
-    negative_fig_16_10, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
-
-    # Display Biden's word cloud
-    ax1.imshow(biden_16_10_negative_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Negative", fontsize=16)
-
-    # Display Trump's word cloud
-    ax2.imshow(trump_16_10_negative_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Negative", fontsize=16)
-
-    # Show the plot in Streamlit
-    st.pyplot(negative_fig_16_10)
-
-
-    # 16/10/20 Hashtag Word Cloud
-    # Generate word clouds for both candidates
-    biden_16_10_hashtag_negative_wordcloud = generate_wordcloud('biden_16_10_hashtag_negative_wordcloud.csv')
-    trump_16_10_hashtag_negative_wordcloud = generate_wordcloud('trump_16_10_hashtag_negative_wordcloud.csv')
-    
-    # Create side-by-side Negative word clouds
-    negative_hashtag_16_10_fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
-
-    # Display Biden's word cloud
-    ax1.imshow(biden_16_10_hashtag_negative_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Negative Hashtag", fontsize=16)
-
-    # Display Trump's word cloud
-    ax2.imshow(trump_16_10_hashtag_negative_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Negative Hashtag", fontsize=16)
-
-    # Show the plot in Streamlit
-    st.pyplot(negative_hashtag_16_10_fig)
-    
 
     # 23/10/20 Word Cloud
     st.subheader("Last Debate - 23/10/20")
-    
-    # Generate filtered word clouds for both candidates
-    biden_23_10_positive_wordcloud = generate_wordcloud('biden_23_10_positive_wordcloud.csv')
-    biden_23_10_negative_wordcloud = generate_wordcloud('biden_23_10_negative_wordcloud.csv')
-    trump_23_10_positive_wordcloud = generate_wordcloud('trump_23_10_positive_wordcloud.csv')
-    trump_23_10_negative_wordcloud = generate_wordcloud('trump_23_10_negative_wordcloud.csv')
-
-    # Create side-by-side Positive word clouds
-    positive_23_10_fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
-
-    # Display Biden's word cloud
-    ax1.imshow(biden_23_10_positive_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Positive", fontsize=16)
-
-    # Display Trump's word cloud
-    ax2.imshow(trump_23_10_positive_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Positive", fontsize=16)
-
-    # Show the plot in Streamlit
-    st.pyplot(positive_23_10_fig)
-
-    # Create side-by-side Negative word clouds
-    negative_23_10_fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
-
-    # Display Biden's word cloud
-    ax1.imshow(biden_23_10_negative_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Negative", fontsize=16)
-
-    # Display Trump's word cloud
-    ax2.imshow(trump_23_10_negative_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Negative", fontsize=16)
-
-    # Show the plot in Streamlit
-    st.pyplot(negative_23_10_fig)
-
-
-    # 23/10/20 Hashtag Word Cloud
-    # Generate word clouds for both candidates
-    biden_23_10_hashtag_negative_wordcloud = generate_wordcloud('biden_23_10_hashtag_negative_wordcloud.csv')
-    trump_23_10_hashtag_negative_wordcloud = generate_wordcloud('trump_23_10_hashtag_negative_wordcloud.csv')
-    
-    # Create side-by-side Negative word clouds
-    negative_hashtag_23_10_fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
-
-    # Display Biden's word cloud
-    ax1.imshow(biden_23_10_hashtag_negative_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Negative Hashtag", fontsize=16)
-
-    # Display Trump's word cloud
-    ax2.imshow(trump_23_10_hashtag_negative_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Negative Hashtag", fontsize=16)
-
-    # Show the plot in Streamlit
-    st.pyplot(negative_hashtag_23_10_fig)
+    show_wordcloud_csv_pair('biden_23_10_positive_wordcloud.csv', 'trump_23_10_positive_wordcloud.csv', "Biden's Positive", "Trump's Positive")
+    show_wordcloud_csv_pair('biden_23_10_negative_wordcloud.csv', 'trump_23_10_negative_wordcloud.csv', "Biden's Negative", "Trump's Negative")
+    show_wordcloud_csv_pair('biden_23_10_hashtag_negative_wordcloud.csv', 'trump_23_10_hashtag_negative_wordcloud.csv', "Biden's Negative Hashtag", "Trump's Negative Hashtag")
 
 
     # 03/11/20 Word Cloud
     st.subheader("Election Day - 03/11/20")
-    # Generate filtered word clouds for both candidates
-    biden_03_11_positive_wordcloud = generate_wordcloud('biden_03_11_positive_wordcloud.csv')
-    biden_03_11_negative_wordcloud = generate_wordcloud('biden_03_11_negative_wordcloud.csv')
-    trump_03_11_positive_wordcloud = generate_wordcloud('trump_03_11_positive_wordcloud.csv')
-    trump_03_11_negative_wordcloud = generate_wordcloud('trump_03_11_negative_wordcloud.csv')
-
-    # Create side-by-side Positive word clouds
-    positive_03_11_fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
-
-    # Display Biden's word cloud
-    ax1.imshow(biden_03_11_positive_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Positive", fontsize=16)
-
-    # Display Trump's word cloud
-    ax2.imshow(trump_03_11_positive_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Positive", fontsize=16)
-
-    # Show the plot in Streamlit
-    st.pyplot(positive_03_11_fig)
-
-    # Create side-by-side Negative word clouds
-    negative_03_11_fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
-
-    # Display Biden's word cloud
-    ax1.imshow(biden_03_11_negative_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Negative", fontsize=16)
-
-    # Display Trump's word cloud
-    ax2.imshow(trump_03_11_negative_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Negative", fontsize=16)
-
-    # Show the plot in Streamlit
-    st.pyplot(negative_03_11_fig)
-
-
-    # 03/11/20 Hashtag Word Cloud
-    # Generate word clouds for both candidates
-    biden_03_11_hashtag_negative_wordcloud = generate_wordcloud('biden_03_11_hashtag_negative_wordcloud.csv')
-    trump_03_11_hashtag_negative_wordcloud = generate_wordcloud('trump_03_11_hashtag_negative_wordcloud.csv')
-    
-    # Create side-by-side Negative word clouds
-    negative_hashtag_03_11_fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
-
-    # Display Biden's word cloud
-    ax1.imshow(biden_03_11_hashtag_negative_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Negative Hashtag", fontsize=16)
-
-    # Display Trump's word cloud
-    ax2.imshow(trump_03_11_hashtag_negative_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Negative Hashtag", fontsize=16)
-
-    # Show the plot in Streamlit
-    st.pyplot(negative_hashtag_03_11_fig)
+    show_wordcloud_csv_pair('biden_03_11_positive_wordcloud.csv', 'trump_03_11_positive_wordcloud.csv', "Biden's Positive", "Trump's Positive")
+    show_wordcloud_csv_pair('biden_03_11_negative_wordcloud.csv', 'trump_03_11_negative_wordcloud.csv', "Biden's Negative", "Trump's Negative")
+    show_wordcloud_csv_pair('biden_03_11_hashtag_negative_wordcloud.csv', 'trump_03_11_hashtag_negative_wordcloud.csv', "Biden's Negative Hashtag", "Trump's Negative Hashtag")
 
 
     # Word Cloud for the date of which each candidate had their own lowest polarity mean
-    st.subheader("Lowest Polarity Mean Dates")    
-    # Generate filtered word clouds for both candidates
-    biden_min_pol_date_negative_wordcloud_df = generate_wordcloud('biden_min_pol_date_negative_wordcloud.csv')
-    trump_min_pol_date_negative_wordcloud_df = generate_wordcloud('trump_min_pol_date_negative_wordcloud.csv')
+    # (the backend writes them for the dates of the daily series counting every tweet)
+    st.subheader("Lowest Polarity Mean Dates")
+    series = load_daily_series(False)
+    biden_date, trump_date = (extreme_polarity_date(series, candidate, 'min') for candidate in ['biden', 'trump'])
+    biden_title = f"Biden's {biden_date:%d/%m/%y}" if biden_date is not None else "Biden's"
+    trump_title = f"Trump's {trump_date:%d/%m/%y}" if trump_date is not None else "Trump's"
+    show_wordcloud_csv_pair('biden_min_pol_date_negative_wordcloud.csv', 'trump_min_pol_date_negative_wordcloud.csv', f"{biden_title} Negative", f"{trump_title} Negative")
+    show_wordcloud_csv_pair('biden_min_pol_date_negative_hashtag_wordcloud.csv', 'trump_min_pol_date_negative_hashtag_wordcloud.csv', f"{biden_title} Negative Hashtag", f"{trump_title} Negative Hashtag")
+
+
+# Word Cloud for any date, computed from the word and hashtag frequency engines
+@st.fragment
+@timed()
+def any_date_wordclouds_section():
+    st.subheader("Any Date")
+
+    # Engines counting each near-duplicate cluster once when collapsing (if the backend wrote them)
+    word_frequencies_file, hashtag_frequencies_file = WORD_FREQUENCIES_FILE, HASHTAG_FREQUENCIES_FILE
+    if collapse_duplicates and os.path.exists(COLLAPSED_WORD_FREQUENCIES_FILE) and os.path.exists(COLLAPSED_HASHTAG_FREQUENCIES_FILE):
+        word_frequencies_file, hashtag_frequencies_file = COLLAPSED_WORD_FREQUENCIES_FILE, COLLAPSED_HASHTAG_FREQUENCIES_FILE
+
+    word_frequencies = load_word_frequencies(word_frequencies_file)
+    hashtag_frequencies = load_word_frequencies(hashtag_frequencies_file)
+
+    if word_frequencies is None or hashtag_frequencies is None:
+        st.info("Run the sentiment backend to create the word frequency files.")
+        return
+
+    # Date range and sentiment filters
+    first_date = word_frequencies.groups['date'].min().date()
+    last_date = word_frequencies.groups['date'].max().date()
+    date_range = st.date_input("Select a date range:", value=(first_date, last_date), min_value=first_date, max_value=last_date)
+    start_date, end_date = (date_range[0], date_range[-1]) if isinstance(date_range, (list, tuple)) else (date_range, date_range)
+    sentiment = st.selectbox("Select a sentiment:", options=['Positive', 'Negative', 'Neutral'])
+
+    for frequencies, stopwords, title in [(word_frequencies, WORD_STOPWORDS, ''), (hashtag_frequencies, HASHTAG_STOPWORDS, ' Hashtag')]:
+        images = []
+        for candidate_name in ['biden', 'trump']:
+            word_freq = frequencies.query(candidate_name, sentiment.lower(), start=start_date, end=end_date, stopwords=stopwords)
+            images.append(cached_wordcloud(dict(zip(word_freq['Word'], word_freq['Frequency']))))
+
+        show_wordcloud_pair(images[0], images[1], f"Biden's {sentiment}{title}", f"Trump's {sentiment}{title}")
+
+
+# Visualization 10: Tweet Search, answered by the inverted index
+@counted_cache(st.cache_data)
+def search_results(query, candidates, sentiments, start_date, end_date, collapse_duplicates):
+    index = load_search_index()
+    rows = index.search(query, candidates=list(candidates), sentiments=list(sentiments), start=start_date, end=end_date,
+                        representatives_only=collapse_duplicates)
+    return index.candidate_counts(rows), index.daily_polarity(rows), index.sample(rows, n=10)
+
+
+@counted_cache(st.cache_data)
+def search_polarity_figure(query, candidates, sentiments, start_date, end_date, collapse_duplicates):
+    _, daily_polarity, _ = search_results(query, candidates, sentiments, start_date, end_date, collapse_duplicates)
+
+    # Create the Plotly line chart
+    fig = px.line(
+        daily_polarity,
+        x='date',
+        y='polarity',
+        color='candidate',
+        markers=True,
+        hover_data=['tweets'],
+        title=f'Average Polarity of the Tweets Matching "{query}"',
+        labels={'date': 'Date', 'polarity': 'Average Polarity', 'tweets': 'Tweets'},
+        color_discrete_map=candidate_colors  # Apply custom colors
+    )
 
-    # Create side-by-side Positive word clouds
-    min_pol_date_negative_fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
+    # Capitalize legend labels
+    fig.for_each_trace(lambda trace: trace.update(name=trace.name.capitalize()))
 
-    # Display Both candidates' min polarity date word cloud
-    ax1.imshow(biden_min_pol_date_negative_wordcloud_df, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's 15/10/20 Negative", fontsize=16)
+    return fig
+
+
+@st.fragment
+@timed()
+def search_section():
+    st.header("Tweet Search")
+
+    index = load_search_index()
+    if index is None:
+        st.info("Run the sentiment backend to create the search index.")
+        return
+
+    # Query and filters
+    query = st.text_input("Search words and #hashtags (all words must match; separate alternatives with OR):", key='search_query')
+    candidates = st.multiselect("Select candidates:", options=['biden', 'trump'], default=['biden', 'trump'], format_func=str.capitalize, key='search_candidates')
+    sentiments = st.multiselect("Select sentiments:", options=['positive', 'neutral', 'negative'], default=['positive', 'neutral', 'negative'],
+                                format_func=str.capitalize, key='search_sentiments')
+    start_date, end_date = None, None
+    if index.meta['first_date'] is not None:
+        first_date = pd.Timestamp(index.meta['first_date']).date()
+        last_date = pd.Timestamp(index.meta['last_date']).date()
+        date_range = st.date_input("Select the search date range:", value=(first_date, last_date), min_value=first_date, max_value=last_date, key='search_date_range')
+        start_date, end_date = (date_range[0], date_range[-1]) if isinstance(date_range, (list, tuple)) else (date_range, date_range)
+
+    if not query.strip():
+        return
+
+    # Matching tweets per candidate
+    arguments = (query, tuple(candidates), tuple(sentiments), start_date, end_date, collapse_duplicates)
+    counts, daily_polarity, sample = search_results(*arguments)
+    columns = st.columns(len(candidates) or 1)
+    for column, candidate in zip(columns, candidates):
+        with column:
+            st.metric(label=f"{candidate.capitalize()}'s matching tweets:", value=f"{int(counts.get(candidate, 0)):,}")
+
+    if not len(daily_polarity):
+        st.info("No tweet matches the search.")
+        return
+
+    # Polarity over time and a sample of the matching tweets
+    st.plotly_chart(search_polarity_figure(*arguments), width='stretch')
+    st.dataframe(sample, hide_index=True)
+
+
+# Visualization 11: Live Replay of the election week, polling the aggregates published by live_replay.py
+LIVE_REFRESH_SECONDS = 2
+
+# Load the running aggregates of the replay, reloaded only when the replay publishes new ones
+@counted_cache(st.cache_resource, max_entries=1)
+def load_live_aggregates(updated_at):
+    return (
+        read_metrics_cube(os.path.join(LIVE_DIR, CUBE_FILE)),
+        WordFrequencies.load(os.path.join(LIVE_DIR, WORD_FREQUENCIES_FILE)),
+        WordFrequencies.load(os.path.join(LIVE_DIR, HASHTAG_FREQUENCIES_FILE)),
+        read_emoji_counts(os.path.join(LIVE_DIR, EMOJI_COUNTS_FILE)),
+    )
 
-    # Display Trump's word cloud
-    ax2.imshow(trump_min_pol_date_negative_wordcloud_df, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's 21/10/20 Negative", fontsize=16)
 
-    # Show the plot in Streamlit
-    st.pyplot(min_pol_date_negative_fig)
+@counted_cache(st.cache_data, max_entries=1)
+def live_figures(updated_at):
+    cube, _, _, _ = load_live_aggregates(updated_at)
+
+    # Daily tweets and polarity means per candidate
+    daily_tweets = daily_tweet_counts(cube)
+    daily_tweets['polarity'] = np.nan
+    for candidate in daily_tweets['candidate'].unique():
+        means = daily_polarity_means(cube, candidate)
+        rows = daily_tweets['candidate'] == candidate
+        daily_tweets.loc[rows, 'polarity'] = daily_tweets.loc[rows, 'date'].map(means).to_numpy()
+
+    fig_daily = make_subplots(rows=2, cols=1, shared_xaxes=True, subplot_titles=("Tweets per Day", "Polarity Mean per Day"))
+    for candidate, candidate_tweets in daily_tweets.groupby('candidate'):
+        color = candidate_colors.get(candidate)
+        fig_daily.add_trace(go.Scatter(x=candidate_tweets['date'], y=candidate_tweets['count'], mode='lines+markers',
+                                       name=candidate.capitalize(), line=dict(color=color)), row=1, col=1)
+        fig_daily.add_trace(go.Scatter(x=candidate_tweets['date'], y=candidate_tweets['polarity'], mode='lines+markers',
+                                       name=candidate.capitalize(), line=dict(color=color), showlegend=False), row=2, col=1)
+    fig_daily.update_layout(height=600, legend_title="Candidate", template='plotly_white')
+
+    # Top U.S. states by tweets
+    state_counts = state_tweet_counts(cube)
+    top_states = state_counts.groupby('state')['Tweet Count'].sum().nlargest(10).index
+    fig_states = px.bar(
+        state_counts[state_counts['state'].isin(top_states)],
+        x='state',
+        y='Tweet Count',
+        color='candidate',
+        barmode='group',
+        title="Top 10 U.S. States by Tweets",
+        labels={'state': 'State', 'Tweet Count': 'Number of Tweets'},
+        color_discrete_map=candidate_colors,
+        category_orders={'state': list(top_states)},
+    )
 
+    return fig_daily, fig_states
 
-    # Min Polarity Date Hashtag Word Cloud
-    # Generate word clouds for both candidates
-    biden_min_pol_date_hashtag_negative_wordcloud = generate_wordcloud('biden_min_pol_date_negative_hashtag_wordcloud.csv')
-    trump_min_pol_date_hashtag_negative_wordcloud = generate_wordcloud('trump_min_pol_date_negative_hashtag_wordcloud.csv')
-    
-    # Create side-by-side Negative word clouds
-    negative_hashtag_min_pol_date_fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
 
-    # Display Biden's word cloud
-    ax1.imshow(biden_min_pol_date_hashtag_negative_wordcloud, interpolation='bilinear')
-    ax1.axis('off')  # Hide axes
-    ax1.set_title("Biden's Negative Hashtag", fontsize=16)
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+@timed()
+def live_replay_section():
+    st.header("Live Replay")
 
-    # Display Trump's word cloud
-    ax2.imshow(trump_min_pol_date_hashtag_negative_wordcloud, interpolation='bilinear')
-    ax2.axis('off')  # Hide axes
-    ax2.set_title("Trump's Negative Hashtag", fontsize=16)
+    status = read_status(LIVE_DIR)
+    if status is None or status['tweets_aggregated'] == 0:
+        st.info("Start a replay with `python live_replay.py` to stream the election week into the dashboard.")
+        return
 
-    # Show the plot in Streamlit
-    st.pyplot(negative_hashtag_min_pol_date_fig)
+    # Progress and end-to-end lag
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric(label="Tweets aggregated:", value=f"{status['tweets_aggregated']:,}")
+    with col2:
+        st.metric(label="Replay clock:", value=pd.Timestamp(status['replay_time']).strftime('%Y-%m-%d %H:%M'),
+                  delta="finished" if status['finished'] else f"x{status['speedup']:,.0f}", delta_color='off')
+    with col3:
+        st.metric(label="Lag p95 (s):", value=f"{status['lag_seconds']['p95'] or 0:.2f}")
+    with col4:
+        st.metric(label="Behind schedule (s):", value=f"{status['behind_schedule_seconds']:.2f}")
+
+    # Running aggregates
+    cube, word_frequencies, hashtag_frequencies, emoji_counts = load_live_aggregates(status['updated_at'])
+    fig_daily, fig_states = live_figures(status['updated_at'])
+    st.plotly_chart(fig_daily, width='stretch')
+    st.plotly_chart(fig_states, width='stretch')
+
+    candidates = [candidate for candidate in ['biden', 'trump'] if (cube['candidate'] == candidate).any()]
+    for column, candidate in zip(st.columns(len(candidates) or 1), candidates):
+        with column:
+            st.subheader(candidate.capitalize())
+            st.dataframe(word_frequencies.query(candidate).head(10), hide_index=True)
+            st.dataframe(hashtag_frequencies.query(candidate, stopwords=HASHTAG_STOPWORDS).head(10), hide_index=True)
+            st.dataframe(top_emojis(emoji_counts, candidate, n=5), hide_index=True)
+
+    # Backpressure: queue depths and the time each stage spent blocked on the queue of the next stage
+    st.subheader("Pipeline")
+    pipeline = pd.DataFrame({
+        'blocked_seconds': status['blocked_seconds'],
+        'blocked_puts': status['blocked_puts'],
+        'calls': status['stage_calls'],
+        'queue_depth': {name: queue['depth'] for name, queue in status['queues'].items()},
+        'queue_size': {name: queue['maxsize'] for name, queue in status['queues'].items()},
+    }).rename_axis('stage')
+    st.dataframe(pipeline)
+    st.caption(f"{status['events_read']:,} tweets read ({status['events_per_second']:,.0f}/s), "
+               f"{status['duplicates']:,} duplicates dropped, last update {status['updated_at']}")
+
+
+# Sections of each tab
+tabs = {
+    "Exploratory Data Analysis": [kpis_section, daily_tweets_section, engagement_section, engagement_distribution_section, candidate_section,
+                                  date_range_section],
+    "Sentiment Analysis": [sentiment_pies_section, polarity_means_section, polarity_difference_section],
+    "WordCloud Analysis": [wordclouds_section, any_date_wordclouds_section],
+    "Search": [search_section],
+    "Live Replay": [live_replay_section],
+}
+
+# Optional performance panel: record the sections of this rerun
+profiling = st.sidebar.toggle("Performance", value=instrumentation.is_enabled(), key='performance')
+if profiling:
+    instrumentation.enable()
+    instrumentation.clear()
+elif instrumentation.is_enabled():
+    instrumentation.disable()
+
+# Count each near-duplicate cluster (copy-paste campaigns, bot retweets) once in the charts
+collapse_duplicates = st.sidebar.toggle("Collapse near-duplicates", key='collapse_duplicates')
+
+# Create tabs (only the selected tab is computed)
+selected_tab = st.radio("Tab", options=list(tabs), horizontal=True, label_visibility='collapsed', key='tab')
+
+for section in tabs[selected_tab]:
+    section()
 
 # Footer
-st.markdown("This dashboard provides insights into the Twitter election data for the 2020 U.S. Presidential election.")
\ No newline at end of file
+st.markdown("This dashboard provides insights into the Twitter election data for the 2020 U.S. Presidential election.")
+
+# Performance panel: wall time, rows and memory of every section and cache hits and misses
+if profiling:
+    with st.sidebar:
+        st.subheader("Sections")
+        stage_summary = instrumentation.summary()
+        stage_summary['max_rss_growth_mb'] = stage_summary.pop('max_rss_growth_bytes') / 2**20
+        stage_summary['max_peak_rss_growth_mb'] = stage_summary.pop('max_peak_rss_growth_bytes') / 2**20
+        st.dataframe(stage_summary, hide_index=True)
+
+        st.subheader("Caches")
+        st.dataframe(pd.DataFrame.from_dict(instrumentation.cache_stats(), orient='index'))
+
+        st.download_button("Download JSON trace", json.dumps(instrumentation.to_json(), default=str),
+                           file_name='dashboard_trace.json', mime='application/json')
+        st.download_button("Download Chrome trace", json.dumps(instrumentation.to_chrome_trace(), default=str),
+                           file_name='dashboard_chrome_trace.json', mime='application/json')
@@ -0,0 +1,202 @@
+# Single-pass word and hashtag frequency engine
+#
+# Tokens are counted once per (date, candidate, sentiment) group into a sparse count matrix.
+# Any slice or date range is answered by summing the rows of the matching groups, so word
+# clouds can be computed for any date instead of a handful of precomputed CSVs.
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from wordcloud import STOPWORDS
+
+from instrumentation import timed
+from tokens import TokenTable
+
+GROUP_KEYS = ['date', 'candidate', 'sentiment']
+
+WORD_FREQUENCIES_FILE = 'word_frequencies.npz'
+HASHTAG_FREQUENCIES_FILE = 'hashtag_frequencies.npz'
+
+# Engines counting each near-duplicate cluster once
+COLLAPSED_WORD_FREQUENCIES_FILE = 'word_frequencies_collapsed.npz'
+COLLAPSED_HASHTAG_FREQUENCIES_FILE = 'hashtag_frequencies_collapsed.npz'
+
+# Maximum number of words kept in a word cloud
+MAX_WORDS = 200
+
+# Add non important words as stopwords
+WORD_STOPWORDS = STOPWORDS.union({
+        'amp', 'biden', 'joebiden', 'joe', 'trump', 'realdonaldtrump',
+        'donaldtrump', 'trumps', 'vote', 'people', 'president', 'kamalaharri', 'u', 'kamalaharris', 'say', 'us', 'one', 'gop',
+        'donald', 'know', 'thats', 'america', 'election2020', 'election', 'bidenharris', 'bidenharris2020', 'trump2020'
+        })
+
+HASHTAG_STOPWORDS = {word.lower() for word in STOPWORDS.union({
+        'amp', 'biden', 'joebiden', 'joe', 'trump', 'realdonaldtrump',
+        'donaldtrump', 'trumps', 'vote', 'people', 'president', 'kamalaharri', 'u', 'kamalaharris', 'say', 'us', 'one', 'gop',
+        'donald', 'know', 'thats', 'america', 'election2020', 'election', 'bidenharris', 'bidenharris2020', 'bidenharis2020',
+        'trump2020', 'biden2020', 'elections2020', 'obama'
+        })}
+
+# Word cloud CSVs written for the dashboard: file name prefix and date of each slice (None for the Whole Period)
+WORDCLOUD_SLICES = {
+    '': None,
+    '16_10_': '2020-10-16',
+    '23_10_': '2020-10-23',
+    '03_11_': '2020-11-03',
+}
+
+# Same word pattern as WordCloud's tokenizer
+WORD_PATTERN = re.compile(r"\w[\w']*")
+
+
+# Split a token into words like WordCloud does ('#trump' -> 'trump', "biden's" -> 'biden')
+def _cloud_words(token):
+    return [word[:-2] if word.endswith("'s") else word for word in WORD_PATTERN.findall(token.lower())]
+
+
+class WordFrequencies:
+    def __init__(self, groups, counts, vocab):
+        self.groups = groups
+        self.counts = counts
+        self.vocab = vocab
+
+    # Count the tokens of every row into one row per (date, candidate, sentiment) group
+    @classmethod
+    @timed()
+    def from_tokens(cls, df, tokens):
+        tokens = tokens.split_vocab(_cloud_words)
+
+        keys = pd.DataFrame({
+            'date': pd.to_datetime(df['created_at'], errors='coerce').dt.normalize().to_numpy(),
+            'candidate': df['candidate'].astype(str).to_numpy(),
+            'sentiment': df['sentiment'].astype(str).to_numpy(),
+        })
+        grouper = keys.groupby(GROUP_KEYS, sort=True)
+        group_of_row = grouper.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        groups = grouper.size().index.to_frame(index=False)
+
+        # Tokens of rows without a date are not counted
+        group_of_token = np.repeat(group_of_row, tokens.lengths())
+        counted = group_of_token >= 0
+        counts = sparse.coo_matrix(
+            (np.ones(counted.sum(), dtype=np.int64), (group_of_token[counted], tokens.ids[counted])),
+            shape=(len(groups), len(tokens.vocab)),
+        ).tocsr()
+
+        return cls(groups, counts, tokens.vocab)
+
+    # Word frequencies of the tweet_cleaned column
+    @classmethod
+    def from_words(cls, df, tokens=None):
+        return cls.from_tokens(df, tokens if tokens is not None else TokenTable.from_texts(df['tweet_cleaned']))
+
+    # Hashtag frequencies of the hashtag column (hashtags are joined with ', ')
+    @classmethod
+    def from_hashtags(cls, df, tokens=None):
+        return cls.from_tokens(df, tokens if tokens is not None else TokenTable.from_texts(df['hashtag'], sep=', '))
+
+    # Merge engines (e.g. of successive batches of tweets), adding up the counts of equal groups and words
+    @classmethod
+    def merge(cls, parts):
+        vocab = pd.Index(np.concatenate([part.vocab for part in parts])).unique()
+        groups = pd.concat([part.groups for part in parts], ignore_index=True)
+        grouper = groups.groupby(GROUP_KEYS, sort=True)
+        group_of_row = grouper.ngroup().to_numpy(dtype=np.int64)
+
+        # Move the counts of every part to the merged groups and vocabulary
+        rows, columns, data = [], [], []
+        first_row = 0
+        for part in parts:
+            counts = part.counts.tocoo()
+            rows.append(group_of_row[first_row + counts.row])
+            columns.append(vocab.get_indexer(part.vocab)[counts.col])
+            data.append(counts.data)
+            first_row += len(part.groups)
+
+        merged_groups = grouper.size().index.to_frame(index=False)
+        counts = sparse.coo_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(columns))),
+            shape=(len(merged_groups), len(vocab)),
+        ).tocsr()
+        return cls(merged_groups, counts, np.asarray(vocab, dtype=object))
+
+    # Boolean mask of the groups matching a slice
+    def group_mask(self, candidate=None, sentiment=None, start=None, end=None):
+        mask = np.ones(len(self.groups), dtype=bool)
+        if candidate is not None:
+            mask &= (self.groups['candidate'] == candidate).to_numpy()
+        if sentiment is not None:
+            mask &= (self.groups['sentiment'] == sentiment).to_numpy()
+        if start is not None:
+            mask &= (self.groups['date'] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (self.groups['date'] <= pd.Timestamp(end)).to_numpy()
+        return mask
+
+    # Word frequencies of a slice, as a DataFrame with 'Word' and 'Frequency' columns
+    def query(self, candidate=None, sentiment=None, start=None, end=None, stopwords=WORD_STOPWORDS, max_words=MAX_WORDS):
+        mask = self.group_mask(candidate, sentiment, start, end)
+        frequency = np.asarray(self.counts[mask].sum(axis=0)).ravel()
+
+        # Remove stopwords and numbers, as WordCloud does
+        excluded = pd.Index(self.vocab).isin(list(stopwords)) | np.array([word.isdigit() for word in self.vocab], dtype=bool)
+        frequency[excluded] = 0
+
+        top = np.argsort(-frequency, kind='stable')[:max_words]
+        top = top[frequency[top] > 0]
+        return pd.DataFrame({'Word': self.vocab[top], 'Frequency': frequency[top]})
+
+    # Save and load the engine as a compressed .npz file
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            data=self.counts.data, indices=self.counts.indices, indptr=self.counts.indptr, shape=self.counts.shape,
+            vocab=self.vocab.astype(str),
+            date=self.groups['date'].to_numpy(dtype='datetime64[ns]'),
+            candidate=self.groups['candidate'].to_numpy(dtype=str),
+            sentiment=self.groups['sentiment'].to_numpy(dtype=str),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            counts = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+            groups = pd.DataFrame({key: data[key] for key in GROUP_KEYS})
+            groups['candidate'] = groups['candidate'].astype(object)
+            groups['sentiment'] = groups['sentiment'].astype(object)
+            return cls(groups, counts, data['vocab'].astype(object))
+
+
+# Write the word cloud and hashtag word cloud CSVs of every candidate, slice and sentiment, returning their paths
+@timed()
+def write_wordcloud_csvs(word_frequencies, hashtag_frequencies, output_dir='.', candidates=('biden', 'trump')):
+    paths = []
+    for candidate in candidates:
+        for prefix, date in WORDCLOUD_SLICES.items():
+            for sentiment in ['positive', 'negative']:
+                path = os.path.join(output_dir, f'{candidate}_{prefix}{sentiment}_wordcloud.csv')
+                word_frequencies.query(candidate, sentiment, start=date, end=date).to_csv(path, index=False)
+                paths.append(path)
+
+                path = os.path.join(output_dir, f'{candidate}_{prefix}hashtag_{sentiment}_wordcloud.csv')
+                hashtag_frequencies.query(candidate, sentiment, start=date, end=date, stopwords=HASHTAG_STOPWORDS).to_csv(path, index=False)
+                paths.append(path)
+    return paths
+
+
+# Write the negative word cloud CSVs of the date of each candidate's lowest polarity mean, returning their paths
+@timed()
+def write_min_polarity_csvs(word_frequencies, hashtag_frequencies, min_polarity_dates, output_dir='.'):
+    paths = []
+    for candidate, date in min_polarity_dates.items():
+        path = os.path.join(output_dir, f'{candidate}_min_pol_date_negative_wordcloud.csv')
+        word_frequencies.query(candidate, 'negative', start=date, end=date).to_csv(path, index=False)
+        paths.append(path)
+
+        path = os.path.join(output_dir, f'{candidate}_min_pol_date_negative_hashtag_wordcloud.csv')
+        hashtag_frequencies.query(candidate, 'negative', start=date, end=date, stopwords=HASHTAG_STOPWORDS).to_csv(path, index=False)
+        paths.append(path)
+    return paths
@@ -0,0 +1,104 @@
+# Render cache for word-cloud images
+#
+# Word clouds are rendered once to PNG/WebP files keyed by a hash of the input frequencies and
+# the render parameters. Later requests serve the cached image; the least recently used images
+# are evicted when the cache grows past its limits.
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from instrumentation import timed
+
+CACHE_DIR = 'wordcloud_cache'
+
+# Render parameters used by the dashboard
+RENDER_PARAMS = {'width': 800, 'height': 400, 'background_color': 'white'}
+
+MAX_ENTRIES = 512
+MAX_BYTES = 256 * 1024 * 1024
+
+
+# Cache key of a set of frequencies and render parameters
+def _cache_key(content, params, image_format):
+    digest = hashlib.sha256(content)
+    digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    digest.update(image_format.encode('utf-8'))
+    return digest.hexdigest()
+
+
+# Evict the least recently used images beyond the cache limits
+def _evict(cache_dir, max_entries, max_bytes):
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and not entry.name.endswith('.tmp'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    entries.sort(reverse=True)  # Most recently used first
+    total_bytes = 0
+    for position, (_, size, path) in enumerate(entries):
+        total_bytes += size
+        if position >= max_entries or total_bytes > max_bytes:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+# Render frequencies to an image file
+def _render(frequencies, path, params, image_format):
+    from wordcloud import WordCloud
+
+    image = WordCloud(**params).generate_from_frequencies(frequencies).to_image()
+
+    # Write to a temporary file first so concurrent readers never see a partial image
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    image.save(tmp_path, format=image_format.upper())
+    os.replace(tmp_path, path)
+
+
+# Path of the cached image for content, calling load_frequencies to render it on a miss
+def _cached_image(content, load_frequencies, params, image_format, cache_dir, max_entries, max_bytes):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f'{_cache_key(content, params, image_format)}.{image_format}')
+
+    if os.path.exists(path):
+        os.utime(path)  # Mark as recently used
+        return path
+
+    # Nothing to draw
+    frequencies = load_frequencies()
+    if not frequencies:
+        return None
+
+    _render(frequencies, path, params, image_format)
+    _evict(cache_dir, max_entries, max_bytes)
+    return path
+
+
+# Path of the cached image of a frequency dictionary, rendering it on first request
+def cached_wordcloud(frequencies, params=RENDER_PARAMS, image_format='png', cache_dir=CACHE_DIR,
+                     max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+    content = json.dumps(sorted((str(word), float(frequency)) for word, frequency in frequencies.items())).encode('utf-8')
+    return _cached_image(content, lambda: frequencies, params, image_format, cache_dir, max_entries, max_bytes)
+
+
+# Path of the cached image of a frequency CSV ('Word' and 'Frequency' columns), keyed by the file contents
+def cached_wordcloud_from_csv(csv_file, params=RENDER_PARAMS, image_format='png', cache_dir=CACHE_DIR,
+                              max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+    with open(csv_file, 'rb') as f:
+        content = f.read()
+
+    def load_frequencies():
+        df = pd.read_csv(csv_file)
+        return dict(zip(df['Word'], df['Frequency']))
+
+    return _cached_image(content, load_frequencies, params, image_format, cache_dir, max_entries, max_bytes)
+
+
+# Render every CSV ahead of time so no user waits for a layout
+@timed()
+def prerender_wordclouds(csv_files, **kwargs):
+    return {csv_file: cached_wordcloud_from_csv(csv_file, **kwargs) for csv_file in csv_files}